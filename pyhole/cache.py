@@ -0,0 +1,186 @@
+#   Copyright 2011 Josh Kearney
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""Pyhole Response Cache"""
+
+import collections
+import email.utils
+import time
+
+from eventlet import event
+
+
+class CacheEntry(object):
+    """A cached response along with what is needed to revalidate it."""
+
+    __slots__ = ("response", "expires", "etag", "last_modified")
+
+    def __init__(self, response, expires):
+        self.response = response
+        self.expires = expires
+        self.etag = response.headers.get("ETag")
+        self.last_modified = response.headers.get("Last-Modified")
+
+
+class SingleFlight(object):
+    """Coalesces concurrent calls for the same key into a single call.
+
+    While a call for a key is in flight, further callers with that key wait
+    for it and get its result, or its exception, instead of repeating it.
+    """
+
+    def __init__(self):
+        self.calls = {}
+        self.coalesced = 0
+
+    def do(self, key, func, *args, **kwargs):
+        """Call func, or wait for the call already in flight for key."""
+        waiter = self.calls.get(key)
+        if waiter is not None:
+            self.coalesced += 1
+            return waiter.wait()
+
+        waiter = self.calls[key] = event.Event()
+        try:
+            result = func(*args, **kwargs)
+        except BaseException, exc:
+            # Killed or timed out callers too, or the waiters never wake
+            waiter.send_exception(exc)
+            raise
+        finally:
+            del self.calls[key]
+
+        waiter.send(result)
+        return result
+
+
+class ResponseCache(object):
+    """A size-bounded LRU cache of HTTP responses, keyed by URL.
+
+    Freshness comes from Cache-Control and Expires when the server sends
+    them, and from the fetching plugin's TTL otherwise.  Stale entries with
+    an ETag or Last-Modified header are revalidated with a conditional GET.
+    """
+
+    def __init__(self, client, max_entries=256, max_bytes=2 ** 24,
+            default_ttl=60, ttls=None):
+        self.client = client
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.default_ttl = default_ttl
+        self.ttls = ttls or {}
+        self.entries = collections.OrderedDict()
+        self.flight = SingleFlight()
+        self.size = 0
+        self.counters = dict.fromkeys(("hits", "misses", "revalidated",
+                "evictions"), 0)
+
+    def fetch(self, url, name=None):
+        """Fetch a URL through the cache on behalf of the named plugin.
+
+        Concurrent misses for the same URL share a single request.
+        """
+        entry = self.entries.get(url)
+        if entry is not None and entry.expires > time.time():
+            # Re-insert to mark the entry as most recently used
+            del self.entries[url]
+            self.entries[url] = entry
+            self.counters["hits"] += 1
+            return entry.response
+
+        return self.flight.do(url, self._fetch, url, name)
+
+    def stats(self):
+        """Return the counters along with the current cache usage."""
+        stats = dict(self.counters)
+        stats["coalesced"] = self.flight.coalesced
+        stats["entries"] = len(self.entries)
+        stats["bytes"] = self.size
+        return stats
+
+    def clear(self):
+        """Drop every cached response."""
+        self.entries.clear()
+        self.size = 0
+
+    def _fetch(self, url, name):
+        """[Internal] Fetch or revalidate a URL that missed the cache"""
+        now = time.time()
+        entry = self.entries.get(url)
+        if entry is None:
+            response = self.client.fetch(url)
+        else:
+            headers = {}
+            if entry.etag:
+                headers["If-None-Match"] = entry.etag
+            if entry.last_modified:
+                headers["If-Modified-Since"] = entry.last_modified
+
+            response = self.client.fetch(url, headers)
+            if response.status == 304:
+                self.counters["revalidated"] += 1
+                entry.expires = self._expires(response, name, now)
+                return entry.response
+
+        self.counters["misses"] += 1
+        self._store(url, response, name, now)
+        return response
+
+    def _store(self, url, response, name, now):
+        """[Internal]"""
+        self._discard(url)
+        if response.status != 200 or response.truncated:
+            return
+
+        cache_control = response.headers.get("Cache-Control", "").lower()
+        if "no-store" in cache_control:
+            return
+
+        self.entries[url] = CacheEntry(response,
+                self._expires(response, name, now))
+        self.size += len(response.body)
+
+        while self.entries and (len(self.entries) > self.max_entries or
+                self.size > self.max_bytes):
+            self._discard(next(iter(self.entries)))
+            self.counters["evictions"] += 1
+
+    def _discard(self, url):
+        """[Internal]"""
+        entry = self.entries.pop(url, None)
+        if entry is not None:
+            self.size -= len(entry.response.body)
+
+    def _expires(self, response, name, now):
+        """[Internal] Work out until when a response is fresh"""
+        cache_control = response.headers.get("Cache-Control", "").lower()
+        directives = [d.strip() for d in cache_control.split(",")]
+        if "no-cache" in directives:
+            return now
+
+        for directive in directives:
+            if directive.startswith("max-age="):
+                try:
+                    return now + int(directive[8:])
+                except ValueError:
+                    return now
+
+        expires = response.headers.get("Expires")
+        if expires:
+            expires = email.utils.parsedate_tz(expires)
+            if expires is None:
+                return now
+            return email.utils.mktime_tz(expires)
+
+        return now + self.ttls.get(name, self.default_ttl)
@@ -19,52 +19,186 @@ from __future__ import with_statement
 import ConfigParser
 import os
 import sys
+import time
 
 import utils
 
 
-class Config(object):
-    """A configuration object."""
+_MISSING = object()
+_config_files = {}
 
-    def __init__(self, config, section):
-        self.config = os.path.abspath(config)
-        self.config_parser = ConfigParser.ConfigParser()
-        self.section = section
+
+class ConfigFile(object):
+    """A parsed configuration file shared by every Config that reads it.
+
+    Typed values are cached per (section, option, type).  The file is
+    re-read when its mtime changes, checked at most once per
+    check_interval seconds, and subscribers are told which options changed.
+    """
+
+    def __init__(self, path, check_interval=1):
+        self.path = path
+        self.check_interval = check_interval
+        self.subscribers = []
+        self.values = {}
+        self.mtime = None
+        self.checked = time.time()
 
         try:
-            with open(self.config) as conf_file:
-                self.config_parser.readfp(conf_file)
+            self.config_parser = self._parse()
         except IOError:
-            print "Unable to load configuration file: %s" % self.config
+            print "Unable to load configuration file: %s" % self.path
             utils.generate_config()
             sys.exit(1)
 
+    def refresh(self, force=False):
+        """Re-read the file if it changed since it was last parsed.
+
+        Returns True if it was reloaded.
+        """
+        now = time.time()
+        if not force and now - self.checked < self.check_interval:
+            return False
+
+        self.checked = now
+        try:
+            if os.stat(self.path).st_mtime == self.mtime:
+                return False
+            config_parser = self._parse()
+        except (IOError, OSError, ConfigParser.Error), exc:
+            print "Unable to reload configuration file: %s (%s)" % (
+                    self.path, exc)
+            return False
+
+        changed = self._changes(self.config_parser, config_parser)
+        self.config_parser = config_parser
+        self.values.clear()
+
+        for section, callback in self.subscribers[:]:
+            if changed.get(section):
+                callback(changed[section])
+
+        return True
+
+    def subscribe(self, section, callback):
+        """Call callback with the set of changed options whenever a reload
+        changes the given section
+        """
+        self.subscribers.append((section, callback))
+
+    def unsubscribe(self, section, callback):
+        """Stop notifying a subscriber."""
+        self.subscribers.remove((section, callback))
+
+    def get(self, section, option, _type):
+        """Return a typed value, or _MISSING if the option is not set."""
+        key = (section, option, _type)
+        try:
+            value = self.values[key]
+        except KeyError:
+            value = self.values[key] = self._get(section, option, _type)
+
+        if _type == "list" and value is not _MISSING:
+            # Callers are free to modify the lists they get back
+            return list(value)
+
+        return value
+
+    def _get(self, section, option, _type):
+        """[Internal]"""
+        try:
+            if _type == "int":
+                return self.config_parser.getint(section, option)
+            elif _type == "float":
+                return self.config_parser.getfloat(section, option)
+            elif _type == "bool":
+                return self.config_parser.getboolean(section, option)
+            elif _type == "list":
+                return tuple(self.config_parser.get(section,
+                        option).split(", "))
+            else:
+                return self.config_parser.get(section, option)
+        except ConfigParser.NoOptionError:
+            return _MISSING
+
+    def _parse(self):
+        """[Internal]"""
+        config_parser = ConfigParser.ConfigParser()
+        mtime = os.stat(self.path).st_mtime
+        with open(self.path) as conf_file:
+            config_parser.readfp(conf_file)
+
+        self.mtime = mtime
+        return config_parser
+
+    def _changes(self, old, new):
+        """[Internal] Map each section to the options that differ"""
+        changed = {}
+        for section in set(old.sections()) | set(new.sections()):
+            old_items = dict(old.items(section, raw=True)
+                    if old.has_section(section) else ())
+            new_items = dict(new.items(section, raw=True)
+                    if new.has_section(section) else ())
+            changed[section] = set(option
+                    for option in set(old_items) | set(new_items)
+                    if old_items.get(option) != new_items.get(option))
+
+        return changed
+
+
+def get_config_file(path):
+    """Return the shared ConfigFile for a path, parsing it on first use."""
+    path = os.path.abspath(path)
+    try:
+        return _config_files[path]
+    except KeyError:
+        config_file = _config_files[path] = ConfigFile(path)
+        return config_file
+
+
+class Config(object):
+    """A configuration object."""
+
+    def __init__(self, config, section):
+        self.config_file = get_config_file(config)
+        self.config = self.config_file.path
+        self.section = section
+
     def __str__(self):
         """Make the config object readable for logging."""
         return self.section
 
     def sections(self):
         """Return a list of sections."""
-        return self.config_parser.sections()
+        self.config_file.refresh()
+        return self.config_file.config_parser.sections()
+
+    def refresh(self, force=False):
+        """Reload the configuration file if it has changed."""
+        return self.config_file.refresh(force)
+
+    def subscribe(self, callback):
+        """Call callback with the set of changed options whenever a reload
+        changes this section
+        """
+        self.config_file.subscribe(self.section, callback)
+
+    def unsubscribe(self, callback):
+        """Stop notifying a subscriber."""
+        self.config_file.unsubscribe(self.section, callback)
 
     def get(self, option, **kwargs):
         """Retrieve configuration values."""
-        _type = kwargs.get("type", "str")
+        self.config_file.refresh()
+        value = self.config_file.get(self.section, option,
+                kwargs.get("type", "str"))
+        if value is not _MISSING:
+            return value
 
-        try:
-            if _type == "int":
-                return self.config_parser.getint(self.section, option)
-            elif _type == "bool":
-                return self.config_parser.getboolean(self.section, option)
-            elif _type == "list":
-                return self.config_parser.get(self.section, option).split(", ")
-            else:
-                return self.config_parser.get(self.section, option)
-        except ConfigParser.NoOptionError:
-            if "default" in kwargs:
-                return kwargs["default"]
+        if "default" in kwargs:
+            return kwargs["default"]
 
-            print "Unable to locate '%s' in %s" % (option, self.config)
-            print "[%s]" % self.section
-            print "%s: value" % option
-            sys.exit(1)
+        print "Unable to locate '%s' in %s" % (option, self.config)
+        print "[%s]" % self.section
+        print "%s: value" % option
+        sys.exit(1)
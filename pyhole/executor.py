@@ -0,0 +1,104 @@
+#   Copyright 2011 Josh Kearney
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""Pyhole Greenthread Executor"""
+
+import collections
+
+import eventlet
+
+
+class Executor(object):
+    """A bounded pool of greenthreads for spawned plugin hooks.
+
+    At most pool_size greenthreads run at once, and each plugin may only
+    hold plugin_limit of them.  Work that cannot start right away waits in a
+    queue of queue_size entries; once that is full, new work is shed and
+    counted instead of piling up.
+    """
+
+    def __init__(self, pool_size=100, queue_size=200, plugin_limit=20):
+        self.pool_size = pool_size
+        self.queue_size = queue_size
+        self.plugin_limit = plugin_limit
+        self.queue = collections.deque()
+        self.active = 0
+        self.running = {}
+        self.counters = dict.fromkeys(("submitted", "queued", "dropped",
+                "completed", "bypassed"), 0)
+
+    def submit(self, name, func, *args, **kwargs):
+        """Run a function on behalf of the named plugin.
+
+        Returns False if the work was shed because the queue is full.
+        """
+        self.counters["submitted"] += 1
+        if self._can_start(name):
+            self._start(name, func, args, kwargs)
+        elif len(self.queue) < self.queue_size:
+            self.counters["queued"] += 1
+            self.queue.append((name, func, args, kwargs))
+        else:
+            self.counters["dropped"] += 1
+            return False
+
+        return True
+
+    def bypass(self, func, *args, **kwargs):
+        """Run a function right away, however saturated the pool is."""
+        self.counters["bypassed"] += 1
+        eventlet.spawn_n(func, *args, **kwargs)
+
+    def stats(self):
+        """Return the counters along with the current pool usage."""
+        stats = dict(self.counters)
+        stats["active"] = self.active
+        stats["waiting"] = len(self.queue)
+        return stats
+
+    def _can_start(self, name):
+        """[Internal]"""
+        return (self.active < self.pool_size and
+                self.running.get(name, 0) < self.plugin_limit)
+
+    def _start(self, name, func, args, kwargs):
+        """[Internal]"""
+        self.active += 1
+        self.running[name] = self.running.get(name, 0) + 1
+        eventlet.spawn_n(self._run, name, func, args, kwargs)
+
+    def _run(self, name, func, args, kwargs):
+        """[Internal]"""
+        try:
+            func(*args, **kwargs)
+        finally:
+            self.active -= 1
+            self.running[name] -= 1
+            self.counters["completed"] += 1
+            self._drain()
+
+    def _drain(self):
+        """[Internal] Start queued work in order, skipping over plugins
+        that are still at their limit
+        """
+        waiting = collections.deque()
+        while self.queue and self.active < self.pool_size:
+            name, func, args, kwargs = self.queue.popleft()
+            if self.running.get(name, 0) < self.plugin_limit:
+                self._start(name, func, args, kwargs)
+            else:
+                waiting.append((name, func, args, kwargs))
+
+        waiting.extend(self.queue)
+        self.queue = waiting
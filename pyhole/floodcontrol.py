@@ -0,0 +1,202 @@
+#   Copyright 2011 Josh Kearney
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""Pyhole Outbound Flood Control"""
+
+import collections
+import time
+
+import utils
+
+
+# Priority classes, most urgent first
+PROTOCOL, ADMIN, REPLY, AUTO = range(4)
+
+PRIORITY_NAMES = ("protocol", "admin", "reply", "auto")
+
+
+class TokenBucket(object):
+    """Allows rate events per second on average, in bursts of up to burst."""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.time()
+
+    def refill(self, now):
+        """Add the tokens earned since the last refill."""
+        self.tokens = min(self.burst,
+                self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def take(self, now):
+        """Take a token, returning False if there is none to take."""
+        self.refill(now)
+        if self.tokens < 1:
+            return False
+
+        self.tokens -= 1
+        return True
+
+    def force(self, now):
+        """Take a token even if it puts the bucket into debt."""
+        self.refill(now)
+        self.tokens = max(self.tokens - 1, -self.burst)
+
+    def wait_time(self):
+        """Return how long until the next token is available."""
+        return max(0, (1 - self.tokens) / self.rate)
+
+
+class SendScheduler(object):
+    """Paces the lines sent to an IRC server.
+
+    Lines are sent through a token bucket in priority order: protocol
+    traffic (PONG, JOIN, NICK, ...) goes out right away, then admin
+    command replies, then command replies, then automatic expansions from
+    keyword and message hooks.  Within a priority, targets take turns so
+    one busy channel cannot hold up the others.  When the server
+    complains about flooding, the rate is cut and then slowly restored.
+    """
+
+    def __init__(self, connection, rate=1.0, burst=5, min_rate=0.1,
+            recovery=60):
+        self.connection = connection
+        self.max_rate = rate
+        self.max_burst = burst
+        self.min_rate = min_rate
+        self.recovery = recovery
+        self.bucket = TokenBucket(rate, burst)
+        self.queues = [collections.OrderedDict() for _ in PRIORITY_NAMES]
+        self.queued = 0
+        self.timer = None
+        self.backed_off = None
+        self.counters = dict.fromkeys(("sent", "delayed", "dropped",
+                "backoffs"), 0)
+
+    def send(self, line, priority=None, target=None):
+        """Send a line now, or queue it until the bucket allows it.
+
+        Without an explicit priority, PRIVMSG and NOTICE lines take the
+        priority of the hook context they are sent from; anything else is
+        protocol traffic.
+        """
+        if priority is None or target is None:
+            default_priority, default_target = self._classify(line)
+            if priority is None:
+                priority = default_priority
+            if target is None:
+                target = default_target
+
+        now = time.time()
+        self._recover(now)
+        if priority == PROTOCOL:
+            self.bucket.force(now)
+            self.counters["sent"] += 1
+            self.connection.write_raw(line)
+            return
+
+        if not self.queued and self.bucket.take(now):
+            self.counters["sent"] += 1
+            self.connection.write_raw(line)
+            return
+
+        self.counters["delayed"] += 1
+        self.queues[priority].setdefault(target, collections.deque()).append(
+                line)
+        self.queued += 1
+        self._schedule()
+
+    def backoff(self):
+        """Slow down after the server complained about flooding."""
+        self.counters["backoffs"] += 1
+        self.backed_off = time.time()
+        self.bucket.rate = max(self.min_rate, self.bucket.rate / 2)
+        self.bucket.burst = max(1, self.bucket.burst // 2)
+        self.bucket.tokens = min(self.bucket.tokens, 0)
+
+    def clear(self):
+        """Drop every queued line, e.g. when the connection is lost."""
+        self.counters["dropped"] += self.queued
+        for queue in self.queues:
+            queue.clear()
+        self.queued = 0
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+
+    def stats(self):
+        """Return the counters along with the current queue depths."""
+        stats = dict(self.counters)
+        for name, queue in zip(PRIORITY_NAMES, self.queues):
+            stats["queued_" + name] = sum(len(lines)
+                    for lines in queue.itervalues())
+        return stats
+
+    def _classify(self, line):
+        """[Internal] Work out the priority and target of a raw line"""
+        parts = line.split(" ", 2)
+        if parts[0].upper() not in ("PRIVMSG", "NOTICE"):
+            return PROTOCOL, None
+
+        priority = getattr(utils.get_context(), "priority", REPLY)
+        return priority, parts[1] if len(parts) > 1 else None
+
+    def _schedule(self):
+        """[Internal] Arrange for _pump to run when a token is due"""
+        if self.timer is None and self.queued:
+            self.timer = self.connection.execute_delayed(
+                    self.bucket.wait_time(), self._pump)
+
+    def _pump(self):
+        """[Internal] Send queued lines while the bucket allows"""
+        self.timer = None
+        if not self.connection.is_connected():
+            self.clear()
+            return
+
+        now = time.time()
+        self._recover(now)
+        while self.queued and self.bucket.take(now):
+            self.counters["sent"] += 1
+            self.connection.write_raw(self._next_line())
+
+        self._schedule()
+
+    def _next_line(self):
+        """[Internal] Take the next line, round-robin across the targets of
+        the most urgent non-empty priority
+        """
+        for queue in self.queues:
+            if queue:
+                target, lines = queue.popitem(last=False)
+                line = lines.popleft()
+                if lines:
+                    queue[target] = lines
+                self.queued -= 1
+                return line
+
+    def _recover(self, now):
+        """[Internal] Restore the rate step by step after a backoff"""
+        if self.backed_off is None or now - self.backed_off < self.recovery:
+            return
+
+        self.bucket.rate = min(self.max_rate, self.bucket.rate * 2)
+        self.bucket.burst = min(self.max_burst, self.bucket.burst * 2)
+        if (self.bucket.rate, self.bucket.burst) == (self.max_rate,
+                self.max_burst):
+            self.backed_off = None
+        else:
+            self.backed_off = now
@@ -0,0 +1,181 @@
+#   Copyright 2011 Josh Kearney
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+
+"""Pyhole Hostmask Matching"""
+
+import collections
+import re
+import string
+
+
+# Server CASEMAPPING -> lowercasing table
+CASEMAPPINGS = {
+    "ascii": string.maketrans(string.ascii_uppercase,
+            string.ascii_lowercase),
+    "rfc1459": string.maketrans(string.ascii_uppercase + "[]\\^",
+            string.ascii_lowercase + "{}|~"),
+    "strict-rfc1459": string.maketrans(string.ascii_uppercase + "[]\\",
+            string.ascii_lowercase + "{}|"),
+}
+DEFAULT_CASEMAPPING = "rfc1459"
+
+# (mask, casemapping) -> compiled regex, least recently used first
+_compiled = collections.OrderedDict()
+_MAX_COMPILED = 512
+
+_MAX_RESULTS = 1024
+
+
+def lower(s, casemapping=DEFAULT_CASEMAPPING):
+    """Lowercase a string the way a server with the casemapping does.
+
+    Unknown casemappings are treated as rfc1459.
+    """
+    table = CASEMAPPINGS.get(casemapping)
+    if table is None:
+        table = CASEMAPPINGS[DEFAULT_CASEMAPPING]
+    return s.translate(table)
+
+
+def normalize(mask):
+    """Complete a partial mask, so nick and nick!user match any host."""
+    if "!" not in mask:
+        if "@" in mask:
+            return "*!" + mask
+        mask += "!*"
+    if "@" not in mask:
+        mask += "@*"
+    return mask
+
+
+def compile_mask(mask, casemapping=DEFAULT_CASEMAPPING):
+    """Return a regex matching lowercased strings against a wildcard mask.
+
+    Compiled masks are kept in an LRU cache shared by every caller.
+    """
+    key = (mask, casemapping)
+    try:
+        regex = _compiled.pop(key)
+    except KeyError:
+        regex = re.compile(_translate(mask, casemapping) + r"\Z", re.S)
+        if len(_compiled) >= _MAX_COMPILED:
+            _compiled.popitem(last=False)
+
+    _compiled[key] = regex
+    return regex
+
+
+def matches(mask, s, casemapping=DEFAULT_CASEMAPPING):
+    """Check whether a string, such as a nick mask, matches a mask."""
+    return compile_mask(mask, casemapping).match(
+            lower(s, casemapping)) is not None
+
+
+class MaskSet(object):
+    """A set of wildcard masks that a nick mask is matched against at once.
+
+    Masks without wildcards are looked up in a set and the rest are folded
+    into a single regular expression, so a check is one pass however many
+    masks there are.  Results are cached per nick mask until the set or
+    its casemapping changes.
+    """
+
+    def __init__(self, masks=(), casemapping=DEFAULT_CASEMAPPING):
+        self.masks = []
+        self.casemapping = casemapping
+        self._literals = None
+        self._wildcards = None
+        self._results = {}
+        for mask in masks:
+            self.add(mask)
+
+    def __len__(self):
+        return len(self.masks)
+
+    def add(self, mask):
+        """Add a mask, completing it if it is partial."""
+        mask = mask.strip()
+        if mask:
+            mask = normalize(mask)
+            if mask not in self.masks:
+                self.masks.append(mask)
+                self._invalidate()
+
+    def discard(self, mask):
+        """Remove a mask if it is in the set."""
+        mask = normalize(mask.strip())
+        if mask in self.masks:
+            self.masks.remove(mask)
+            self._invalidate()
+
+    def set_casemapping(self, casemapping):
+        """Compare masks the way a server with the casemapping does."""
+        if casemapping != self.casemapping:
+            self.casemapping = casemapping
+            self._invalidate()
+
+    def match(self, nickmask):
+        """Check whether a nick!user@host matches any mask in the set."""
+        try:
+            return self._results[nickmask]
+        except KeyError:
+            pass
+
+        if self._literals is None:
+            self._build()
+
+        lowered = lower(nickmask, self.casemapping)
+        result = lowered in self._literals
+        if not result and self._wildcards is not None:
+            result = self._wildcards.match(lowered) is not None
+
+        if len(self._results) >= _MAX_RESULTS:
+            self._results.clear()
+        self._results[nickmask] = result
+        return result
+
+    def _build(self):
+        """[Internal] Split the masks into literals and one regex"""
+        self._literals = set()
+        patterns = []
+        for mask in self.masks:
+            if "*" in mask or "?" in mask:
+                patterns.append(_translate(mask, self.casemapping))
+            else:
+                self._literals.add(lower(mask, self.casemapping))
+
+        if patterns:
+            self._wildcards = re.compile(r"(?:%s)\Z" % "|".join(patterns),
+                    re.S)
+
+    def _invalidate(self):
+        """[Internal]"""
+        self._literals = None
+        self._wildcards = None
+        self._results.clear()
+
+
+def _translate(mask, casemapping):
+    """[Internal] Turn a wildcard mask into a regular expression"""
+    pattern = []
+    for chunk in re.split(r"([*?])", lower(mask, casemapping)):
+        if chunk == "*":
+            pattern.append(".*")
+        elif chunk == "?":
+            pattern.append(".")
+        elif chunk:
+            pattern.append(re.escape(chunk))
+
+    return "".join(pattern)
@@ -0,0 +1,199 @@
+#   Copyright 2011 Josh Kearney
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""Pyhole HTTP Client"""
+
+import base64
+import httplib
+import socket
+import time
+import urllib
+import urlparse
+import zlib
+
+
+class HTTPError(IOError):
+    """Represents a failed HTTP request."""
+    pass
+
+
+class Response(object):
+    """A fetched HTTP response.
+
+    The body is read in full (up to the client's max_size) when the
+    response is fetched, so read() can be called any number of times.
+    """
+
+    def __init__(self, url, status, reason, headers, body, truncated=False):
+        self.url = url
+        self.status = status
+        self.reason = reason
+        self.headers = headers
+        self.body = body
+        self.truncated = truncated
+
+    def read(self):
+        """Return the response body."""
+        return self.body
+
+
+class HTTPClient(object):
+    """An HTTP client with per-host pools of keep-alive connections."""
+
+    def __init__(self, user_agent, connect_timeout=5, read_timeout=15,
+            max_size=2 ** 20, max_idle=4, idle_timeout=60, max_redirects=5):
+        self.user_agent = user_agent
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.max_size = max_size
+        self.max_idle = max_idle
+        self.idle_timeout = idle_timeout
+        self.max_redirects = max_redirects
+        self.pools = {}
+
+    def fetch(self, url, headers=None):
+        """Fetch a URL with GET, following redirects.
+
+        Raises HTTPError (an IOError) if the request cannot be completed.
+        """
+        for _redirect in range(self.max_redirects + 1):
+            response = self._request(url, headers or {})
+            location = response.headers.get("Location")
+            if response.status not in (301, 302, 303, 307) or not location:
+                return response
+
+            url = urlparse.urljoin(url, location)
+
+        raise HTTPError("Too many redirects: %s" % url)
+
+    def close(self):
+        """Close all idle connections."""
+        for pool in self.pools.values():
+            for conn, _idle_since in pool:
+                conn.close()
+        self.pools.clear()
+
+    def _request(self, url, headers):
+        """[Internal]"""
+        parts = urlparse.urlsplit(url)
+        scheme = parts.scheme.lower()
+        if scheme not in ("http", "https") or not parts.hostname:
+            raise HTTPError("Unsupported URL: %s" % url)
+
+        key = (scheme, parts.hostname, parts.port)
+        path = parts.path or "/"
+        if parts.query:
+            path += "?" + parts.query
+
+        request_headers = {
+            "User-Agent": self.user_agent,
+            "Accept-Encoding": "gzip, deflate",
+        }
+        if parts.username:
+            credentials = "%s:%s" % (urllib.unquote(parts.username),
+                    urllib.unquote(parts.password or ""))
+            request_headers["Authorization"] = ("Basic %s" %
+                    base64.b64encode(credentials))
+        request_headers.update(headers)
+
+        conn, reused = self._checkout(key)
+        try:
+            try:
+                conn.request("GET", path, headers=request_headers)
+                response = conn.getresponse()
+            except (socket.error, httplib.HTTPException):
+                conn.close()
+                if not reused:
+                    raise
+
+                # The server dropped an idle keep-alive connection
+                conn, reused = self._connect(key), False
+                conn.request("GET", path, headers=request_headers)
+                response = conn.getresponse()
+
+            body = response.read(self.max_size + 1)
+        except (socket.error, httplib.HTTPException), exc:
+            conn.close()
+            raise HTTPError("Unable to fetch %s: %s" % (url, exc))
+
+        truncated = len(body) > self.max_size
+        if truncated or response.will_close or not response.isclosed():
+            conn.close()
+        else:
+            self._checkin(key, conn)
+
+        body, truncated = self._decode(response.msg, body[:self.max_size],
+                truncated)
+        return Response(url, response.status, response.reason, response.msg,
+                body, truncated)
+
+    def _decode(self, headers, body, truncated):
+        """[Internal] Undo gzip or deflate content encoding"""
+        encoding = headers.get("Content-Encoding", "").lower()
+        if encoding == "gzip":
+            decoder = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        elif encoding == "deflate":
+            # Plenty of servers send raw deflate data without the zlib
+            # header, so sniff for it
+            try:
+                zlib.decompressobj().decompress(body[:2])
+                decoder = zlib.decompressobj()
+            except zlib.error:
+                decoder = zlib.decompressobj(-zlib.MAX_WBITS)
+        else:
+            return body, truncated
+
+        try:
+            decoded = decoder.decompress(body, self.max_size)
+        except zlib.error, exc:
+            raise HTTPError("Unable to decode response: %s" % exc)
+
+        return decoded, truncated or bool(decoder.unconsumed_tail)
+
+    def _connect(self, key):
+        """[Internal]"""
+        scheme, host, port = key
+        if scheme == "https":
+            conn = httplib.HTTPSConnection(host, port,
+                    timeout=self.connect_timeout)
+        else:
+            conn = httplib.HTTPConnection(host, port,
+                    timeout=self.connect_timeout)
+
+        conn.connect()
+        conn.sock.settimeout(self.read_timeout)
+        return conn
+
+    def _checkout(self, key):
+        """[Internal] Return an idle connection to reuse, or a new one"""
+        pool = self.pools.get(key, [])
+        now = time.time()
+        while pool:
+            conn, idle_since = pool.pop()
+            if now - idle_since < self.idle_timeout:
+                return conn, True
+            conn.close()
+
+        try:
+            return self._connect(key), False
+        except (socket.error, httplib.HTTPException), exc:
+            raise HTTPError("Unable to connect to %s: %s" % (key[1], exc))
+
+    def _checkin(self, key, conn):
+        """[Internal]"""
+        pool = self.pools.setdefault(key, [])
+        if len(pool) < self.max_idle:
+            pool.append((conn, time.time()))
+        else:
+            conn.close()
@@ -14,16 +14,18 @@
 
 """Event-based IRC Class"""
 
-import multiprocessing
+import collections
+import ConfigParser
+import gc
 import random
 import re
-import sys
-import time
-import urllib
 
+import floodcontrol
+import hostmask
 import irclib
 import log
 import plugin
+import supervisor
 import utils
 import version
 
@@ -31,57 +33,255 @@ import version
 LOG = log.get_logger()
 CONFIG = utils.get_config()
 
+_command_split_regexp = re.compile("\s")
+
+# Connection states
+DISCONNECTED = "disconnected"
+CONNECTING = "connecting"
+REGISTERED = "registered"
+
+
+class Context(collections.namedtuple("Context",
+        "irc network source target addressed event priority")):
+    """The immutable context a plugin hook is dispatched with.
+
+    Every message gets its own context, so replies from hooks that are still
+    running in a greenthread go back to where they were triggered from, and
+    are paced with the flood control priority of the hook that sent them.
+    """
+
+    __slots__ = ()
+
+    def __new__(cls, irc, source, target, addressed=False, event=None,
+            priority=floodcontrol.REPLY):
+        return super(Context, cls).__new__(cls, irc, irc.network, source,
+                target, addressed, event, priority)
+
+    def notice(self, msg):
+        """Send a notice."""
+        irc = self.irc
+        msg = irc._mangle_msg(msg)
+        for line in msg:
+            irc.connection.notice(self.target, line)
+            if irclib.is_channel(self.target):
+                irc.log.info("-%s- <%s> %s", self.target, irc.nick, line)
+            else:
+                irc.log.info("<%s> %s", irc.nick, line)
+
+    def reply(self, msg):
+        """Send a privmsg."""
+        irc = self.irc
+        msg = irc._mangle_msg(msg)
+        for line in msg:
+            if self.addressed:
+                source = self.source.split("!")[0]
+                irc.connection.privmsg(self.target, "%s: %s" % (source, line))
+                irc.log.info("-%s- <%s> %s: %s", self.target, irc.nick,
+                        source, line)
+            else:
+                irc.connection.privmsg(self.target, line)
+                if irclib.is_channel(self.target):
+                    irc.log.info("-%s- <%s> %s", self.target, irc.nick,
+                            line)
+                else:
+                    irc.log.info("<%s> %s", irc.nick, line)
+
 
 class IRC(irclib.SimpleIRCClient):
-    """An IRClib connection."""
+    """An IRClib connection.
 
-    def __init__(self, network):
-        irclib.SimpleIRCClient.__init__(self)
-        network_config = utils.get_config(network)
+    If networks is given, the connection runs on its shared irclib.IRC
+    object and uses the plugins loaded for all of its networks.
 
-        self.log = log.get_logger(str(network))
-        self.version = version.version_string()
-        self.source = None
-        self.target = None
-        self.addressed = False
+    The connection moves between the DISCONNECTED, CONNECTING and
+    REGISTERED states.  Everything that has to wait, from reconnects
+    (with exponential backoff) to rejoins and attempts to regain the
+    configured nick, is scheduled on the irclib timer queue, so no event
+    handler ever sleeps.
 
-        self.admins = CONFIG.get("admins", type="list")
-        self.command_prefix = CONFIG.get("command_prefix")
-        self.reconnect_delay = CONFIG.get("reconnect_delay", type="int")
-        self.rejoin_delay = CONFIG.get("rejoin_delay", type="int")
+    A network may list several servers.  The ones that connected fastest
+    before are tried first, and a server that cannot be reached fails
+    over to the next one right away.
+    """
 
-        self.server = network_config.get("server")
+    def __init__(self, network, networks=None):
+        # Read the network's settings first, so a bad one fails before
+        # anything is registered on a shared loop
+        network_config = utils.get_config(network)
         self.password = network_config.get("password", default=None)
         self.port = network_config.get("port", type="int", default=6667)
+        self.servers = [parse_server(server, self.port)
+                for server in network_config.get("server", type="list")]
+        self.server, self.port = self.servers[0]
         self.ssl = network_config.get("ssl", type="bool", default=False)
         self.ipv6 = network_config.get("ipv6", type="bool", default=False)
         self.bind_to = network_config.get("bind_to", default=None)
-        self.nick = network_config.get("nick")
+        self.nick = self.wanted_nick = network_config.get("nick")
         self.username = network_config.get("username", default=None)
         self.identify_password = network_config.get("identify_password",
                 default=None)
         self.channels = network_config.get("channels", type="list")
+        flood_rate = network_config.get("flood_rate", type="float",
+                default=1.0)
+        flood_burst = network_config.get("flood_burst", type="int",
+                default=5)
+        max_line_length = network_config.get("max_line_length", type="int",
+                default=irclib.ServerConnection.max_line_length)
+        connect_timeout = network_config.get("connect_timeout", type="int",
+                default=irclib.ServerConnection.connect_timeout)
+
+        if networks is not None:
+            irclib.SimpleIRCClient.__init__(self, networks.ircobj)
+        else:
+            irclib.SimpleIRCClient.__init__(self)
 
-        self.load_plugins()
+        self.network = network
+        self.networks = networks
+        self.log = log.get_logger(str(network))
+        self.version = version.version_string()
+        self._last_context = Context(self, None, None)
+        self.casemapping = hostmask.DEFAULT_CASEMAPPING
+        self.state = DISCONNECTED
+        self.reconnect_failures = 0
+        self.latencies = {}
+        self._server_queue = []
+        self._reconnect_timer = None
+        self._regain_timer = None
+        self._rejoin_timers = {}
+
+        self.flood_control = floodcontrol.SendScheduler(self.connection,
+                rate=flood_rate, burst=flood_burst)
+        self.connection.send_scheduler = self.flood_control
+        self.connection.max_line_length = max_line_length
+        self.connection.connect_timeout = connect_timeout
+
+        try:
+            self.load_config()
+            if networks is None:
+                self.load_plugins()
+
+            self._connect()
+        except Exception:
+            self.close()
+            raise
+
+        CONFIG.subscribe(self.load_config)
+
+    def load_config(self, changed=None):
+        """Load the settings shared by all networks.
+
+        A reload that leaves them missing or malformed is logged and the
+        current settings are kept; only the first load is fatal.
+        """
+        if changed:
+            self.log.info("Reloading configuration: %s",
+                    ", ".join(sorted(changed)))
+            get = _get_reloaded
+        else:
+            get = CONFIG.get
 
-        self.log.info("Connecting to %s:%d as %s" % (self.server, self.port,
-                self.nick))
-        self.connect(self.server, self.port, self.nick, self.password,
-                ssl=self.ssl, ipv6=self.ipv6, localaddress=self.bind_to,
-                username=self.username)
+        try:
+            admins = hostmask.MaskSet(casemapping=self.casemapping)
+            for mask in get("admins", type="list"):
+                if "!" in mask:
+                    admins.add(mask)
+                else:
+                    # Completing a bare nick would make whoever takes it
+                    # an admin
+                    self.log.warning("Ignoring admin without an ident: %s",
+                            mask)
+            ignores = hostmask.MaskSet(get("ignores", type="list",
+                    default=[]), self.casemapping)
+            autoops = hostmask.MaskSet(get("autoops", type="list",
+                    default=[]), self.casemapping)
+            command_prefix = get("command_prefix")
+            reconnect_delay = get("reconnect_delay", type="int")
+            max_reconnect_delay = get("max_reconnect_delay", type="int",
+                    default=600)
+            rejoin_delay = get("rejoin_delay", type="int")
+            nick_regain_delay = get("nick_regain_delay", type="int",
+                    default=60)
+        except (ValueError, ConfigParser.Error), exc:
+            if not changed:
+                raise
+            self.log.error("Keeping the current configuration: %s", exc)
+            return
+
+        self.admins = admins
+        self.ignores = ignores
+        self.autoops = autoops
+        self.command_prefix = command_prefix
+        self.reconnect_delay = reconnect_delay
+        self.max_reconnect_delay = max_reconnect_delay
+        self.rejoin_delay = rejoin_delay
+        self.nick_regain_delay = nick_regain_delay
+
+    def close(self):
+        """Disconnect for good, and stop handling events and config
+        reloads.
+        """
+        timers = [self._reconnect_timer, self._regain_timer]
+        timers.extend(self._rejoin_timers.values())
+        for timer in timers:
+            if timer is not None:
+                timer.cancel()
+        self._reconnect_timer = self._regain_timer = None
+        self._rejoin_timers.clear()
+
+        try:
+            CONFIG.unsubscribe(self.load_config)
+        except ValueError:
+            # Closed before __init__ got as far as subscribing
+            pass
+        irclib.SimpleIRCClient.close(self)
+
+    @property
+    def source(self):
+        """The source of the message the running hook was triggered by."""
+        return self.current_context().source
+
+    @property
+    def target(self):
+        """Where replies of the running hook are sent to."""
+        return self.current_context().target
+
+    @property
+    def addressed(self):
+        """Whether the running hook was triggered by addressing the bot."""
+        return self.current_context().addressed
+
+    def is_admin(self):
+        """Whether the running hook was triggered by an admin."""
+        event = self.current_context().event
+        return event is not None and self.admins.match(event.nickmask)
+
+    def current_context(self):
+        """Return the context of the running hook.
+
+        Code that does not run inside a dispatched hook, such as polls,
+        falls back to the context of the last message seen on the network.
+        """
+        context = utils.get_context()
+        if context is None or context.irc is not self:
+            return self._last_context
+
+        return context
 
     def run_hook_command(self, mod_name, func, arg, **kwargs):
         """Make a call to a plugin hook."""
+        previous_context = utils.set_context(kwargs.get("context"))
         try:
             if arg:
-                self.log.debug("Calling: %s.%s(\"%s\")" % (mod_name,
-                        func.__name__, arg))
+                self.log.debug("Calling: %s.%s(\"%s\")", mod_name,
+                        func.__name__, arg)
             else:
-                self.log.debug("Calling: %s.%s(None)" % (mod_name,
-                        func.__name__))
+                self.log.debug("Calling: %s.%s(None)", mod_name,
+                        func.__name__)
             func(arg, **kwargs)
         except Exception, exc:
             self.log.exception(exc)
+        finally:
+            utils.set_context(previous_context)
 
     def run_hook_polls(self):
         """Run polls in the background."""
@@ -91,72 +291,69 @@ class IRC(irclib.SimpleIRCClient):
     def load_plugins(self, reload_plugins=False):
         """Load plugins and their commands respectively."""
         if reload_plugins:
-            plugin.reload_plugins(irc=self)
+            plugin.reload_plugins(irc=self.networks or self)
         else:
-            plugin.load_plugins(irc=self)
+            plugin.load_plugins(irc=self.networks or self)
 
-        self.log.info("Loaded Plugins: %s" % active_plugins())
+        self.log.info("Loaded Plugins: %s", active_plugins())
         self.run_hook_polls()
 
-    def run_msg_regexp_hooks(self, message, private):
+    def run_msg_regexp_hooks(self, message, private, context):
         """Run regexp hooks."""
-        for mod_name, func, msg_regex in plugin.hook_get_msg_regexs():
-            match = re.search(msg_regex, message, re.I)
-            if match:
-                self.run_hook_command(mod_name, func, match, private=private,
-                        full_message=message)
+        context = context._replace(priority=floodcontrol.AUTO)
+        for hook, match in plugin.hook_match_msg_regexs(message):
+            mod_name, func, _msg_regex = hook
+            self.run_hook_command(mod_name, func, match, private=private,
+                    full_message=message, context=context)
 
-    def run_keyword_hooks(self, message, private):
+    def run_keyword_hooks(self, message, private, context):
         """Run keyword hooks."""
-        words = message.split(" ")
-        for mod_name, func, kwarg in plugin.hook_get_keywords():
-            for word in words:
-                match = re.search("^%s(.+)" % kwarg, word, re.I)
-                if match:
-                    self.run_hook_command(mod_name, func, match.group(1),
-                            private=private, full_message=message)
-
-    def run_command_hooks(self, message, private):
+        context = context._replace(priority=floodcontrol.AUTO)
+        for hook, params in plugin.hook_match_keywords(message):
+            mod_name, func, _kwarg = hook
+            self.run_hook_command(mod_name, func, params, private=private,
+                    full_message=message, context=context)
+
+    def run_command_hooks(self, message, private, context):
         """Run command hooks."""
-        for mod_name, func, cmd in plugin.hook_get_commands():
-            self.addressed = False
-
-            if private:
-                match = re.search("^%s$|^%s\s(.*)$" % (cmd, cmd), message,
-                        re.I)
-                if match:
-                    self.run_hook_command(mod_name, func, match.group(1),
-                            private=private, addressed=self.addressed,
-                            full_message=message)
-
-            if message.startswith(self.command_prefix):
-                # Strip off command prefix
-                msg_rest = message[len(self.command_prefix):]
-            else:
-                # Check for command starting with nick being addressed
-                msg_start_upper = message[:len(self.nick) + 1].upper()
-                if msg_start_upper == self.nick.upper() + ":":
-                    # Get rest of string after "nick:" and white spaces
-                    msg_rest = re.sub("^\s+", "",
-                            message[len(self.nick) + 1:])
-                else:
-                    continue
+        if message.startswith(self.command_prefix):
+            # Strip off command prefix
+            msg_rest = message[len(self.command_prefix):]
+        elif message[:len(self.nick) + 1].upper() == self.nick.upper() + ":":
+            # Get rest of string after "nick:" and white spaces
+            msg_rest = message[len(self.nick) + 1:].lstrip()
+            context = context._replace(addressed=True)
+        elif private:
+            msg_rest = message
+        else:
+            return
 
-                self.addressed = True
+        msg_rest = _command_split_regexp.split(msg_rest, 1)
+        cmd = msg_rest[0]
+        params = msg_rest[1] if len(msg_rest) > 1 else None
 
-            match = re.search("^%s$|^%s\s(.*)$" % (cmd, cmd), msg_rest, re.I)
-            if match:
-                self.run_hook_command(mod_name, func, match.group(1),
-                        private=private, addressed=self.addressed,
-                        full_message=message)
+        for mod_name, func, _cmd in plugin.hook_find_command(cmd):
+            hook_context = context
+            if getattr(func, "_admin", False):
+                hook_context = context._replace(priority=floodcontrol.ADMIN)
+            self.run_hook_command(mod_name, func, params, private=private,
+                    addressed=context.addressed, full_message=message,
+                    context=hook_context)
 
-    def poll_messages(self, message, private=False):
+    def poll_messages(self, message, private=False, context=None):
         """Watch for known commands."""
-        self.addressed = False
+        if context is None:
+            context = self.current_context()
+        self._last_context = context
+        if self.networks is not None:
+            self.networks.last = self
+
+        # Cheap unless the file is due for an mtime check
+        CONFIG.refresh()
 
-        self.run_command_hooks(message, private)
-        self.run_keyword_hooks(message, private)
-        self.run_msg_regexp_hooks(message, private)
+        self.run_command_hooks(message, private, context)
+        self.run_keyword_hooks(message, private, context)
+        self.run_msg_regexp_hooks(message, private, context)
 
     def _mangle_msg(self, msg):
         """Prepare the message for sending."""
@@ -177,30 +374,11 @@ class IRC(irclib.SimpleIRCClient):
 
     def notice(self, msg):
         """Send a notice."""
-        msg = self._mangle_msg(msg)
-        for line in msg:
-            self.connection.notice(self.target, line)
-            if irclib.is_channel(self.target):
-                self.log.info("-%s- <%s> %s" % (self.target, self.nick, line))
-            else:
-                self.log.info("<%s> %s" % (self.nick, line))
+        self.current_context().notice(msg)
 
     def reply(self, msg):
         """Send a privmsg."""
-        msg = self._mangle_msg(msg)
-        for line in msg:
-            if self.addressed:
-                source = self.source.split("!")[0]
-                self.connection.privmsg(self.target, "%s: %s" % (source, line))
-                self.log.info("-%s- <%s> %s: %s" % (self.target, self.nick,
-                        source, line))
-            else:
-                self.connection.privmsg(self.target, line)
-                if irclib.is_channel(self.target):
-                    self.log.info("-%s- <%s> %s" % (self.target, self.nick,
-                            line))
-                else:
-                    self.log.info("<%s> %s" % (self.nick, line))
+        self.current_context().reply(msg)
 
     def privmsg(self, target, msg):
         """Send a privmsg."""
@@ -218,7 +396,7 @@ class IRC(irclib.SimpleIRCClient):
 
     def set_nick(self, params):
         """Set IRC nick."""
-        self.nick = params
+        self.wanted_nick = params
         self.connection.nick(params)
 
     def join_channel(self, params):
@@ -240,30 +418,49 @@ class IRC(irclib.SimpleIRCClient):
 
     def fetch_url(self, url, name):
         """Fetch a URL."""
-        class PyholeURLopener(urllib.FancyURLopener):
-            """Set a custom user agent."""
-            version = self.version
-
-        urllib._urlopener = PyholeURLopener()
-
         try:
-            return urllib.urlopen(url)
-        except IOError:
+            return utils.get_http_cache().fetch(url, name)
+        except IOError, exc:
+            self.log.debug(exc)
             self.reply("Unable to fetch %s data" % name)
             return None
 
-    def on_nicknameinuse(self, connection, _event):
+    def on_nicknameinuse(self, connection, event):
         """Ensure the use of unique IRC nick."""
-        random_int = random.randint(1, 100)
-        self.log.info("IRC nick '%s' is currently in use" % self.nick)
-        self.nick = "%s%d" % (self.nick, random_int)
-        self.log.info("Setting IRC nick to '%s'" % self.nick)
-        connection.nick("%s" % self.nick)
+        self.log.info("IRC nick '%s' is currently in use", event.args[0])
+        if self.state == REGISTERED:
+            # Keep the nick we have, and try again later
+            self._schedule_nick_regain()
+            return
+
+        self.nick = "%s%d" % (self.wanted_nick, random.randint(1, 100))
+        self.log.info("Setting IRC nick to '%s'", self.nick)
         # Try to prevent nick flooding
-        time.sleep(1)
-
-    def on_welcome(self, connection, _event):
+        connection.execute_delayed(1, self._send_nick, (self.nick,))
+
+    def on_nick(self, _connection, event):
+        """Keep track of our nick, and grab the wanted one once it is
+        released.
+        """
+        old_nick, new_nick = event.nickmask.nick, event.to
+        if old_nick == self.nick:
+            self.nick = new_nick
+            self.log.info("IRC nick is now '%s'", new_nick)
+            if self._is_wanted_nick(new_nick):
+                self._cancel_nick_regain()
+        elif self._is_wanted_nick(old_nick):
+            self._regain_nick()
+
+    def on_welcome(self, connection, event):
         """Join channels upon successful connection."""
+        self.state = REGISTERED
+        self.reconnect_failures = 0
+        self.nick = event.to
+        self._server_queue = []
+        self._record_latency(connection.connect_latency)
+        if not self._is_wanted_nick(self.nick):
+            self._schedule_nick_regain()
+
         if self.identify_password:
             self.privmsg("NickServ", "IDENTIFY %s" % self.identify_password)
 
@@ -275,145 +472,347 @@ class IRC(irclib.SimpleIRCClient):
                 else:
                     connection.join(channel[0])
 
-    def on_disconnect(self, _connection, _event):
+    def on_featurelist(self, _connection, event):
+        """Match masks the way the server compares nicks."""
+        for feature in event.args:
+            if feature.startswith("CASEMAPPING="):
+                self.casemapping = feature[12:]
+                for masks in (self.admins, self.ignores, self.autoops):
+                    masks.set_casemapping(self.casemapping)
+
+    def on_error(self, _connection, event):
+        """Slow down if the server is closing the link for flooding."""
+        reason = " ".join(event.args)
+        if "excess flood" in reason.lower():
+            self.log.info("Flooded off the server, slowing down")
+            self.flood_control.backoff()
+
+    def on_tryagain(self, _connection, event):
+        """Slow down if the server is too busy for a command."""
+        self.log.info("Server asked to try again: %s",
+                " ".join(event.args))
+        self.flood_control.backoff()
+
+    def on_disconnect(self, _connection, event):
         """Attempt to reconnect after disconnection."""
-        self.log.info("Disconnected from %s:%d" % (self.server, self.port))
-        self.log.info("Reconnecting in %d seconds" % self.reconnect_delay)
-        time.sleep(self.reconnect_delay)
-        self.log.info("Connecting to %s:%d as %s" % (self.server, self.port,
-                self.nick))
-        self.connect(self.server, self.port, self.nick, self.password,
-                ssl=self.ssl, username=self.username)
+        self.flood_control.clear()
+        was_connecting = self.state == CONNECTING
+        self.state = DISCONNECTED
+        self._cancel_nick_regain()
+        for timer in self._rejoin_timers.values():
+            timer.cancel()
+        self._rejoin_timers.clear()
+
+        self.log.info("Disconnected from %s:%d: %s", self.server, self.port,
+                event.args[0])
+        if was_connecting:
+            # Never made it in, so it is no longer known to be fast
+            self.latencies.pop((self.server, self.port), None)
+            if self._server_queue:
+                self._reconnect_timer = self.ircobj.execute_delayed(0,
+                        self._connect)
+                return
+
+        self._schedule_reconnect()
 
     def on_kick(self, connection, event):
         """Automatically rejoin channel if kicked."""
-        source = irclib.nm_to_n(event.source())
-        target = event.target()
-        nick, reason = event.arguments()
+        source = event.nickmask.nick
+        target = event.to
+        nick, reason = event.args
 
         if nick == self.nick:
-            self.log.info("-%s- kicked by %s: %s" % (target, source, reason))
-            self.log.info("-%s- rejoining in %d seconds" % (target,
-                    self.rejoin_delay))
-            time.sleep(self.rejoin_delay)
-            connection.join(target)
+            self.log.info("-%s- kicked by %s: %s", target, source, reason)
+            self.log.info("-%s- rejoining in %d seconds", target,
+                    self.rejoin_delay)
+            channel = hostmask.lower(target, self.casemapping)
+            if channel not in self._rejoin_timers:
+                self._rejoin_timers[channel] = connection.execute_delayed(
+                        self.rejoin_delay, self._rejoin, (channel, target))
         else:
-            self.log.info("-%s- %s was kicked by %s: %s" % (target, nick,
-                    source, reason))
+            self.log.info("-%s- %s was kicked by %s: %s", target, nick,
+                    source, reason)
 
     def on_invite(self, _connection, event):
         """Join a channel upon invitation."""
-        source = event.source().split("@", 1)[0]
-        if source in self.admins:
-            self.join_channel(event.arguments()[0])
+        if self.admins.match(event.nickmask):
+            self.join_channel(event.args[0])
 
     def on_ctcp(self, connection, event):
         """Respond to CTCP events."""
-        source = irclib.nm_to_n(event.source())
-        ctcp = event.arguments()[0]
+        if self.ignores.match(event.nickmask):
+            return
+
+        source = event.nickmask.nick
+        ctcp = event.args[0]
 
         if ctcp == "VERSION":
-            self.log.info("Received CTCP VERSION from %s" % source)
+            self.log.info("Received CTCP VERSION from %s", source)
             connection.ctcp_reply(source, "VERSION %s" % self.version)
         elif ctcp == "PING":
-            if len(event.arguments()) > 1:
-                self.log.info("Received CTCP PING from %s" % source)
-                connection.ctcp_reply(source,
-                        "PING %s" % event.arguments()[1])
+            if len(event.args) > 1:
+                self.log.info("Received CTCP PING from %s", source)
+                connection.ctcp_reply(source, "PING %s" % event.args[1])
 
-    def on_join(self, _connection, event):
-        """Handle joins."""
-        target = event.target()
-        source = irclib.nm_to_n(event.source())
-        self.log.info("-%s- %s joined" % (target, source))
+    def on_join(self, connection, event):
+        """Handle joins, opping those on the auto-op list."""
+        nick = event.nickmask.nick
+        self.log.info("-%s- %s joined", event.to, nick)
+        if nick != self.nick and self.autoops.match(event.nickmask):
+            connection.mode(event.to, "+o %s" % nick)
 
     def on_part(self, _connection, event):
         """Handle parts."""
-        target = event.target()
-        source = irclib.nm_to_n(event.source())
-        self.log.info("-%s- %s left" % (target, source))
+        self.log.info("-%s- %s left", event.to, event.nickmask.nick)
 
     def on_quit(self, _connection, event):
         """Handle quits."""
-        source = irclib.nm_to_n(event.source())
-        self.log.info("%s quit" % source)
+        self.log.info("%s quit", event.nickmask.nick)
+        if self._is_wanted_nick(event.nickmask.nick):
+            self._regain_nick()
 
     def on_action(self, _connection, event):
         """Handle IRC actions."""
-        target = event.target()
-        source = irclib.nm_to_n(event.source())
-        msg = event.arguments()[0]
-        self.log.info(unicode("-%s- * %s %s" % (target, source, msg), "utf-8"))
+        self.log.info("-%s- * %s %s", event.to, event.nickmask.nick,
+                event.args[0])
 
     def on_privnotice(self, _connection, event):
         """Handle private notices."""
-        if event.source() is not None:
-            source = irclib.nm_to_n(event.source())
+        if event.nickmask is not None:
+            source = event.nickmask.nick
         else:
             source = None
-        msg = event.arguments()[0]
-        self.log.info(unicode("-%s- %s" % (source, msg), "utf-8"))
+        self.log.info("-%s- %s", source, event.args[0])
 
     def on_pubnotice(self, _connection, event):
         """Handle public notices."""
-        target = event.target()
-        if event.source() is not None:
-            source = irclib.nm_to_n(event.source())
+        if event.nickmask is not None:
+            source = event.nickmask.nick
         else:
             source = None
-        msg = event.arguments()[0]
-        self.log.info(unicode("-%s- <%s> %s" % (target, source, msg),
-                "utf-8"))
+        self.log.info("-%s- <%s> %s", event.to, source, event.args[0])
 
     def on_privmsg(self, _connection, event):
         """Handle private messages."""
-        self.source = event.source().split("@", 1)[0]
-        self.target = irclib.nm_to_n(event.source())
-        msg = event.arguments()[0]
+        if self.ignores.match(event.nickmask):
+            return
 
-        if self.target != self.nick:
-            self.log.info(unicode("<%s> %s" % (self.target, msg), "utf-8"))
-            self.poll_messages(msg, private=True)
+        source = event.nickmask.nickuser
+        target = event.nickmask.nick
+        msg = event.args[0]
+
+        if target != self.nick:
+            self.log.info("<%s> %s", target, msg)
+            self.poll_messages(msg, private=True,
+                    context=Context(self, source, target, event=event))
 
     def on_pubmsg(self, _connection, event):
         """Handle public messages."""
-        self.source = event.source().split("@", 1)[0]
-        self.target = event.target()
-        nick = irclib.nm_to_n(event.source())
-        msg = event.arguments()[0]
-
-        self.log.info(unicode("-%s- <%s> %s" % (self.target, nick, msg),
-                "utf-8"))
-        self.poll_messages(msg)
-
-
-class IRCProcess(multiprocessing.Process):
-    """An IRC network connection process."""
-    def __init__(self, irc_network):
-        super(IRCProcess, self).__init__()
-        self.irc_network = irc_network
-        self.reconnect_delay = CONFIG.get("reconnect_delay", type="int")
-
-    def run(self):
-        """An IRC network connection."""
-        while True:
-            try:
-                connection = IRC(self.irc_network)
-            except Exception, exc:
-                LOG.error(exc)
-                LOG.error("Retrying in %d seconds" % self.reconnect_delay)
-                time.sleep(self.reconnect_delay)
-                continue
-
-            try:
-                connection.start()
-            except KeyboardInterrupt:
-                sys.exit(0)
-            except Exception, exc:
-                LOG.error(exc)
-                LOG.error("Retrying in %d seconds" % self.reconnect_delay)
-                time.sleep(self.reconnect_delay)
-                continue
+        if self.ignores.match(event.nickmask):
+            return
+
+        source = event.nickmask.nickuser
+        target = event.to
+        nick = event.nickmask.nick
+        msg = event.args[0]
+
+        self.log.info("-%s- <%s> %s", target, nick, msg)
+        self.poll_messages(msg, context=Context(self, source, target,
+                event=event))
+
+    def _connect(self):
+        """[Internal] Start connecting, or schedule another attempt"""
+        self._reconnect_timer = None
+        self.nick = self.wanted_nick
+        if not self._server_queue:
+            self._server_queue = self._order_servers()
+        self.server, self.port = self._server_queue.pop(0)
+        self.log.info("Connecting to %s:%d as %s", self.server, self.port,
+                self.nick)
+        try:
+            self.connect(self.server, self.port, self.nick, self.password,
+                    ssl=self.ssl, ipv6=self.ipv6,
+                    localaddress=self.bind_to or "", username=self.username)
+        except irclib.ServerConnectionError, exc:
+            self.log.error(exc)
+            self._schedule_reconnect()
+            return
+
+        self.state = CONNECTING
+        if self._reconnect_timer is not None:
+            # Left behind by dropping the previous connection
+            self._reconnect_timer.cancel()
+            self._reconnect_timer = None
+
+    def _schedule_reconnect(self):
+        """[Internal] Reconnect after an exponential backoff with jitter,
+        which is reset once the server lets us in
+        """
+        if self._reconnect_timer is not None:
+            return
+
+        delay = min(self.max_reconnect_delay,
+                self.reconnect_delay * 2 ** min(self.reconnect_failures, 16))
+        delay = random.uniform(delay / 2.0, delay)
+        self.reconnect_failures += 1
+        self.log.info("Reconnecting in %.1f seconds", delay)
+        self._reconnect_timer = self.ircobj.execute_delayed(delay,
+                self._connect)
+
+    def _order_servers(self):
+        """[Internal] The servers that connected fastest first, then the
+        ones without a latency yet, in the order they were configured
+        """
+        known = sorted((server for server in self.servers
+                if server in self.latencies), key=self.latencies.get)
+        return known + [server for server in self.servers
+                if server not in self.latencies]
+
+    def _record_latency(self, latency):
+        """[Internal]"""
+        if latency is None:
+            return
+
+        server = (self.server, self.port)
+        self.log.info("Connected to %s:%d in %.3f seconds", self.server,
+                self.port, latency)
+        previous = self.latencies.get(server)
+        if previous is not None:
+            # Smooth out the odd slow connect
+            latency = previous + (latency - previous) / 4
+        self.latencies[server] = latency
+
+    def _rejoin(self, channel, target):
+        """[Internal]"""
+        del self._rejoin_timers[channel]
+        if self.state == REGISTERED:
+            self.connection.join(target)
+
+    def _send_nick(self, nick):
+        """[Internal]"""
+        if self.state != DISCONNECTED and self.nick == nick:
+            self.connection.nick(nick)
+
+    def _is_wanted_nick(self, nick):
+        """[Internal]"""
+        return (hostmask.lower(nick, self.casemapping) ==
+                hostmask.lower(self.wanted_nick, self.casemapping))
+
+    def _schedule_nick_regain(self):
+        """[Internal] Keep asking for the wanted nick until we get it"""
+        if self._regain_timer is None:
+            self._regain_timer = self.ircobj.execute_every(
+                    self.nick_regain_delay, self._regain_nick)
+
+    def _cancel_nick_regain(self):
+        """[Internal]"""
+        if self._regain_timer is not None:
+            self._regain_timer.cancel()
+            self._regain_timer = None
+
+    def _regain_nick(self):
+        """[Internal]"""
+        if self.state == REGISTERED and not self._is_wanted_nick(self.nick):
+            self.log.info("Trying to regain IRC nick '%s'", self.wanted_nick)
+            self.connection.nick(self.wanted_nick)
+
+
+class Networks(object):
+    """Several IRC networks run by a single process.
+
+    The connections share one irclib.IRC object, so one loop serves all of
+    them, and the plugins are loaded once for every network.  Plugins get
+    this object instead of an IRC object.  Anything they look up on it is
+    forwarded to the IRC of the network the running hook was triggered on,
+    so replies go back where they came from.  Code that runs outside of a
+    hook, such as polls, gets the network that saw the last message.
+    """
+
+    def __init__(self, names):
+        self.names = names
+        self.ircobj = irclib.IRC()
+        self.networks = collections.OrderedDict()
+        self.last = None
+        self.plugins_loaded = False
+
+    def __getattr__(self, name):
+        return getattr(self.current(), name)
+
+    def current(self):
+        """Return the IRC of the network the running hook belongs to."""
+        context = utils.get_context()
+        if context is not None:
+            return context.irc
+
+        return self.last
+
+    def add(self, network):
+        """Connect to a network, retrying later if that fails."""
+        try:
+            irc = IRC(network, self)
+        except ValueError, exc:
+            # A bad setting will not fix itself by retrying
+            LOG.error("Unable to configure %s: %s", network, exc)
+            return
+        except Exception, exc:
+            reconnect_delay = CONFIG.get("reconnect_delay", type="int")
+            LOG.error(exc)
+            LOG.error("Retrying %s in %d seconds", network, reconnect_delay)
+            self.ircobj.execute_delayed(reconnect_delay, self.add,
+                    (network,))
+            return
+
+        self.networks[network] = irc
+        if self.last is None:
+            self.last = irc
+        if not self.plugins_loaded:
+            self.plugins_loaded = True
+            irc.load_plugins()
+
+    def start(self):
+        """Connect to every network and serve them until interrupted."""
+        for network in self.names:
+            self.add(network)
+
+        self.ircobj.process_forever()
+
+
+def parse_server(server, default_port):
+    """Split a configured server into a host and port.
+
+    Servers are given as host, host:port or [ipv6-address]:port.
+    """
+    host, port = server, default_port
+    if server.startswith("["):
+        host, _bracket, rest = server[1:].partition("]")
+        if rest.startswith(":"):
+            port = int(rest[1:])
+    elif server.count(":") == 1:
+        host, port = server.split(":")
+        port = int(port)
+
+    return host, port
+
+
+def _get_reloaded(option, **kwargs):
+    """[Internal] CONFIG.get for a reload, where a missing option raises
+    ValueError rather than exiting
+    """
+    value = CONFIG.get(option, default=kwargs.pop("default", None),
+            **kwargs)
+    if value is None:
+        raise ValueError("Unable to locate '%s' in %s" % (option,
+                CONFIG.config))
+
+    return value
+
+
+def run_network(network, health_fd):
+    """Run a network in a supervised process."""
+    connection = IRC(network)
+    connection.ircobj.execute_every(supervisor.HEALTH_INTERVAL,
+            supervisor.heartbeat, (health_fd,))
+    connection.start()
 
 
 def active_plugins():
@@ -431,28 +830,37 @@ def active_keywords():
     return ", ".join(sorted(plugin.active_keywords()))
 
 
+def preload():
+    """Import the plugins, and the libraries they use, before the network
+    processes are forked, so that they share those pages copy-on-write.
+
+    Afterwards the collector is kept from writing to the shared objects:
+    gc.freeze() moves them out of its reach where it exists (Python 3.7+).
+    Elsewhere a full collection right before forking leaves them all in
+    the oldest generation, which CPython 2.7 only rescans once the number
+    of new long-lived objects reaches a quarter of it.
+    """
+    plugin.import_plugins()
+    gc.collect()
+    if hasattr(gc, "freeze"):
+        gc.freeze()
+
+
 def main():
     """Main IRC loop."""
     networks = CONFIG.get("networks", type="list")
 
-    LOG.info("Starting %s" % version.version_string())
-    LOG.info("Connecting to IRC Networks: %s" % ", ".join(networks))
-
-    procs = []
-    for network in networks:
-        proc = IRCProcess(network)
-        proc.start()
-        procs.append(proc)
-
-    try:
-        while True:
-            time.sleep(1)
-            for proc in procs:
-                if not proc.is_alive():
-                    procs.remove(proc)
-
-            if not procs:
-                LOG.info("No longer connected to any networks, shutting down")
-                sys.exit(0)
-    except KeyboardInterrupt:
-        LOG.info("Caught KeyboardInterrupt, shutting down")
+    LOG.info("Starting %s", version.version_string())
+    LOG.info("Connecting to IRC Networks: %s", ", ".join(networks))
+
+    if CONFIG.get("single_process", type="bool", default=False):
+        try:
+            Networks(networks).start()
+        except KeyboardInterrupt:
+            LOG.info("Caught KeyboardInterrupt, shutting down")
+        return
+
+    preload()
+
+    supervisor.Supervisor(run_network, networks).run()
+    LOG.info("No longer connected to any networks, shutting down")
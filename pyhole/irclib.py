@@ -52,8 +52,8 @@ The main features of the IRC client framework are:
 Current limitations:
 
   * The IRC protocol shines through the abstraction a bit too much.
-  * Data is not written asynchronously to the server, i.e. the write()
-    may block if the TCP buffers are stuffed.
+  * Data is not written asynchronously to DCC connections, i.e. the
+    write() may block if the TCP buffers are stuffed.
   * There are no support for DCC file transfers.
   * The author haven't even read RFC 2810, 2811, 2812 and 2813.
   * Like most projects, documentation is lacking...
@@ -62,23 +62,44 @@ Current limitations:
 """
 
 import bisect
+import collections
+import errno
+import fcntl
+import heapq
+import itertools
+import math
+import operator
+import os
 import re
 import select
 import socket
 import string
+import threading
 import time
 import types
 
+import hostmask
+import ircparser
+
+try:
+    import ssl as _ssl
+except ImportError:
+    _ssl = None
+
 VERSION = 0, 4, 8
 DEBUG = 0
 
+# Servers can send any command, so only this many event types get a
+# cached dispatch table
+_MAX_DISPATCH = 1024
+
 # TODO
 # ----
 # (maybe) thread safety
 # (maybe) color parser convenience functions
 # documentation (including all event types)
 # (maybe) add awareness of different types of ircds
-# send data asynchronously to the server (and DCC connections)
+# send data asynchronously to DCC connections
 # (maybe) automatically close unused, passive DCC connections after a while
 
 # NOTES
@@ -106,7 +127,7 @@ class IRC:
 
     The methods of most interest for an IRC client writer are server,
     add_global_handler, remove_global_handler, execute_at,
-    execute_delayed, process_once and process_forever.
+    execute_delayed, execute_every, process_once and process_forever.
 
     Here is an example:
 
@@ -156,9 +177,17 @@ class IRC:
 
         self.fn_to_add_timeout = fn_to_add_timeout
         self.connections = []
+        self.reactor = Reactor()
         self.handlers = {}
-        # list of tuples in the format (time, function, arguments)
-        self.delayed_commands = []
+        self._dispatch = {}
+        self.scheduler = Scheduler()
+
+        # Lets timers scheduled while process_once is waiting cut the
+        # wait short
+        self.waker = _Waker()
+        self.reactor.register(self.waker, self.waker)
+        self._poll_deadline = None
+        self._thread_calls = collections.deque()
 
         self.add_global_handler("ping", _ping_ponger, -42)
 
@@ -179,49 +208,62 @@ class IRC:
         See documentation for IRC.__init__.
         """
         for s in sockets:
-            for c in self.connections:
-                if s == c._get_socket():
-                    c.process_data()
+            c = self.reactor.get_connection(s)
+            if c is not None:
+                c.process_data()
 
     def process_timeout(self):
         """Called when a timeout notification is due.
 
         See documentation for IRC.__init__.
         """
-        t = time.time()
-        while self.delayed_commands:
-            if t >= self.delayed_commands[0][0]:
-                self.delayed_commands[0][1](*self.delayed_commands[0][2])
-                del self.delayed_commands[0]
-            else:
-                break
+        self.scheduler.run(time.time())
 
     def process_once(self, timeout=0):
         """Process data from connections once.
 
         Arguments:
 
-            timeout -- How long the select() call should wait if no
-                       data is available.
+            timeout -- How long to wait at most if no data is available,
+                       or None to wait until the next timer is due.
 
-        This method should be called periodically to check and process
-        incoming data, if there are any.  If that seems boring, look
-        at the process_forever method.
+        The wait is cut short when a timer falls due.  This method
+        should be called periodically to check and process incoming
+        data, if there are any.  If that seems boring, look at the
+        process_forever method.
         """
-        sockets = map(lambda x: x._get_socket(), self.connections)
-        sockets = filter(lambda x: x != None, sockets)
-        if sockets:
-            (i, o, e) = select.select(sockets, [], [], timeout)
-            self.process_data(i)
+        now = time.time()
+        deadline = self.scheduler.next_deadline()
+        if deadline is not None and (timeout is None or
+                deadline < now + timeout):
+            timeout = max(0, deadline - now)
+
+        if timeout is None:
+            self._poll_deadline = float("inf")
         else:
-            time.sleep(timeout)
+            self._poll_deadline = now + timeout
 
-        for conn in self.connections:
-            conn._check_last_event()
+        try:
+            ready = self.reactor.poll(timeout)
+        finally:
+            self._poll_deadline = None
+
+        for fd, events in ready:
+            # An earlier handler may have closed this connection
+            c = self.reactor.get_connection(fd)
+            if c is not None and events & Reactor.WRITE:
+                c.flush()
+                c = self.reactor.get_connection(fd)
+            if c is not None and events & Reactor.READ:
+                c.process_data()
+
+        while self._thread_calls:
+            function, arguments = self._thread_calls.popleft()
+            function(*arguments)
 
         self.process_timeout()
 
-    def process_forever(self, timeout=0.2):
+    def process_forever(self, timeout=None):
         """Run an infinite loop, processing data from connections.
 
         This method repeatedly calls process_once.
@@ -262,6 +304,7 @@ class IRC:
         if not event in self.handlers:
             self.handlers[event] = []
         bisect.insort(self.handlers[event], ((priority, handler)))
+        self._dispatch.clear()
 
     def remove_global_handler(self, event, handler):
         """Removes a global handler function.
@@ -276,11 +319,33 @@ class IRC:
         """
         if not event in self.handlers:
             return 0
-        for h in self.handlers[event]:
-            if handler == h[1]:
-                self.handlers[event].remove(h)
+        self.handlers[event] = [h for h in self.handlers[event]
+                                if handler != h[1]]
+        self._dispatch.clear()
         return 1
 
+    def get_handlers(self, eventtype):
+        """Get the handler functions for an event type.
+
+        Arguments:
+
+            eventtype -- Event type (a string).
+
+        Returns a tuple of the handlers for the event type together
+        with the \"all_events\" handlers, in priority order.  The tuple
+        is cached until a global handler is added or removed.
+        """
+        try:
+            return self._dispatch[eventtype]
+        except KeyError:
+            handlers = sorted(self.handlers.get("all_events", []) +
+                              self.handlers.get(eventtype, []),
+                              key=operator.itemgetter(0))
+            handlers = tuple(h[1] for h in handlers)
+            if len(self._dispatch) < _MAX_DISPATCH:
+                self._dispatch[eventtype] = handlers
+            return handlers
+
     def execute_at(self, at, function, arguments=()):
         """Execute a function at a specified time.
 
@@ -291,8 +356,10 @@ class IRC:
             function -- Function to call.
 
             arguments -- Arguments to give the function.
+
+        Returns a Timer, which can be cancelled.
         """
-        self.execute_delayed(at - time.time(), function, arguments)
+        return self._schedule(at, function, arguments)
 
     def execute_delayed(self, delay, function, arguments=()):
         """Execute a function after a specified time.
@@ -304,11 +371,35 @@ class IRC:
             function -- Function to call.
 
             arguments -- Arguments to give the function.
+
+        Returns a Timer, which can be cancelled.
         """
-        bisect.insort(self.delayed_commands,
-            (delay + time.time(), function, arguments))
-        if self.fn_to_add_timeout:
-            self.fn_to_add_timeout(delay)
+        return self._schedule(delay + time.time(), function, arguments)
+
+    def execute_every(self, interval, function, arguments=()):
+        """Execute a function periodically.
+
+        Arguments:
+
+            interval -- How many seconds to wait between calls.
+
+            function -- Function to call.
+
+            arguments -- Arguments to give the function.
+
+        Returns a Timer; cancel it to stop the calls.
+        """
+        return self._schedule(interval + time.time(), function, arguments,
+                interval)
+
+    def call_from_thread(self, function, arguments=()):
+        """Have process_once call a function as soon as it can.
+
+        Unlike the execute_* methods, this is safe to call from other
+        threads.
+        """
+        self._thread_calls.append((function, arguments))
+        self.waker.wake(always=True)
 
     def dcc(self, dcctype="chat"):
         """Creates and returns a DCCConnection object.
@@ -326,16 +417,303 @@ class IRC:
 
     def _handle_event(self, connection, event):
         """[Internal]"""
-        h = self.handlers
-        for handler in h.get("all_events", []) + h.get(event.eventtype(), []):
-            if handler[1](connection, event) == "NO MORE":
+        for handler in self.get_handlers(event.eventtype()):
+            if handler(connection, event) == "NO MORE":
                 return
 
     def _remove_connection(self, connection):
         """[Internal]"""
         self.connections.remove(connection)
+        if connection._get_socket() is not None:
+            self._remove_socket(connection._get_socket())
+
+    def _schedule(self, at, function, arguments, interval=None):
+        """[Internal]"""
+        timer = self.scheduler.schedule(at, function, arguments, interval)
+        if self._poll_deadline is not None and at < self._poll_deadline:
+            self.waker.wake()
+        if self.fn_to_add_timeout:
+            self.fn_to_add_timeout(max(0, at - time.time()))
+        return timer
+
+    def _set_writable(self, sock, writable):
+        """[Internal] Watch a socket for room to send, or stop doing so
+
+        A wait that started before the socket had anything to send is
+        not watching it, so cut it short.
+        """
+        if (self.reactor.set_writable(sock, writable) and
+                self._poll_deadline is not None):
+            self.waker.wake()
+
+    def _add_socket(self, sock, connection):
+        """[Internal] Start watching a connection's socket"""
+        self.reactor.register(sock, connection)
+        if self.fn_to_add_socket:
+            self.fn_to_add_socket(sock)
+
+    def _remove_socket(self, sock):
+        """[Internal] Stop watching a socket; call before closing it"""
+        self.reactor.unregister(sock)
         if self.fn_to_remove_socket:
-            self.fn_to_remove_socket(connection._get_socket())
+            self.fn_to_remove_socket(sock)
+
+
+class Reactor:
+    """Watches connection sockets for incoming data, and for room to send
+    on the connections that have data waiting to go out.
+
+    Sockets are registered once, when their connection is established,
+    and looked up by file descriptor when they become ready, so each
+    wakeup costs time in proportion to the number of ready sockets.
+    epoll or poll is used when the select module provides it (eventlet's
+    green select module only has select()).
+    """
+
+    READ = 1
+    WRITE = 2
+
+    def __init__(self, backend=None):
+        if backend is None:
+            if hasattr(select, "epoll"):
+                backend = "epoll"
+            elif hasattr(select, "poll"):
+                backend = "poll"
+            else:
+                backend = "select"
+
+        self.backend = backend
+        if backend == "epoll":
+            self.poller = select.epoll()
+            self.masks = (select.EPOLLIN, select.EPOLLIN | select.EPOLLOUT)
+        elif backend == "poll":
+            self.poller = select.poll()
+            self.masks = (select.POLLIN, select.POLLIN | select.POLLOUT)
+        else:
+            self.poller = None
+
+        self.fds = {}
+        self.connections = {}
+        self.writers = set()
+
+    def __len__(self):
+        return len(self.connections)
+
+    def register(self, sock, connection):
+        """Watch a socket for the given connection."""
+        fd = sock.fileno()
+        if fd in self.connections:
+            self._unregister_fd(fd)
+
+        self.fds[sock] = fd
+        self.connections[fd] = connection
+        if self.poller is not None:
+            self.poller.register(fd, self.masks[0])
+
+    def unregister(self, sock):
+        """Stop watching a socket."""
+        fd = self.fds.pop(sock, None)
+        if fd is not None:
+            self._unregister_fd(fd)
+
+    def set_writable(self, sock, writable):
+        """Start or stop watching a registered socket for room to send.
+
+        Returns True if the socket was not being watched for room to
+        send before.
+        """
+        fd = self.fds.get(sock)
+        if fd is None or writable == (fd in self.writers):
+            return False
+
+        if writable:
+            self.writers.add(fd)
+        else:
+            self.writers.discard(fd)
+
+        if self.poller is not None:
+            self.poller.modify(fd, self.masks[writable])
+        return writable
+
+    def get_connection(self, sock):
+        """Return the connection for a socket or file descriptor."""
+        if not isinstance(sock, (int, long)):
+            sock = self.fds.get(sock)
+        return self.connections.get(sock)
+
+    def poll(self, timeout):
+        """Wait up to timeout seconds (forever if None) and return a list
+        of (fd, events) for the ready sockets, where events is a mask of
+        READ and WRITE
+        """
+        if self.backend == "epoll":
+            if timeout is None:
+                timeout = -1
+            return [(fd, self._events(mask, select.EPOLLOUT))
+                    for fd, mask in self.poller.poll(timeout)]
+        elif self.backend == "poll":
+            if timeout is not None:
+                timeout = int(math.ceil(timeout * 1000))
+            return [(fd, self._events(mask, select.POLLOUT))
+                    for fd, mask in self.poller.poll(timeout)]
+
+        (i, o, e) = select.select(self.connections.keys(), self.writers, [],
+                timeout)
+        ready = dict.fromkeys(i, self.READ)
+        for fd in o:
+            ready[fd] = ready.get(fd, 0) | self.WRITE
+        return ready.items()
+
+    def _events(self, mask, out):
+        """[Internal] Turn a poller event mask into READ and WRITE
+
+        Errors and hangups count as readable, so the read fails and the
+        connection notices it has gone away.
+        """
+        events = 0
+        if mask & ~out:
+            events |= self.READ
+        if mask & out:
+            events |= self.WRITE
+        return events
+
+    def _unregister_fd(self, fd):
+        """[Internal]"""
+        del self.connections[fd]
+        self.writers.discard(fd)
+        for sock, sock_fd in self.fds.items():
+            if sock_fd == fd:
+                del self.fds[sock]
+
+        if self.poller is not None:
+            try:
+                self.poller.unregister(fd)
+            except (IOError, KeyError, ValueError):
+                pass
+
+
+class _Waker:
+    """[Internal] A self-pipe that interrupts a waiting reactor"""
+
+    def __init__(self):
+        self.read_fd, self.write_fd = os.pipe()
+        for fd in (self.read_fd, self.write_fd):
+            flags = fcntl.fcntl(fd, fcntl.F_GETFL)
+            fcntl.fcntl(fd, fcntl.F_SETFL, flags | os.O_NONBLOCK)
+        self.pending = False
+
+    def fileno(self):
+        return self.read_fd
+
+    def wake(self, always=False):
+        # Other threads cannot trust the pending flag
+        if self.pending and not always:
+            return
+
+        self.pending = True
+        try:
+            os.write(self.write_fd, "x")
+        except OSError:
+            pass
+
+    def process_data(self):
+        # Only one byte is ever pending, so a single read cannot block
+        self.pending = False
+        try:
+            os.read(self.read_fd, 4096)
+        except OSError:
+            pass
+
+
+class Timer(object):
+    """A function call scheduled by execute_at, execute_delayed or
+    execute_every.
+    """
+
+    __slots__ = ("when", "function", "arguments", "interval", "cancelled",
+            "scheduler")
+
+    def __init__(self, scheduler, when, function, arguments, interval=None):
+        self.scheduler = scheduler
+        self.when = when
+        self.function = function
+        self.arguments = arguments
+        self.interval = interval
+        self.cancelled = False
+
+    def cancel(self):
+        """Stop the call from happening (again)."""
+        if self.cancelled:
+            return
+
+        self.cancelled = True
+        if self.scheduler is not None:
+            self.scheduler._cancel(self)
+
+
+class Scheduler:
+    """A heap of pending timers.
+
+    Cancelled timers are left in the heap and skipped when they come up,
+    and the heap is compacted once they make up most of it.
+    """
+
+    def __init__(self):
+        self.heap = []
+        self.counter = itertools.count()
+        self.cancelled = 0
+
+    def __len__(self):
+        return len(self.heap) - self.cancelled
+
+    def schedule(self, when, function, arguments=(), interval=None):
+        """Schedule a call and return its Timer."""
+        timer = Timer(self, when, function, arguments, interval)
+        heapq.heappush(self.heap, (when, self.counter.next(), timer))
+        return timer
+
+    def next_deadline(self):
+        """Return when the next timer is due, or None."""
+        heap = self.heap
+        while heap and heap[0][2].cancelled:
+            heapq.heappop(heap)
+            self.cancelled -= 1
+
+        if heap:
+            return heap[0][0]
+
+    def run(self, now):
+        """Call every timer that is due."""
+        # A callback can compact the heap into a new list, so look it up
+        # afresh on every pass
+        while self.heap and self.heap[0][0] <= now:
+            when, _seq, timer = heapq.heappop(self.heap)
+            if timer.cancelled:
+                self.cancelled -= 1
+                continue
+
+            if timer.interval is None:
+                timer.scheduler = None
+            else:
+                # Reschedule before the call, so it can cancel itself;
+                # skip missed calls rather than running them back to back
+                timer.when = when + timer.interval
+                if timer.when <= now:
+                    timer.when = now + timer.interval
+                heapq.heappush(self.heap, (timer.when, self.counter.next(),
+                        timer))
+
+            timer.function(*timer.arguments)
+
+    def _cancel(self, timer):
+        """[Internal]"""
+        self.cancelled += 1
+        if self.cancelled > 64 and self.cancelled * 2 > len(self.heap):
+            self.heap = [entry for entry in self.heap
+                    if not entry[2].cancelled]
+            heapq.heapify(self.heap)
+            self.cancelled = 0
+
 
 _rfc_1459_command_regexp = re.compile(
     "^(:(?P<prefix>[^ ]+) +)?(?P<command>[^ ]+)( *(?P<argument> .+))?")
@@ -357,10 +735,13 @@ class Connection:
     ### Convenience wrappers.
 
     def execute_at(self, at, function, arguments=()):
-        self.irclibobj.execute_at(at, function, arguments)
+        return self.irclibobj.execute_at(at, function, arguments)
 
     def execute_delayed(self, delay, function, arguments=()):
-        self.irclibobj.execute_delayed(delay, function, arguments)
+        return self.irclibobj.execute_delayed(delay, function, arguments)
+
+    def execute_every(self, interval, function, arguments=()):
+        return self.irclibobj.execute_every(interval, function, arguments)
 
 
 class ServerConnectionError(IRCError):
@@ -376,6 +757,83 @@ class ServerNotConnectedError(ServerConnectionError):
 _linesep_regexp = re.compile("\r?\n")
 
 
+class LineFramer:
+    """Splits a received byte stream into lines.
+
+    Data is received straight into a preallocated buffer, and lines are
+    found by scanning only the new bytes for LF (a CR before it is
+    dropped too), so neither memory use nor the work per byte grows with
+    the size of a burst.  Lines longer than max_line are discarded.
+    """
+
+    def __init__(self, max_line=2 ** 14, recv_size=2 ** 14):
+        self.max_line = max_line
+        self.recv_size = recv_size
+        self.buffer = bytearray(max_line + recv_size)
+        self.view = memoryview(self.buffer)
+        self.start = 0
+        self.scan = 0
+        self.end = 0
+        self.discarding = False
+        self.dropped = 0
+
+    def recv_into(self, sock):
+        """Receive from a socket into the buffer.
+
+        Returns the number of bytes received; 0 means the peer is gone.
+        """
+        if len(self.buffer) - self.end < self.recv_size:
+            self._compact()
+
+        n = sock.recv_into(self.view[self.end:], self.recv_size)
+        self.end += n
+        return n
+
+    def lines(self):
+        """Return the complete lines received so far."""
+        buf = self.buffer
+        lines = []
+        while True:
+            nl = buf.find("\n", self.scan, self.end)
+            if nl < 0:
+                break
+
+            if self.discarding:
+                self.discarding = False
+            else:
+                stop = nl
+                if stop > self.start and buf[stop - 1] == 13:
+                    stop -= 1
+                lines.append(self.view[self.start:stop].tobytes())
+            self.start = self.scan = nl + 1
+
+        self.scan = self.end
+        if self.end - self.start > self.max_line:
+            # Drop what we have of an overlong line, and the rest of it as
+            # it comes in
+            self.dropped += 1
+            self.discarding = True
+            self.start = self.end
+
+        if self.start == self.end:
+            self.start = self.scan = self.end = 0
+
+        return lines
+
+    def clear(self):
+        """Forget any partial line."""
+        self.start = self.scan = self.end = 0
+        self.discarding = False
+
+    def _compact(self):
+        """[Internal] Move the partial line to the front of the buffer"""
+        size = self.end - self.start
+        self.buffer[:size] = self.buffer[self.start:self.end]
+        self.scan -= self.start
+        self.start = 0
+        self.end = size
+
+
 class ServerConnection(Connection):
     """This class represents an IRC server connection.
 
@@ -383,11 +841,44 @@ class ServerConnection(Connection):
     method on an IRC object.
     """
 
+    # Give up on a server that has stopped reading from us
+    max_send_buffer = 2 ** 20
+
+    # Longer lines (including any IRCv3 tags) are discarded
+    max_line_length = 2 ** 14
+
+    # Give up on a connection whose TCP connect or SSL handshake takes
+    # longer than this
+    connect_timeout = 30
+
+    # How long to give an address before racing the next one against it
+    connection_attempt_delay = 0.25
+
+    # How long a disconnected socket keeps sending what it had left
+    close_timeout = 5
+
     def __init__(self, irclibobj):
         Connection.__init__(self, irclibobj)
         self.connected = 0  # Not connected yet.
         self.socket = None
         self.ssl = None
+        self.send_buffer = bytearray()
+        self.send_scheduler = None
+        self.framer = LineFramer(self.max_line_length)
+        self._ssl_retry = 0
+        self._connecting = False
+        self._handshaking = False
+        self._use_ssl = False
+        self._ping_timer = None
+        self._connect_timer = None
+        self._stagger_timer = None
+        self._addresses = collections.deque()
+        self._attempts = []
+        self._connect_error = None
+        self._connect_started = None
+        self._resolving = 0
+        self.connect_latency = None
+        self.peer_address = None
 
     def connect(self, server, port, nickname, password=None, username=None,
         ircname=None, localaddress="", localport=0, ssl=False, ipv6=False):
@@ -413,16 +904,26 @@ class ServerConnection(Connection):
 
             ssl -- Enable support for ssl.
 
-            ipv6 -- Enable support for ipv6.
+            ipv6 -- Race the server's IPv6 and IPv4 addresses, rather
+                    than only trying IPv4.
 
         This function can be called to reconnect a closed connection.
 
+        The connection is made in the background, so this returns right
+        away; the logon commands are sent once it is up.  The server name
+        is resolved in a thread, and its addresses are tried in
+        staggered parallel attempts, alternating between address
+        families (RFC 8305), and the first one to connect wins.  Once it
+        has, connect_latency holds how long that took and peer_address
+        the address.  A "disconnect" event is generated if no connection
+        can be made within connect_timeout seconds.
+
         Returns the ServerConnection object.
         """
         if self.connected:
             self.disconnect("Changing servers")
 
-        self.previous_buffer = ""
+        self.framer = LineFramer(self.max_line_length)
         self.handlers = {}
         self.real_server_name = ""
         self.real_nickname = nickname
@@ -437,33 +938,31 @@ class ServerConnection(Connection):
         self.localhost = socket.gethostname()
         self.last_event = time.time()
 
-        if ipv6:
-            self.socket = socket.socket(socket.AF_INET6, socket.SOCK_STREAM)
-        else:
-            self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        try:
-            self.socket.bind((self.localaddress, self.localport))
-            self.socket.connect((self.server, self.port))
-            if ssl:
-                try:
-                    import ssl
-                    ssl_wrap = ssl.wrap_socket
-                except ImportError:
-                    ssl_wrap = socket.ssl
-                self.ssl = ssl_wrap(self.socket)
-        except socket.error, x:
-            self.socket.close()
-            self.socket = None
-            raise ServerConnectionError("Couldn't connect to socket: %s" % x)
-        self.connected = 1
-        if self.irclibobj.fn_to_add_socket:
-            self.irclibobj.fn_to_add_socket(self.socket)
+        if ssl and _ssl is None:
+            raise ServerConnectionError("SSL support is not available")
 
-        # Log on...
+        self.connected = 1
+        self.socket = None
+        self.send_buffer = bytearray()
+        self._ssl_retry = 0
+        self._connecting = True
+        self._handshaking = False
+        self._use_ssl = ssl
+        self._connect_error = None
+        self._connect_started = self.last_event
+        self.connect_latency = None
+        self.peer_address = None
+        self._connect_timer = self.execute_delayed(self.connect_timeout,
+                self._connect_timed_out)
+        self._check_last_event()
+
+        # Log on (sent once the connection is up)...
         if self.password:
             self.pass_(self.password)
         self.nick(self.nickname)
         self.user(self.username, self.ircname)
+
+        self._resolve(socket.AF_UNSPEC if ipv6 else socket.AF_INET)
         return self
 
     def close(self):
@@ -506,24 +1005,37 @@ class ServerConnection(Connection):
         if not self.is_connected():
             return
 
+        if self._handshaking:
+            self._do_handshake()
+            if self._handshaking:
+                return
+
         try:
-            if self.ssl:
-                new_data = self.ssl.read(2 ** 14)
-            else:
-                new_data = self.socket.recv(2 ** 14)
+            received = self.framer.recv_into(self.ssl or self.socket)
         except socket.error, x:
+            if _would_block(x):
+                return
             # The server hung up.
             self.disconnect("Connection reset by peer")
             return
-        if not new_data:
+        if not received:
             # Read nothing: connection must be down.
             self.disconnect("Connection reset by peer")
             return
 
-        lines = _linesep_regexp.split(self.previous_buffer + new_data)
-
-        # Save the last, unfinished line.
-        self.previous_buffer = lines.pop()
+        lines = self.framer.lines()
+        while self.ssl is not None and self.ssl.pending():
+            # Records the SSL object has already decrypted never show up
+            # in select, so read them now rather than on the next packet
+            try:
+                if not self.framer.recv_into(self.ssl):
+                    break
+            except socket.error, x:
+                if _would_block(x):
+                    break
+                self.disconnect("Connection reset by peer")
+                return
+            lines.extend(self.framer.lines())
 
         # Record the time of this event
         self.last_event = time.time()
@@ -535,35 +1047,25 @@ class ServerConnection(Connection):
             if not line:
                 continue
 
-            prefix = None
-            command = None
-            arguments = None
-            self._handle_event(Event("all_raw_messages",
-                                     self.get_server_name(),
-                                     None,
-                                     [line]))
-
-            m = _rfc_1459_command_regexp.match(line)
-            if m.group("prefix"):
-                prefix = m.group("prefix")
+            if self._is_handled("all_raw_messages"):
+                self._handle_event(Event("all_raw_messages",
+                                         self.get_server_name(),
+                                         None,
+                                         [line]))
+
+            tags, prefix, command, arguments = ircparser.parse(line)
+            if prefix:
                 if not self.real_server_name:
                     self.real_server_name = prefix
-
-            if m.group("command"):
-                command = m.group("command").lower()
-
-            if m.group("argument"):
-                a = m.group("argument").split(" :", 1)
-                arguments = a[0].split()
-                if len(a) == 2:
-                    arguments.append(a[1])
+                # Shared by every event built from this line
+                prefix = NickMask(prefix)
 
             # Translate numerics into more readable strings.
             if command in numeric_events:
                 command = numeric_events[command]
 
             if command == "nick":
-                if nm_to_n(prefix) == self.real_nickname:
+                if prefix.nick == self.real_nickname:
                     self.real_nickname = arguments[0]
             elif command == "welcome":
                 # Record the nickname in case the client changed nick
@@ -594,16 +1096,21 @@ class ServerConnection(Connection):
                         if DEBUG:
                             print "command: %s, source: %s, target: %s, " \
                                 "arguments: %s" % (command, prefix, target, m)
-                        self._handle_event(Event(command, prefix, target, m))
-                        if command == "ctcp" and m[0] == "ACTION":
+                        if self._is_handled(command):
+                            self._handle_event(Event(command, prefix, target,
+                                                     m, tags))
+                        if (command == "ctcp" and m[0] == "ACTION" and
+                                self._is_handled("action")):
                             self._handle_event(
-                                Event("action", prefix, target, m[1:]))
+                                Event("action", prefix, target, m[1:], tags))
                     else:
                         if DEBUG:
                             print "command: %s, source: %s, target: %s, " \
                                 "arguments: %s" % (
                                 command, prefix, target, [m])
-                        self._handle_event(Event(command, prefix, target, [m]))
+                        if self._is_handled(command):
+                            self._handle_event(Event(command, prefix, target,
+                                                     [m], tags))
             else:
                 target = None
 
@@ -622,7 +1129,177 @@ class ServerConnection(Connection):
                 if DEBUG:
                     print "command: %s, source: %s, target: %s, " \
                         "arguments: %s" % (command, prefix, target, arguments)
-                self._handle_event(Event(command, prefix, target, arguments))
+                if self._is_handled(command):
+                    self._handle_event(Event(command, prefix, target,
+                                             arguments, tags))
+
+    def _resolve(self, family):
+        """[Internal] Look the server up in a thread, so a slow resolver
+        does not hold up the other connections
+        """
+        self._resolving += 1
+        resolving = self._resolving
+        server, port = self.server, self.port
+
+        def resolve():
+            try:
+                result = socket.getaddrinfo(server, port, family,
+                        socket.SOCK_STREAM)
+            except socket.error, x:
+                result = x
+            self.irclibobj.call_from_thread(self._resolved,
+                    (resolving, result))
+
+        thread = threading.Thread(target=resolve)
+        thread.daemon = True
+        thread.start()
+
+    def _resolved(self, resolving, result):
+        """[Internal]"""
+        if resolving != self._resolving or not self._connecting:
+            # Meant for a connection that has since been dropped
+            return
+
+        if isinstance(result, socket.error):
+            self.disconnect("Couldn't resolve %s: %s" % (self.server,
+                    result))
+            return
+
+        self._addresses = collections.deque(_interleave(result))
+        self._next_attempt()
+
+    def _next_attempt(self):
+        """[Internal] Start connecting to the next address, and race the
+        one after it against this one if it is slow to answer
+        """
+        self._stagger_timer = None
+        while self._addresses:
+            family, address = self._addresses.popleft()
+            sock = socket.socket(family, socket.SOCK_STREAM)
+            try:
+                sock.bind((self.localaddress, self.localport))
+                sock.setblocking(0)
+                error = sock.connect_ex(address)
+                if error not in (0, errno.EINPROGRESS, errno.EWOULDBLOCK):
+                    raise socket.error(error, os.strerror(error))
+            except socket.error, x:
+                sock.close()
+                self._connect_error = x
+                continue
+
+            attempt = _ConnectAttempt(self, sock, address)
+            self._attempts.append(attempt)
+            self.irclibobj._add_socket(sock, attempt)
+            # The socket turns writable once the connect has gone through
+            self.irclibobj._set_writable(sock, True)
+            if self._addresses:
+                self._stagger_timer = self.execute_delayed(
+                        self.connection_attempt_delay, self._next_attempt)
+            return
+
+        if not self._attempts:
+            self.disconnect("Couldn't connect to socket: %s" %
+                    self._connect_error)
+
+    def _attempt_done(self, attempt):
+        """[Internal] Carry on once an attempt has connected or failed"""
+        error = attempt.sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+        if not error:
+            try:
+                attempt.sock.getpeername()
+            except socket.error:
+                # Still connecting
+                return
+
+            self._attempt_won(attempt)
+            return
+
+        self._attempts.remove(attempt)
+        attempt.close()
+        self._connect_error = socket.error(error, os.strerror(error))
+        if not self._attempts:
+            # Nothing left to wait for, so skip the rest of the delay
+            if self._stagger_timer is not None:
+                self._stagger_timer.cancel()
+            self._next_attempt()
+
+    def _attempt_won(self, attempt):
+        """[Internal]"""
+        self._attempts.remove(attempt)
+        self._stop_attempts()
+        self.irclibobj._remove_socket(attempt.sock)
+        self.socket = attempt.sock
+        self.peer_address = attempt.address
+        self.connect_latency = time.time() - self._connect_started
+        self.irclibobj._add_socket(self.socket, self)
+
+        self._connecting = False
+        if not self._use_ssl:
+            self._established()
+            return
+
+        # The handshake is driven by the reactor like any other I/O
+        try:
+            self.ssl = _get_ssl_context().wrap_socket(self.socket,
+                    do_handshake_on_connect=False,
+                    server_hostname=self.server)
+        except socket.error, x:
+            self.disconnect("Couldn't connect to socket: %s" % x)
+            return
+        self.ssl.setblocking(0)
+        session = _ssl_sessions.get((self.server, self.port))
+        if session is not None:
+            self.ssl.session = session
+        self._handshaking = True
+        self._do_handshake()
+
+    def _stop_attempts(self):
+        """[Internal] Drop every attempt still in flight"""
+        if self._stagger_timer is not None:
+            self._stagger_timer.cancel()
+            self._stagger_timer = None
+        for attempt in self._attempts:
+            attempt.close()
+        self._attempts = []
+        self._addresses.clear()
+
+    def _connect_timed_out(self):
+        """[Internal]"""
+        self._connect_timer = None
+        if self._connecting or self._handshaking:
+            self.disconnect("Connection timed out")
+
+    def _established(self):
+        """[Internal] Send what is waiting once the connection is up"""
+        if self._connect_timer is not None:
+            self._connect_timer.cancel()
+            self._connect_timer = None
+        self.flush()
+
+    def _do_handshake(self):
+        """[Internal] Take the SSL handshake as far as it will go without
+        blocking, and send what is waiting once it is done
+        """
+        try:
+            self.ssl.do_handshake()
+        except socket.error, x:
+            if not _would_block(x):
+                self.disconnect("SSL handshake failed: %s" % x)
+                return
+            self.irclibobj._set_writable(self.socket,
+                    x.args[0] == _ssl.SSL_ERROR_WANT_WRITE)
+            return
+
+        self._handshaking = False
+        session = getattr(self.ssl, "session", None)
+        if session is not None:
+            _ssl_sessions[(self.server, self.port)] = session
+        self._established()
+
+    def _is_handled(self, eventtype):
+        """[Internal] Whether any handler would see an event type"""
+        return (eventtype in self.handlers or
+                len(self.irclibobj.get_handlers(eventtype)) > 0)
 
     def _handle_event(self, event):
         """[Internal]"""
@@ -632,9 +1309,18 @@ class ServerConnection(Connection):
                 fn(self, event)
 
     def _check_last_event(self, timeout=300):
-        """Disconnect if last event was too long ago"""
-        if self.is_connected() and self.last_event + timeout < time.time():
+        """Disconnect if last event was too long ago, otherwise check
+        again when it would be
+        """
+        if not self.is_connected():
+            return
+
+        deadline = self.last_event + timeout
+        if deadline <= time.time():
             self.disconnect("Ping timeout")
+        else:
+            self._ping_timer = self.execute_at(deadline,
+                    self._check_last_event, (timeout,))
 
     def is_connected(self):
         """Return connection status.
@@ -686,14 +1372,31 @@ class ServerConnection(Connection):
             return
 
         self.connected = 0
-
-        self.quit(message)
-
-        try:
-            self.socket.close()
-        except socket.error, x:
-            pass
+        for timer in (self._ping_timer, self._connect_timer):
+            if timer is not None:
+                timer.cancel()
+        self._ping_timer = self._connect_timer = None
+        self._stop_attempts()
+
+        if self.socket is not None:
+            # Skip the send scheduler, which is about to be cleared
+            self.write_raw("QUIT" + (message and (" :" + message)))
+
+            self.irclibobj._remove_socket(self.socket)
+            if self.send_buffer and not self._handshaking:
+                _Linger(self.irclibobj, self.socket, self.ssl,
+                        self.send_buffer, self._ssl_retry,
+                        self.close_timeout)
+            else:
+                try:
+                    self.socket.close()
+                except socket.error, x:
+                    pass
         self.socket = None
+        self.send_buffer = bytearray()
+        self.ssl = None
+        self._connecting = False
+        self._handshaking = False
         self._handle_event(Event("disconnect", self.server, "", [message]))
 
     def globops(self, text):
@@ -813,20 +1516,62 @@ class ServerConnection(Connection):
     def send_raw(self, string):
         """Send raw string to the server.
 
-        The string will be padded with appropriate CR LF.
+        The string will be padded with appropriate CR LF.  If a send
+        scheduler has been attached, it decides when the string is
+        written; otherwise it is written right away.
         """
-        if self.socket is None:
+        if self.socket is None and not self._connecting:
             raise ServerNotConnectedError("Not connected.")
+        if self.send_scheduler is not None:
+            self.send_scheduler.send(string)
+        else:
+            self.write_raw(string)
+
+    def write_raw(self, string):
+        """Write raw string to the server, bypassing any send scheduler.
+
+        The string is added to the outbound buffer, which is sent as fast
+        as the server takes it without ever blocking; whole lines are
+        never interleaved.
+        """
+        if self.socket is None and not self._connecting:
+            raise ServerNotConnectedError("Not connected.")
+        if DEBUG:
+            print "TO SERVER:", string
+
+        self.send_buffer += string
+        self.send_buffer += "\r\n"
+        if len(self.send_buffer) > self.max_send_buffer:
+            self.disconnect("Send buffer full")
+            return
+
+        self.flush()
+
+    def send_queue_size(self):
+        """Return the number of bytes waiting to be sent."""
+        return len(self.send_buffer)
+
+    def flush(self):
+        """Send as much of the outbound buffer as the socket will take.
+
+        Called by the reactor when the socket has room for more.
+        """
+        if self.socket is None:
+            return
+        if self._handshaking:
+            self._do_handshake()
+            return
+
         try:
-            if self.ssl:
-                self.ssl.write(string + "\r\n")
-            else:
-                self.socket.send(string + "\r\n")
-            if DEBUG:
-                print "TO SERVER:", string
+            self._ssl_retry = _send_buffer(self.socket, self.ssl,
+                    self.send_buffer, self._ssl_retry)
         except socket.error, x:
             # Ouch!
             self.disconnect("Connection reset by peer")
+            return
+
+        self.irclibobj._set_writable(self.socket,
+                bool(self.send_buffer))
 
     def squit(self, server, comment=""):
         """Send an SQUIT command."""
@@ -886,6 +1631,144 @@ class ServerConnection(Connection):
                                          server and (" " + server)))
 
 
+class _ConnectAttempt(object):
+    """[Internal] One of the sockets racing to connect to a server"""
+
+    def __init__(self, connection, sock, address):
+        self.connection = connection
+        self.sock = sock
+        self.address = address
+
+    def flush(self):
+        self.connection._attempt_done(self)
+
+    # Failed connects show up as readable
+    process_data = flush
+
+    def close(self):
+        self.connection.irclibobj._remove_socket(self.sock)
+        self.sock.close()
+
+
+class _Linger(object):
+    """[Internal] Keeps sending what a disconnected server connection had
+    left to send, then closes its socket; gives up after timeout seconds
+    """
+
+    def __init__(self, irclibobj, sock, ssl, buf, ssl_retry, timeout):
+        self.irclibobj = irclibobj
+        self.sock = sock
+        self.ssl = ssl
+        self.buf = buf
+        self.ssl_retry = ssl_retry
+        irclibobj._add_socket(sock, self)
+        irclibobj._set_writable(sock, True)
+        self.timer = irclibobj.execute_delayed(timeout, self.close)
+
+    def flush(self):
+        try:
+            self.ssl_retry = _send_buffer(self.sock, self.ssl, self.buf,
+                    self.ssl_retry)
+        except socket.error:
+            self.close()
+            return
+
+        if not self.buf:
+            self.close()
+
+    def process_data(self):
+        # Nobody is listening any more, but a hangup ends the wait
+        try:
+            data = (self.ssl or self.sock).recv(2 ** 14)
+        except socket.error, x:
+            if _would_block(x):
+                return
+            data = ""
+        if not data:
+            self.close()
+
+    def close(self):
+        if self.sock is None:
+            return
+
+        self.timer.cancel()
+        self.irclibobj._remove_socket(self.sock)
+        try:
+            self.sock.close()
+        except socket.error:
+            pass
+        self.sock = self.ssl = None
+
+
+def _send_buffer(sock, ssl, buf, ssl_retry):
+    """[Internal] Send as much of a bytearray as the socket will take
+    without blocking, and remove it from the bytearray
+
+    Returns the size an unfinished SSL write has to be retried with (a
+    retried SSL write must be given the same data).  Raises socket.error
+    if the connection has failed.
+    """
+    while buf:
+        size = 0
+        try:
+            if ssl:
+                size = ssl_retry or min(len(buf), 2 ** 14)
+                sent = ssl.write(buffer(buf, 0, size))
+                ssl_retry = 0
+            else:
+                sent = sock.send(buf)
+        except socket.error, x:
+            if not _would_block(x):
+                raise
+            return size
+
+        del buf[:sent]
+
+    return 0
+
+
+def _interleave(addresses):
+    """[Internal] Turn getaddrinfo() results into (family, address)
+    pairs, alternating between the address families while keeping the
+    resolver's order within each
+    """
+    families = collections.OrderedDict()
+    for family, _type, _proto, _name, address in addresses:
+        families.setdefault(family, []).append((family, address))
+
+    return [pair for pairs in itertools.izip_longest(*families.values())
+            for pair in pairs if pair is not None]
+
+
+def _would_block(exc):
+    """[Internal] Whether a socket or SSL error just means the operation
+    should be retried when the socket is ready
+    """
+    if _ssl is not None and isinstance(exc, _ssl.SSLError):
+        return exc.args[0] in (_ssl.SSL_ERROR_WANT_READ,
+                _ssl.SSL_ERROR_WANT_WRITE)
+    return exc.args[0] in (errno.EAGAIN, errno.EWOULDBLOCK)
+
+
+# (server, port) -> last SSL session, where the ssl module can resume them
+_ssl_sessions = {}
+_ssl_context = None
+
+
+def _get_ssl_context():
+    """[Internal] Return the SSL context shared by every connection
+
+    Like the ssl.wrap_socket() defaults it replaces, it does not verify
+    server certificates.
+    """
+    global _ssl_context
+    if _ssl_context is None:
+        context = _ssl.SSLContext(_ssl.PROTOCOL_SSLv23)
+        context.options |= _ssl.OP_NO_SSLv2 | _ssl.OP_NO_SSLv3
+        _ssl_context = context
+    return _ssl_context
+
+
 class DCCConnectionError(IRCError):
     pass
 
@@ -927,8 +1810,7 @@ class DCCConnection(Connection):
         except socket.error, x:
             raise DCCConnectionError("Couldn't connect to socket: %s" % x)
         self.connected = 1
-        if self.irclibobj.fn_to_add_socket:
-            self.irclibobj.fn_to_add_socket(self.socket)
+        self.irclibobj._add_socket(self.socket, self)
         return self
 
     def listen(self):
@@ -951,6 +1833,7 @@ class DCCConnection(Connection):
             self.socket.listen(10)
         except socket.error, x:
             raise DCCConnectionError("Couldn't bind socket: %s" % x)
+        self.irclibobj._add_socket(self.socket, self)
         return self
 
     def disconnect(self, message=""):
@@ -964,6 +1847,7 @@ class DCCConnection(Connection):
             return
 
         self.connected = 0
+        self.irclibobj._remove_socket(self.socket)
         try:
             self.socket.close()
         except socket.error, x:
@@ -979,9 +1863,11 @@ class DCCConnection(Connection):
 
         if self.passive and not self.connected:
             conn, (self.peeraddress, self.peerport) = self.socket.accept()
+            self.irclibobj._remove_socket(self.socket)
             self.socket.close()
             self.socket = conn
             self.connected = 1
+            self.irclibobj._add_socket(self.socket, self)
             if DEBUG:
                 print "DCC connection from %s:%d" % (
                     self.peeraddress, self.peerport)
@@ -1062,7 +1948,12 @@ class SimpleIRCClient:
     (which is done when the server sends a JOIN messsage/command),
     on_privmsg will be called for "privmsg" events, and so on.  The
     handler methods get two arguments: the connection object (same as
-    self.connection) and the event object.
+    self.connection) and the event object.  The on_* methods are looked
+    up once per class, so they have to be defined on the class.
+
+    Several clients can share one IRC instance, so that a single
+    process_forever loop runs all of their connections; each client
+    then only sees the events of its own connections.
 
     Instance attributes that can be used by sub classes:
 
@@ -1073,19 +1964,44 @@ class SimpleIRCClient:
         dcc_connections -- A list of DCCConnection instances.
     """
 
-    def __init__(self):
-        self.ircobj = IRC()
+    def __init__(self, ircobj=None):
+        """Constructor of SimpleIRCClient objects.
+
+        Arguments:
+
+            ircobj -- An IRC instance to share with other clients, or
+                      None to create one for this client alone.
+        """
+        shared = ircobj is not None
+        self.ircobj = ircobj or IRC()
         self.connection = self.ircobj.server()
         self.dcc_connections = []
-        self.ircobj.add_global_handler("all_events", self._dispatcher, -10)
-        self.ircobj.add_global_handler(
-            "dcc_disconnect", self._dcc_disconnect, -10)
+        self._global_handlers = []
+        methods = _get_on_methods(self.__class__)
+        for eventtype, name in methods + (("dcc_disconnect",
+                "_dcc_disconnect"),):
+            handler = getattr(self, name)
+            if shared:
+                handler = self._own_events(handler)
+            self.ircobj.add_global_handler(eventtype, handler, -10)
+            self._global_handlers.append((eventtype, handler))
 
-    def _dispatcher(self, c, e):
-        """[Internal]"""
-        m = "on_" + e.eventtype()
-        if hasattr(self, m):
-            getattr(self, m)(c, e)
+    def close(self):
+        """Stop handling events and close the connection for good.
+
+        Mostly of use to clients that share their IRC instance.
+        """
+        for eventtype, handler in self._global_handlers:
+            self.ircobj.remove_global_handler(eventtype, handler)
+        self._global_handlers = []
+        self.connection.close()
+
+    def _own_events(self, handler):
+        """[Internal] Wrap a handler to skip other clients' events"""
+        def own_events(c, e):
+            if c is self.connection or c in self.dcc_connections:
+                return handler(c, e)
+        return own_events
 
     def _dcc_disconnect(self, c, e):
         self.dcc_connections.remove(c)
@@ -1115,7 +2031,8 @@ class SimpleIRCClient:
 
             ssl -- Enable support for ssl.
 
-            ipv6 -- Enable support for ipv6.
+            ipv6 -- Race the server's IPv6 and IPv4 addresses, rather
+                    than only trying IPv4.
 
         This function can be called to reconnect a closed connection.
         """
@@ -1154,10 +2071,60 @@ class SimpleIRCClient:
         self.ircobj.process_forever()
 
 
-class Event:
-    """Class representing an IRC event."""
+class NickMask(str):
+    """The source of an event: a nick mask, or a server name.
+
+    The nick, user and host parts are split out the first time one of
+    them is used, and kept for every later use.
+    """
+
+    @property
+    def nick(self):
+        """The nick part."""
+        return self._split()[0]
+
+    @property
+    def nickuser(self):
+        """The nick!user part."""
+        return self._split()[1]
 
-    def __init__(self, eventtype, source, target, arguments=None):
+    @property
+    def userhost(self):
+        """The user@host part."""
+        return self._split()[2]
+
+    @property
+    def user(self):
+        """The user part."""
+        return self._split()[3]
+
+    @property
+    def host(self):
+        """The host part."""
+        return self._split()[4]
+
+    def _split(self):
+        """[Internal]"""
+        try:
+            return self._parts
+        except AttributeError:
+            nick, _sep, userhost = self.partition("!")
+            user, _sep, host = userhost.partition("@")
+            self._parts = (nick, self.split("@", 1)[0], userhost, user,
+                           host)
+            return self._parts
+
+
+class Event(object):
+    """Class representing an IRC event.
+
+    The parts of an event are available as the attributes type,
+    nickmask, to, args and tags, or through the accessor methods.
+    """
+
+    __slots__ = ("type", "nickmask", "to", "args", "tags")
+
+    def __init__(self, eventtype, source, target, arguments=None, tags=None):
         """Constructor of Event objects.
 
         Arguments:
@@ -1169,30 +2136,32 @@ class Event:
             target -- The target of the event (a nick or a channel).
 
             arguments -- Any event specific arguments.
+
+            tags -- The IRCv3 message tags of the line, if any.
         """
-        self._eventtype = eventtype
-        self._source = source
-        self._target = target
-        if arguments:
-            self._arguments = arguments
-        else:
-            self._arguments = []
+        if source.__class__ is str:
+            source = NickMask(source)
+        self.type = eventtype
+        self.nickmask = source
+        self.to = target
+        self.args = arguments or []
+        self.tags = tags or {}
 
     def eventtype(self):
         """Get the event type."""
-        return self._eventtype
+        return self.type
 
     def source(self):
-        """Get the event source."""
-        return self._source
+        """Get the event source (a NickMask, or None)."""
+        return self.nickmask
 
     def target(self):
         """Get the event target."""
-        return self._target
+        return self.to
 
     def arguments(self):
         """Get the event arguments."""
-        return self._arguments
+        return self.args
 
 _LOW_LEVEL_QUOTE = "\020"
 _CTCP_LEVEL_QUOTE = "\134"
@@ -1212,15 +2181,7 @@ def mask_matches(nick, mask):
 
     Returns true if the nick matches, otherwise false.
     """
-    nick = irc_lower(nick)
-    mask = irc_lower(mask)
-    mask = mask.replace("\\", "\\\\")
-    for ch in ".$|[](){}+":
-        mask = mask.replace(ch, "\\" + ch)
-    mask = mask.replace("?", ".")
-    mask = mask.replace("*", ".*")
-    r = re.compile(mask, re.IGNORECASE)
-    return r.match(nick)
+    return hostmask.matches(mask, nick)
 
 _special = "-[]\\`^{}"
 nick_characters = string.ascii_letters + string.digits + _special
@@ -1422,6 +2383,22 @@ def _ping_ponger(connection, event):
     """[Internal]"""
     connection.pong(event.target())
 
+
+# Client class -> ((event type, on_* method name), ...)
+_on_methods = {}
+
+
+def _get_on_methods(cls):
+    """[Internal] Find the event handling methods of a client class"""
+    try:
+        return _on_methods[cls]
+    except KeyError:
+        methods = tuple((name[3:], name) for name in dir(cls)
+                        if name.startswith("on_") and
+                        callable(getattr(cls, name)))
+        _on_methods[cls] = methods
+        return methods
+
 # Numeric table mostly stolen from the Perl IRC module (Net::IRC).
 numeric_events = {
     "001": "welcome",
@@ -0,0 +1,122 @@
+#   Copyright 2011 Josh Kearney
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""Pyhole IRC Line Parser"""
+
+
+_TAG_ESCAPES = {
+    ":": ";",
+    "s": " ",
+    "\\": "\\",
+    "r": "\r",
+    "n": "\n",
+}
+
+# Raw command -> lowercased, interned command name
+_commands = {}
+_MAX_COMMANDS = 1024
+
+
+def parse(line):
+    """Split a raw IRC line into (tags, prefix, command, params).
+
+    tags is a dict of IRCv3 message tags, or None if there are none.
+    prefix is None if the line has none.  command is lowercased and
+    interned.  params is None if the line has no parameters at all,
+    otherwise a list whose last item is the trailing parameter, if any.
+
+    Apart from the tags, this splits lines exactly as irclib's original
+    regular expression did.
+    """
+    tags = None
+    if line[:1] == "@":
+        space = line.find(" ")
+        if space < 0:
+            return parse_tags(line[1:]), None, "", None
+        tags = parse_tags(line[1:space])
+        line = line[space + 1:].lstrip(" ")
+
+    prefix = None
+    if line[:1] == ":":
+        space = line.find(" ")
+        if space > 1:
+            prefix = line[1:space]
+            line = line[space:].lstrip(" ")
+
+    space = line.find(" ")
+    if space < 0:
+        return tags, prefix, _command(line), None
+
+    command = _command(line[:space])
+    rest = line[space:]
+    args = rest.lstrip(" ")
+    if not args:
+        # A run of spaces with nothing after it
+        return tags, prefix, command, [] if len(rest) > 1 else None
+
+    if args[0] == ":":
+        return tags, prefix, command, [args[1:]]
+
+    trailing = args.find(" :")
+    if trailing < 0:
+        return tags, prefix, command, args.split()
+
+    params = args[:trailing].split()
+    params.append(args[trailing + 2:])
+    return tags, prefix, command, params
+
+
+def parse_tags(raw):
+    """Parse the IRCv3 message tags of a line (without the leading @)."""
+    tags = {}
+    for tag in raw.split(";"):
+        if not tag:
+            continue
+
+        key, _sep, value = tag.partition("=")
+        if "\\" in value:
+            value = unescape_tag_value(value)
+        tags[key] = value
+
+    return tags
+
+
+def unescape_tag_value(value):
+    """Undo IRCv3 message tag value escaping."""
+    chunks = value.split("\\")
+    unescaped = [chunks[0]]
+    chunks = iter(chunks[1:])
+    for chunk in chunks:
+        if chunk:
+            unescaped.append(_TAG_ESCAPES.get(chunk[0], chunk[0]))
+            unescaped.append(chunk[1:])
+        else:
+            # An escaped backslash, or a lone one at the very end
+            following = next(chunks, None)
+            if following is not None:
+                unescaped.append("\\")
+                unescaped.append(following)
+
+    return "".join(unescaped)
+
+
+def _command(raw):
+    """[Internal] Return the lowercased, interned name of a command"""
+    try:
+        return _commands[raw]
+    except KeyError:
+        command = intern(raw.lower())
+        if len(_commands) < _MAX_COMMANDS:
+            _commands[raw] = command
+        return command
@@ -14,14 +14,177 @@
 
 """Pyhole Logging"""
 
+import atexit
 import logging
 import logging.handlers
+import os
+
+from eventlet import patcher
 
 import utils
 
 
+# The writer runs on a real OS thread, so it needs the unpatched modules
+_queue = patcher.original("Queue")
+_threading = patcher.original("threading")
+
+_loggers = {}
+_console = None
+_writer = None
+
+
+class LogWriter(object):
+    """Writes log records from a bounded queue on a background OS thread.
+
+    Records are handed over without blocking, and written and flushed in
+    batches.  When the queue is full new records are dropped and counted,
+    so a stalled disk never holds up the event loop.
+    """
+
+    def __init__(self, queue_size=10000, batch_size=100):
+        self.queue = _queue.Queue(queue_size)
+        self.batch_size = batch_size
+        self.pid = os.getpid()
+        self.counters = dict.fromkeys(("queued", "dropped", "written"), 0)
+        self.thread = _threading.Thread(target=self._run,
+                name="pyhole-log-writer")
+        self.thread.daemon = True
+        self.thread.start()
+
+    def put(self, handlers, record):
+        """Queue a record for the given handlers, or drop it if full."""
+        try:
+            self.queue.put_nowait((handlers, record))
+        except _queue.Full:
+            self.counters["dropped"] += 1
+        else:
+            self.counters["queued"] += 1
+
+    def stop(self, timeout=5):
+        """Write out whatever is queued and stop the writer thread."""
+        try:
+            self.queue.put((None, None), timeout=timeout)
+        except _queue.Full:
+            return
+
+        self.thread.join(timeout)
+
+    def stats(self):
+        """Return the counters along with the current queue depth."""
+        stats = dict(self.counters)
+        stats["waiting"] = self.queue.qsize()
+        return stats
+
+    def _run(self):
+        """[Internal]"""
+        while True:
+            batch = [self.queue.get()]
+            try:
+                while len(batch) < self.batch_size:
+                    batch.append(self.queue.get_nowait())
+            except _queue.Empty:
+                pass
+
+            written = set()
+            for handlers, record in batch:
+                if handlers is None:
+                    self._sync(written)
+                    return
+
+                for handler in handlers:
+                    handler.handle(record)
+                    written.add(handler)
+
+            self.counters["written"] += len(batch)
+            self._sync(written)
+
+    def _sync(self, handlers):
+        """[Internal]"""
+        for handler in handlers:
+            handler.sync()
+
+
+class _WriterHandler(object):
+    """[Internal] A handler driven by the writer thread, which flushes it
+    once per batch instead of once per record
+    """
+
+    def createLock(self):
+        self.lock = _threading.RLock()
+
+    def flush(self):
+        pass
+
+    def sync(self):
+        super(_WriterHandler, self).flush()
+
+
+class FileHandler(_WriterHandler, logging.handlers.TimedRotatingFileHandler):
+    """A log file rotated at midnight."""
+    pass
+
+
+class ConsoleHandler(_WriterHandler, logging.StreamHandler):
+    """Log output to stderr."""
+    pass
+
+
+class QueueHandler(logging.Handler):
+    """Hands records over to the writer thread for its handlers."""
+
+    def __init__(self, handlers):
+        logging.Handler.__init__(self)
+        self.handlers = tuple(handlers)
+
+    def emit(self, record):
+        _get_writer().put(self.handlers, record)
+
+
+def _get_writer():
+    """[Internal] Return the writer, starting one in a new process"""
+    global _writer
+    if _writer is None or _writer.pid != os.getpid():
+        if _writer is not None:
+            # Forked while the parent's writer thread may have been
+            # holding handler locks
+            for logger in _loggers.values():
+                for queue_handler in logger.handlers:
+                    for handler in getattr(queue_handler, "handlers", ()):
+                        handler.createLock()
+        _writer = LogWriter()
+
+    return _writer
+
+
+def _stop_writer():
+    """[Internal]"""
+    if _writer is not None and _writer.pid == os.getpid():
+        _writer.stop()
+
+
+atexit.register(_stop_writer)
+
+
+def shutdown():
+    """Write out the queued records and stop the writer thread
+
+    Processes that leave through os._exit() skip the atexit hook, and
+    have to call this themselves.
+    """
+    _stop_writer()
+
+
+def stats():
+    """Return the log writer counters"""
+    return _get_writer().stats()
+
+
 def get_logger(name="Pyhole"):
     """Log handler"""
+    global _console
+    if name in _loggers:
+        return _loggers[name]
+
     debug_option = utils.get_option("debug")
     debug_config = utils.get_config().get("debug", type="bool")
     debug = debug_option or debug_config
@@ -33,12 +196,23 @@ def get_logger(name="Pyhole"):
 
     logging.basicConfig(level=log_level, format=log_format,
             datefmt=log_datefmt)
+    formatter = logging.Formatter(log_format, log_datefmt)
+
+    if _console is None:
+        _console = ConsoleHandler()
+        _console.setLevel(log_level)
+        _console.setFormatter(formatter)
 
-    log = logging.handlers.TimedRotatingFileHandler("%s/%s.log" % (log_dir,
-            name.lower()), "midnight")
+    log = FileHandler("%s/%s.log" % (log_dir, name.lower()), "midnight")
     log.setLevel(log_level)
-    formatter = logging.Formatter(log_format, log_datefmt)
     log.setFormatter(formatter)
-    logging.getLogger(name).addHandler(log)
 
-    return logging.getLogger(name)
+    handler = QueueHandler((_console, log))
+    handler.setLevel(log_level)
+
+    logger = logging.getLogger(name)
+    logger.addHandler(handler)
+    logger.propagate = False
+    _loggers[name] = logger
+
+    return logger
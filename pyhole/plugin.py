@@ -16,6 +16,9 @@
 
 import functools
 import os
+import re
+import sre_constants
+import sre_parse
 import sys
 import time
 
@@ -27,6 +30,9 @@ LOG = log.get_logger()
 
 _plugin_instances = []
 _plugin_hooks = {}
+_command_index = {}
+_keyword_trie = {}
+_msg_regex_set = []
 
 
 def _reset_variables():
@@ -35,9 +41,15 @@ def _reset_variables():
     """
     global _plugin_instances
     global _plugin_hooks
+    global _command_index
+    global _keyword_trie
+    global _msg_regex_set
 
     _plugin_instances = []
     _plugin_hooks = {}
+    _command_index = {}
+    _keyword_trie = {}
+    _msg_regex_set = []
 
     for x in _hook_names:
         _plugin_hooks[x] = []
@@ -50,12 +62,15 @@ def hook_add(hookname, arg, poll_timer=60):
     """
     def wrap(f):
         if hookname == "poll":
-            @utils.spawn
-            def _f(self, *args, **kwargs):
+            def _poll(self, *args, **kwargs):
                 while True:
                     f(self, *args, **kwargs)
                     time.sleep(poll_timer)
 
+            # Polls run forever, so they must not hold an executor slot
+            _poll._skip_queue = True
+            _f = utils.spawn(_poll)
+
             setattr(_f, "_is_%s_hook" % hookname, True)
             _f._hook_arg = arg
 
@@ -86,6 +101,101 @@ def active_get(hookname):
     return [x[2] for x in _plugin_hooks[hookname]]
 
 
+def hook_find_command(name):
+    """Function to return the command hooks registered under a name.  The
+    lookup is case-insensitive and is served from an index that is only
+    rebuilt when plugins are loaded or reloaded
+    """
+    return _command_index.get(name.lower(), [])
+
+
+def hook_match_keywords(message):
+    """Function to find the keyword hooks a message triggers.  Every word
+    is walked once through a prefix trie of all keywords, yielding a
+    (hook, suffix) pair for each keyword the word starts with
+    """
+    if not _keyword_trie:
+        return
+
+    for word in message.split(" "):
+        node = _keyword_trie
+        for i, char in enumerate(word.lower()):
+            node = node.get(char)
+            if node is None:
+                break
+
+            # Hooks are stored under the None key of the node where their
+            # keyword ends, and only match if something follows it
+            if None in node and i + 1 < len(word):
+                for hook in node[None]:
+                    yield hook, word[i + 1:]
+
+
+def hook_match_msg_regexs(message):
+    """Function to find the msg_regex hooks a message triggers.  The
+    compiled regexes only run when the message contains one of the
+    literals their pattern requires, yielding a (hook, match) pair for
+    each one that matches
+    """
+    if not _msg_regex_set:
+        return
+
+    lower_message = message.lower()
+    for hook, regex, literals in _msg_regex_set:
+        if literals:
+            for literal in literals:
+                if literal in lower_message:
+                    break
+            else:
+                continue
+
+        match = regex.search(message)
+        if match:
+            yield hook, match
+
+
+def _longest_literal(pattern):
+    """Local function to find the longest run of plain characters that
+    a parsed pattern always has to match
+    """
+    longest = ""
+    run = ""
+    for op, arg in pattern:
+        if op == sre_constants.LITERAL and arg < 128:
+            run += chr(arg)
+        else:
+            longest = max(longest, run, key=len)
+            run = ""
+
+    return max(longest, run, key=len).lower()
+
+
+def _required_literals(msg_regex):
+    """Local function to build the prefilter for a msg_regex hook.  A
+    message can only match if it contains one of the returned literals.
+    None means the pattern has no usable literal and always has to run
+    """
+    try:
+        pattern = sre_parse.parse(msg_regex)
+    except Exception:
+        return None
+
+    # A top-level alternation needs a literal out of every branch
+    if len(pattern) == 1 and pattern[0][0] == sre_constants.BRANCH:
+        branches = pattern[0][1][1]
+    else:
+        branches = [pattern]
+
+    literals = []
+    for branch in branches:
+        literal = _longest_literal(branch)
+        if not literal:
+            return None
+        literals.append(literal)
+
+    return tuple(literals)
+
+
 _hook_names = ["keyword", "command", "msg_regex", "poll"]
 _reset_variables()
 _this_mod = sys.modules[__name__]
@@ -146,8 +256,25 @@ def _init_plugins(*args, **kwargs):
                 if getattr(attr, "_is_%s_hook" % hook_key, False):
                     hook_arg = getattr(attr, "_hook_arg", None)
                     # Append (module, method, arg) tuple
-                    _plugin_hooks[hook_key].append((attr.__module__, attr,
-                            hook_arg))
+                    hook = (attr.__module__, attr, hook_arg)
+                    _plugin_hooks[hook_key].append(hook)
+
+                    if hook_key == "command":
+                        _command_index.setdefault(hook_arg.lower(),
+                                []).append(hook)
+                    elif hook_key == "keyword":
+                        node = _keyword_trie
+                        for char in hook_arg.lower():
+                            node = node.setdefault(char, {})
+                        node.setdefault(None, []).append(hook)
+                    elif hook_key == "msg_regex":
+                        try:
+                            regex = re.compile(hook_arg, re.I)
+                        except re.error, exc:
+                            LOG.error(exc)
+                            continue
+                        _msg_regex_set.append((hook, regex,
+                                _required_literals(hook_arg)))
 
 
 def load_user_plugin(plugin, *args, **kwargs):
@@ -165,19 +292,25 @@ def load_user_plugin(plugin, *args, **kwargs):
                     LOG.error(exc)
 
 
-def load_plugins(*args, **kwargs):
-    """Module function that loads plugins from a particular directory"""
+def import_plugins():
+    """Module function that imports the configured plugin modules without
+    creating any plugin instances
+    """
     config = utils.get_config()
     plugin_names = config.get("plugins", type="list")
 
     for plugin_name in plugin_names:
-        load_user_plugin(plugin_name, *args, **kwargs)
+        load_user_plugin(plugin_name)
 
         try:
             __import__("pyhole.plugins", globals(), locals(), [plugin_name])
         except Exception, exc:
             LOG.error(exc)
 
+
+def load_plugins(*args, **kwargs):
+    """Module function that loads plugins from a particular directory"""
+    import_plugins()
     _init_plugins(*args, **kwargs)
 
 
@@ -17,6 +17,7 @@
 import sys
 
 from pyhole import irc
+from pyhole import log
 from pyhole import plugin
 from pyhole import utils
 
@@ -103,6 +104,23 @@ class Admin(plugin.Plugin):
         self.irc.log.info("Disconnecting")
         sys.exit(0)
 
+    @plugin.hook_add_command("stats")
+    @utils.admin
+    def stats(self, params=None, **kwargs):
+        """Display runtime counters (ex: .stats)"""
+        self.irc.reply("Executor: %s" % self._format_stats(
+                utils.get_executor().stats()))
+        self.irc.reply("HTTP cache: %s" % self._format_stats(
+                utils.get_http_cache().stats()))
+        self.irc.reply("Log: %s" % self._format_stats(log.stats()))
+        self.irc.reply("Outbound: %d bytes queued" %
+                self.irc.connection.send_queue_size())
+        self.irc.reply("Flood control: %s" % self._format_stats(
+                self.irc.flood_control.stats()))
+        memory = utils.get_memory_usage()
+        if memory is not None:
+            self.irc.reply("Memory (kB): %s" % self._format_stats(memory))
+
     @plugin.hook_add_command("say")
     @utils.admin
     def say(self, params=None, **kwargs):
@@ -113,6 +131,10 @@ class Admin(plugin.Plugin):
         else:
             self.irc.reply(self.say.__doc__)
 
+    def _format_stats(self, stats):
+        """Format a dict of counters for display"""
+        return ", ".join("%s=%d" % stat for stat in sorted(stats.items()))
+
     def _find_doc_string(self, params):
         """Find the doc string for a plugin, command or keyword hook"""
         for p in plugin.active_plugin_classes():
@@ -65,15 +65,9 @@ class Launchpad(plugin.Plugin):
             if not params:
                 return
 
-            try:
-                bug = self.launchpad.bugs[params]
-                task = bug.bug_tasks[len(bug.bug_tasks) - 1]
-
-                self.irc.reply("LP %s [Status: %s, Assignee: %s] %s" % (
-                        task.title, task.status,
-                        self._find_name(task.assignee_link), bug.web_link))
-            except Exception:
-                return
+            bug = self._fetch_bug(params)
+            if bug:
+                self.irc.reply("LP %s [Status: %s, Assignee: %s] %s" % bug)
 
     @plugin.hook_add_msg_regex("https?:\/\/bugs\.launchpad\.net\/.*\/\+bug")
     def _watch_for_lp_bug_url(self, params=None, **kwargs):
@@ -99,6 +93,20 @@ class Launchpad(plugin.Plugin):
         except TypeError:
             return
 
+    @utils.coalesce
+    def _fetch_bug(self, bug_id):
+        """Lookup a Launchpad bug, sharing the request with concurrent
+        lookups of the same bug
+        """
+        try:
+            bug = self.launchpad.bugs[bug_id]
+            task = bug.bug_tasks[len(bug.bug_tasks) - 1]
+
+            return (task.title, task.status,
+                    self._find_name(task.assignee_link), bug.web_link)
+        except Exception:
+            return
+
     def _find_name(self, user):
         """Lookup a Launchpad user's display name"""
         try:
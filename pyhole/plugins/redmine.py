@@ -119,14 +119,8 @@ class Redmine(plugin.Plugin):
 
     def _find_issue(self, issue_id):
         """Find and display a Redmine issue"""
-        url = "%s/issues/%s.json" % (self.redmine_url, issue_id)
-        response = self.irc.fetch_url(url, self.name)
-        if not response:
-            return
-
-        try:
-            issue = json.loads(response.read())["issue"]
-        except Exception:
+        issue = self._fetch_issue(issue_id)
+        if not issue:
             return
 
         self.irc.reply("RM %s #%s: %s [Status: %s, Assignee: %s] "
@@ -135,3 +129,18 @@ class Redmine(plugin.Plugin):
                 issue["status"]["name"],
                 issue.get("assigned_to", {}).get("name", "N/A"),
                 self.redmine_domain, issue["id"]))
+
+    @utils.coalesce
+    def _fetch_issue(self, issue_id):
+        """Fetch a Redmine issue, sharing the request with concurrent
+        lookups of the same issue
+        """
+        url = "%s/issues/%s.json" % (self.redmine_url, issue_id)
+        response = self.irc.fetch_url(url, self.name)
+        if not response:
+            return
+
+        try:
+            return json.loads(response.read())["issue"]
+        except Exception:
+            return
@@ -108,6 +108,33 @@ class VersionOne(plugin.Plugin):
 
     def _find_asset(self, type, number):
         """Find and display a VersionOne object"""
+        asset = self._fetch_asset(type, number)
+        if not asset:
+            return
+
+        id, subject, number, status, owner = asset
+        msg = "V1 %s %s: %s" % (type, number, subject)
+
+        attrs = []
+        if status:
+            attrs.append("Status: %s" % status)
+        if type in ('Defect', 'Story'):
+            attrs.append("Assignee: %s" % owner)
+
+        if attrs:
+            msg += " [%s]" % ", ".join(attrs)
+
+        msg += " https://%s/%s/%s.mvc/Summary?oidToken=%s" % (
+                self.versionone_domain, self.versionone_key,
+                type, id)
+
+        self.irc.reply(msg)
+
+    @utils.coalesce
+    def _fetch_asset(self, type, number):
+        """Fetch a VersionOne object, sharing the request with concurrent
+        lookups of the same object
+        """
         url = "%s/Data/%s?where=Number='%s'" % (self.versionone_url,
                                                 type, number)
         response = self.irc.fetch_url(url, self.name)
@@ -130,19 +157,4 @@ class VersionOne(plugin.Plugin):
             traceback.print_exc()
             return
 
-        msg = "V1 %s %s: %s" % (type, number, subject)
-
-        attrs = []
-        if status:
-            attrs.append("Status: %s" % status)
-        if type in ('Defect', 'Story'):
-            attrs.append("Assignee: %s" % owner)
-
-        if attrs:
-            msg += " [%s]" % ", ".join(attrs)
-
-        msg += " https://%s/%s/%s.mvc/Summary?oidToken=%s" % (
-                self.versionone_domain, self.versionone_key,
-                type, id)
-
-        self.irc.reply(msg)
+        return id, subject, number, status, owner
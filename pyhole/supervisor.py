@@ -0,0 +1,362 @@
+#   Copyright 2011 Josh Kearney
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""Pyhole Process Supervisor"""
+
+import collections
+import errno
+import fcntl
+import random
+import signal
+import sys
+import time
+
+from eventlet import patcher
+
+import log
+
+
+# The supervisor waits on signals and pipes itself, outside of any
+# eventlet hub, so it needs the unpatched modules
+_os = patcher.original("os")
+_select = patcher.original("select")
+
+LOG = log.get_logger()
+
+# How often a child's event loop should beat its health pipe
+HEALTH_INTERVAL = 10
+
+
+def heartbeat(fd):
+    """Tell the supervisor that a child's event loop is still running."""
+    try:
+        _os.write(fd, ".")
+    except OSError, exc:
+        # The supervisor has not read the last beats yet
+        if exc.errno != errno.EAGAIN:
+            raise
+
+
+class Child(object):
+    """A supervised child process and its restart bookkeeping."""
+
+    def __init__(self, name):
+        self.name = name
+        self.pid = None
+        self.health = None
+        self.started = None
+        self.last_beat = None
+        self.failures = 0
+        self.restart_at = None
+
+
+class Supervisor(object):
+    """Runs target(name, health_fd) in a child process for every name, and
+    restarts the children when they die.
+
+    Exits are noticed as soon as they happen: SIGCHLD wakes the supervisor
+    through a self-pipe, and the children are reaped with waitpid.  A child
+    that ran for stable_after seconds is restarted at once; one that keeps
+    dying soon after starting is restarted after an exponential backoff
+    with jitter.  Children should call heartbeat(health_fd) from their
+    event loop at least every HEALTH_INTERVAL seconds; one that is silent
+    for health_timeout seconds is killed and restarted.  A child that
+    exits with status 0 asked to stop, and is not restarted.
+
+    SIGTERM and SIGINT stop the children with SIGTERM, and kill any that
+    are still running grace seconds later.
+    """
+
+    def __init__(self, target, names, min_backoff=1, max_backoff=300,
+            stable_after=60, health_timeout=6 * HEALTH_INTERVAL, grace=10):
+        self.target = target
+        self.children = collections.OrderedDict((name, Child(name))
+                for name in names)
+        self.min_backoff = min_backoff
+        self.max_backoff = max_backoff
+        self.stable_after = stable_after
+        self.health_timeout = health_timeout
+        self.grace = grace
+        self.pids = {}
+        self.health_fds = {}
+        self.stop_requested = False
+        self.stop_deadline = None
+        self.wakeup = None
+
+    def run(self):
+        """Start the children, and supervise them until all have stopped."""
+        self.wakeup = _os.pipe()
+        for fd in self.wakeup:
+            _set_nonblocking(fd)
+
+        handlers = {}
+        for signum, handler in ((signal.SIGCHLD, self._wake),
+                (signal.SIGTERM, self._stop), (signal.SIGINT, self._stop)):
+            handlers[signum] = signal.signal(signum, handler)
+        signal.set_wakeup_fd(self.wakeup[1])
+
+        try:
+            for child in self.children.values():
+                self._start(child)
+
+            while self.pids or self._restarts_pending():
+                self._wait(self._timeout())
+                self._reap()
+                if self.stop_requested:
+                    self.stop()
+                self._check(time.time())
+        finally:
+            signal.set_wakeup_fd(-1)
+            for signum, handler in handlers.items():
+                signal.signal(signum, handler)
+            for fd in self.wakeup:
+                _os.close(fd)
+
+    def stop(self):
+        """Stop every child and let run() return once they are gone."""
+        if self.stop_deadline is not None:
+            return
+
+        LOG.info("Stopping %d network processes", len(self.pids))
+        self.stop_deadline = time.time() + self.grace
+        for pid in self.pids:
+            _kill(pid, signal.SIGTERM)
+
+    def _start(self, child):
+        """[Internal]"""
+        child.restart_at = None
+        health_r, health_w = _os.pipe()
+        try:
+            pid = _os.fork()
+        except OSError, exc:
+            _os.close(health_r)
+            _os.close(health_w)
+            LOG.error("Unable to start %s: %s", child.name, exc)
+            self._schedule_restart(child, time.time())
+            return
+
+        if pid == 0:
+            _os.close(health_r)
+            self._run_child(child, health_w)
+
+        _os.close(health_w)
+        _set_nonblocking(health_r)
+        child.pid = pid
+        child.health = health_r
+        child.started = child.last_beat = time.time()
+        self.pids[pid] = child
+        self.health_fds[health_r] = child
+        LOG.info("Started %s (pid %d)", child.name, pid)
+
+    def _run_child(self, child, health_fd):
+        """[Internal] Run the target in a freshly forked child; never
+        returns
+        """
+        status = 1
+        try:
+            signal.set_wakeup_fd(-1)
+            signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+            signal.signal(signal.SIGINT, signal.default_int_handler)
+            signal.signal(signal.SIGTERM, _terminate)
+            for fd in list(self.wakeup) + list(self.health_fds):
+                _os.close(fd)
+            _set_nonblocking(health_fd)
+
+            self.target(child.name, health_fd)
+            status = 0
+        except KeyboardInterrupt:
+            status = 0
+        except SystemExit, exc:
+            status = exc.code
+            if not isinstance(status, int):
+                status = 0 if status is None else 1
+        except Exception, exc:
+            LOG.exception(exc)
+        finally:
+            log.shutdown()
+            _os._exit(status)
+
+    def _wait(self, timeout):
+        """[Internal] Wait for a signal, a heartbeat or the timeout"""
+        fds = [self.wakeup[0]] + self.health_fds.keys()
+        try:
+            readable = _select.select(fds, [], [], timeout)[0]
+        except _select.error, exc:
+            if exc.args[0] != errno.EINTR:
+                raise
+            return
+
+        now = time.time()
+        for fd in readable:
+            if fd == self.wakeup[0]:
+                _drain(fd)
+                continue
+
+            child = self.health_fds[fd]
+            if _drain(fd):
+                child.last_beat = now
+            else:
+                # The child is on its way out; SIGCHLD will follow
+                del self.health_fds[fd]
+                _os.close(fd)
+                child.health = None
+
+    def _reap(self):
+        """[Internal] Collect every child that has exited"""
+        while self.pids:
+            try:
+                pid, status = _os.waitpid(-1, _os.WNOHANG)
+            except OSError, exc:
+                if exc.errno == errno.EINTR:
+                    continue
+                if exc.errno != errno.ECHILD:
+                    raise
+                break
+
+            if pid == 0:
+                break
+
+            child = self.pids.pop(pid, None)
+            if child is not None:
+                self._exited(child, status)
+
+    def _exited(self, child, status):
+        """[Internal]"""
+        if child.health is not None:
+            del self.health_fds[child.health]
+            _os.close(child.health)
+            child.health = None
+        child.pid = None
+
+        if _os.WIFEXITED(status):
+            code = _os.WEXITSTATUS(status)
+            reason = "exited with status %d" % code
+        else:
+            code = -_os.WTERMSIG(status)
+            reason = "was killed by signal %d" % -code
+
+        if code == 0 or self.stop_deadline is not None:
+            LOG.info("%s %s", child.name, reason)
+            return
+
+        now = time.time()
+        if now - child.started >= self.stable_after:
+            child.failures = 0
+        self._schedule_restart(child, now)
+        LOG.error("%s %s, restarting in %.1f seconds", child.name, reason,
+                child.restart_at - now)
+
+    def _schedule_restart(self, child, now):
+        """[Internal]"""
+        child.restart_at = now + self._backoff(child.failures)
+        child.failures += 1
+
+    def _backoff(self, failures):
+        """[Internal] Return how long to wait before a restart"""
+        if not failures:
+            return 0
+
+        delay = min(self.max_backoff, self.min_backoff * 2 ** (failures - 1))
+        return random.uniform(delay / 2.0, delay)
+
+    def _restarts_pending(self):
+        """[Internal]"""
+        if self.stop_deadline is not None:
+            return False
+
+        for child in self.children.values():
+            if child.restart_at is not None:
+                return True
+
+        return False
+
+    def _check(self, now):
+        """[Internal] Start due restarts, and kill hung or lingering
+        children
+        """
+        if self.stop_deadline is not None:
+            if now >= self.stop_deadline:
+                for pid in self.pids:
+                    _kill(pid, signal.SIGKILL)
+            return
+
+        for child in self.children.values():
+            if child.restart_at is not None and child.restart_at <= now:
+                self._start(child)
+            elif (child.pid is not None and
+                    now - child.last_beat >= self.health_timeout):
+                LOG.error("%s stopped responding, killing it", child.name)
+                _kill(child.pid, signal.SIGKILL)
+                child.last_beat = now
+
+    def _timeout(self):
+        """[Internal] Return how long to wait for the next thing to do"""
+        if self.stop_deadline is not None:
+            deadlines = [self.stop_deadline]
+        else:
+            deadlines = []
+            for child in self.children.values():
+                if child.restart_at is not None:
+                    deadlines.append(child.restart_at)
+                elif child.pid is not None:
+                    deadlines.append(child.last_beat + self.health_timeout)
+
+        if not deadlines:
+            return None
+        return max(0, min(deadlines) - time.time())
+
+    def _wake(self, signum, frame):
+        """[Internal] The wakeup fd does the work"""
+        pass
+
+    def _stop(self, signum, frame):
+        """[Internal] Leave the stopping to the main loop, as logging from
+        a signal handler can deadlock
+        """
+        self.stop_requested = True
+
+
+def _terminate(signum, frame):
+    """[Internal] Exit a child cleanly on SIGTERM"""
+    sys.exit(0)
+
+
+def _kill(pid, signum):
+    """[Internal]"""
+    try:
+        _os.kill(pid, signum)
+    except OSError, exc:
+        if exc.errno != errno.ESRCH:
+            raise
+
+
+def _set_nonblocking(fd):
+    """[Internal]"""
+    flags = fcntl.fcntl(fd, fcntl.F_GETFL)
+    fcntl.fcntl(fd, fcntl.F_SETFL, flags | _os.O_NONBLOCK)
+
+
+def _drain(fd):
+    """[Internal] Read everything waiting on a pipe, and return whether
+    it is still open
+    """
+    while True:
+        try:
+            data = _os.read(fd, 4096)
+        except OSError, exc:
+            if exc.errno in (errno.EAGAIN, errno.EINTR):
+                return True
+            raise
+        if not data:
+            return False
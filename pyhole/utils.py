@@ -22,37 +22,179 @@ import os
 import re
 
 from BeautifulSoup import BeautifulStoneSoup
+from eventlet import corolocal
 
+import cache
 import config
+import executor
+import httpclient
 import version
 
 
 eventlet.monkey_patch()
 
+_local = corolocal.local()
+_executor = None
+_http_client = None
+_http_cache = None
+_options = None
+_configs = {}
+
 
 def admin(func):
     """Administration Decorator"""
     def wrap(self, *args, **kwargs):
-        if self.irc.source in self.irc.admins:
+        if self.irc.is_admin():
             func(self, *args, **kwargs)
         else:
             self.irc.reply("Sorry, you are not authorized to do that.")
     wrap.__doc__ = func.__doc__
     wrap.__name__ = func.__name__
     wrap.__module__ = func.__module__
+    wrap._admin = True
     return wrap
 
 
 def spawn(func):
     """Greenthread Spawning Decorator"""
     def wrap(self, *args, **kwargs):
-        eventlet.spawn_n(func, self, *args, **kwargs)
+        args = (get_context(), func, self) + args
+        if getattr(func, "_skip_queue", False):
+            get_executor().bypass(_run_in_context, *args, **kwargs)
+        else:
+            get_executor().submit(getattr(self, "name", None),
+                    _run_in_context, *args, **kwargs)
+    wrap.__doc__ = func.__doc__
+    wrap.__name__ = func.__name__
+    wrap.__module__ = func.__module__
+    return wrap
+
+
+def coalesce(func):
+    """Request Coalescing Decorator
+
+    Concurrent calls of a method with the same arguments share one call and
+    all get its result.
+    """
+    flight = cache.SingleFlight()
+
+    def wrap(self, *args):
+        return flight.do((self, args), func, self, *args)
     wrap.__doc__ = func.__doc__
     wrap.__name__ = func.__name__
     wrap.__module__ = func.__module__
     return wrap
 
 
+def _run_in_context(context, func, *args, **kwargs):
+    """Run a spawned function with the context of the greenthread that
+    spawned it
+    """
+    set_context(context)
+    func(*args, **kwargs)
+
+
+def get_executor():
+    """Return the executor that runs spawned greenthreads"""
+    global _executor
+
+    if _executor is None:
+        pyhole_config = get_config()
+        _executor = executor.Executor(
+                pyhole_config.get("spawn_pool_size", type="int",
+                        default=100),
+                pyhole_config.get("spawn_queue_size", type="int",
+                        default=200),
+                pyhole_config.get("spawn_plugin_limit", type="int",
+                        default=20))
+
+    return _executor
+
+
+def get_http_client():
+    """Return the HTTP client shared by all plugins"""
+    global _http_client
+
+    if _http_client is None:
+        pyhole_config = get_config()
+        _http_client = httpclient.HTTPClient(version.version_string(),
+                connect_timeout=pyhole_config.get("http_connect_timeout",
+                        type="int", default=5),
+                read_timeout=pyhole_config.get("http_read_timeout",
+                        type="int", default=15),
+                max_size=pyhole_config.get("http_max_response_size",
+                        type="int", default=2 ** 20))
+
+    return _http_client
+
+
+def get_http_cache():
+    """Return the response cache in front of the shared HTTP client"""
+    global _http_cache
+
+    if _http_cache is None:
+        pyhole_config = get_config()
+
+        # Per-plugin TTLs are listed as <plugin>:<seconds>
+        ttls = {}
+        for ttl in pyhole_config.get("http_cache_ttls", type="list",
+                default=[]):
+            name, _sep, seconds = ttl.partition(":")
+            seconds = ensure_int(seconds)
+            if seconds is not None:
+                ttls[name.strip()] = seconds
+
+        _http_cache = cache.ResponseCache(get_http_client(),
+                max_entries=pyhole_config.get("http_cache_size", type="int",
+                        default=256),
+                default_ttl=pyhole_config.get("http_cache_ttl", type="int",
+                        default=60),
+                ttls=ttls)
+
+    return _http_cache
+
+
+def get_context():
+    """Return the hook context of the current greenthread"""
+    return getattr(_local, "context", None)
+
+
+def set_context(context):
+    """Set the hook context of the current greenthread and return the
+    previous one
+    """
+    previous = get_context()
+    _local.context = context
+    return previous
+
+
+def get_memory_usage(pid="self"):
+    """Return the rss, pss, shared and private memory of a process in kB,
+    or None if /proc does not have it
+    """
+    fields = {
+        "Rss": "rss",
+        "Pss": "pss",
+        "Shared_Clean": "shared",
+        "Shared_Dirty": "shared",
+        "Private_Clean": "private",
+        "Private_Dirty": "private",
+    }
+    usage = dict.fromkeys(fields.values(), 0)
+    for name in ("smaps_rollup", "smaps"):
+        try:
+            with open("/proc/%s/%s" % (pid, name)) as smaps:
+                for line in smaps:
+                    field, _sep, value = line.partition(":")
+                    if field in fields:
+                        usage[fields[field]] += int(value.split()[0])
+            return usage
+        except (IOError, ValueError):
+            continue
+
+    return None
+
+
 def decode_entities(html):
     """Strip HTML entities from a string and make it printable"""
     html = re.sub("\n", "", html)
@@ -86,8 +228,12 @@ def build_options():
 
 def get_option(option):
     """Retrive an option from the command line."""
-    options, _args = build_options()
-    return vars(options).get(option)
+    global _options
+    if _options is None:
+        options, _args = build_options()
+        _options = vars(options)
+
+    return _options.get(option)
 
 
 def get_home_directory():
@@ -122,7 +268,12 @@ def get_conf_file():
 
 def get_config(section="Pyhole"):
     """Return the default config object"""
-    return config.Config(get_conf_file(), section)
+    path = get_conf_file()
+    try:
+        return _configs[(path, section)]
+    except KeyError:
+        conf = _configs[(path, section)] = config.Config(path, section)
+        return conf
 
 
 def write_file(directory, file_name, data):
@@ -151,10 +302,13 @@ def generate_config():
 admins: nick!ident, nick2!ident
 command_prefix: .
 reconnect_delay: 60
+max_reconnect_delay: 600
 rejoin_delay: 5
+nick_regain_delay: 60
 debug: False
 plugins: admin, calculator, search, urls
 networks: FreeNode, EFnet
+single_process: False
 
 [Wunderground]
 key: abcd1234
@@ -172,7 +326,7 @@ password: abcd1234
 # IRC Network Configuration
 
 [FreeNode]
-server: verne.freenode.net
+server: verne.freenode.net, chat.freenode.net:6697
 username:
 password:
 port: 7000
@@ -0,0 +1,134 @@
+#   Copyright 2011 Josh Kearney
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""Pyhole Response Cache Unit Tests"""
+
+import eventlet
+import greenlet
+import unittest
+
+from eventlet import event
+
+from pyhole import cache
+from pyhole import httpclient
+
+
+class FakeClient(object):
+    def __init__(self):
+        self.requests = []
+        self.responses = {}
+        self.gate = None
+
+    def fetch(self, url, headers=None):
+        self.requests.append((url, headers))
+        if self.gate:
+            self.gate.wait()
+        status, headers, body = self.responses[url]
+        return httpclient.Response(url, status, "", headers, body)
+
+
+class TestResponseCache(unittest.TestCase):
+    def setUp(self):
+        self.client = FakeClient()
+        self.cache = cache.ResponseCache(self.client, max_entries=2,
+                default_ttl=60, ttls={"Short": -1})
+
+    def test_hit(self):
+        self.client.responses["a"] = (200, {}, "a")
+        self.assertEqual(self.cache.fetch("a").read(), "a")
+        self.assertEqual(self.cache.fetch("a").read(), "a")
+        self.assertEqual(len(self.client.requests), 1)
+        self.assertEqual(self.cache.stats()["hits"], 1)
+
+    def test_plugin_ttl(self):
+        self.client.responses["a"] = (200, {}, "a")
+        self.cache.fetch("a", "Short")
+        self.cache.fetch("a", "Short")
+        self.assertEqual(len(self.client.requests), 2)
+
+    def test_no_store(self):
+        self.client.responses["a"] = (200, {"Cache-Control": "no-store"}, "a")
+        self.cache.fetch("a")
+        self.assertEqual(self.cache.stats()["entries"], 0)
+
+    def test_not_ok(self):
+        self.client.responses["a"] = (404, {}, "a")
+        self.cache.fetch("a")
+        self.assertEqual(self.cache.stats()["entries"], 0)
+
+    def test_revalidate(self):
+        self.client.responses["a"] = (200, {"Cache-Control": "max-age=0",
+                "ETag": "\"1\""}, "a")
+        self.cache.fetch("a")
+        self.client.responses["a"] = (304, {}, "")
+        self.assertEqual(self.cache.fetch("a").read(), "a")
+        self.assertEqual(self.client.requests[1][1],
+                {"If-None-Match": "\"1\""})
+        self.assertEqual(self.cache.stats()["revalidated"], 1)
+
+    def test_expires(self):
+        self.client.responses["a"] = (200, {
+                "Expires": "Thu, 01 Jan 1970 00:00:00 GMT"}, "a")
+        self.cache.fetch("a")
+        self.cache.fetch("a")
+        self.assertEqual(len(self.client.requests), 2)
+
+    def test_eviction(self):
+        for url in ("a", "b", "c"):
+            self.client.responses[url] = (200, {}, url)
+        self.cache.fetch("a")
+        self.cache.fetch("b")
+        self.cache.fetch("a")
+        self.cache.fetch("c")
+        self.assertEqual(list(self.cache.entries), ["a", "c"])
+        self.assertEqual(self.cache.stats()["evictions"], 1)
+
+    def test_coalesce(self):
+        self.client.responses["a"] = (200, {}, "a")
+        self.client.gate = event.Event()
+        fetches = [eventlet.spawn(self.cache.fetch, "a") for _ in range(3)]
+        eventlet.sleep(0)
+        self.client.gate.send()
+        self.assertEqual([f.wait().read() for f in fetches], ["a"] * 3)
+        self.assertEqual(len(self.client.requests), 1)
+        self.assertEqual(self.cache.stats()["coalesced"], 2)
+
+
+class TestSingleFlight(unittest.TestCase):
+    def setUp(self):
+        self.flight = cache.SingleFlight()
+        self.gate = event.Event()
+
+    def _fail(self):
+        self.gate.wait()
+        raise ValueError("failed")
+
+    def test_exception(self):
+        calls = [eventlet.spawn(self.flight.do, "k", self._fail)
+                for _ in range(2)]
+        eventlet.sleep(0)
+        self.gate.send()
+        for call in calls:
+            self.assertRaises(ValueError, call.wait)
+        self.assertEqual(self.flight.calls, {})
+
+    def test_killed(self):
+        leader = eventlet.spawn(self.flight.do, "k", self.gate.wait)
+        follower = eventlet.spawn(self.flight.do, "k", self.gate.wait)
+        eventlet.sleep(0)
+        leader.kill()
+        with eventlet.Timeout(1):
+            self.assertRaises(greenlet.GreenletExit, follower.wait)
+        self.assertEqual(self.flight.calls, {})
+        self.assertEqual(self.flight.do("k", lambda: "a"), "a")
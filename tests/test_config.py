@@ -14,6 +14,8 @@
 
 """Pyhole Config Unit Tests"""
 
+import os
+import tempfile
 import unittest
 
 from pyhole import config
@@ -48,3 +50,42 @@ class TestConfig(unittest.TestCase):
     def test_get_str(self):
         test_str = self.config.get("command_prefix")
         self.assertTrue(isinstance(test_str, str))
+
+
+class TestConfigReload(unittest.TestCase):
+    def setUp(self):
+        handle, self.path = tempfile.mkstemp()
+        os.close(handle)
+        self._write("[Pyhole]\nnick: pyhole\nadmins: a, b\n", 1000)
+        self.config = config.Config(self.path, "Pyhole")
+        self.changes = []
+
+    def tearDown(self):
+        config._config_files.pop(self.path, None)
+        os.unlink(self.path)
+
+    def _write(self, data, mtime):
+        with open(self.path, "w") as conf_file:
+            conf_file.write(data)
+        os.utime(self.path, (mtime, mtime))
+
+    def test_shared(self):
+        other = config.Config(self.path, "Other")
+        self.assertTrue(other.config_file is self.config.config_file)
+
+    def test_list_copy(self):
+        self.config.get("admins", type="list").append("c")
+        self.assertEqual(self.config.get("admins", type="list"), ["a", "b"])
+
+    def test_reload(self):
+        self.config.subscribe(self.changes.append)
+        self._write("[Pyhole]\nnick: hole\nadmins: a, b\n", 2000)
+        self.assertEqual(self.config.get("nick"), "pyhole")
+        self.assertTrue(self.config.refresh(force=True))
+        self.assertEqual(self.config.get("nick"), "hole")
+        self.assertEqual(self.changes, [set(["nick"])])
+
+    def test_unchanged(self):
+        self.config.subscribe(self.changes.append)
+        self.assertFalse(self.config.refresh(force=True))
+        self.assertEqual(self.changes, [])
@@ -0,0 +1,69 @@
+#   Copyright 2011 Josh Kearney
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""Pyhole Executor Unit Tests"""
+
+import eventlet
+import unittest
+
+from eventlet import event
+
+from pyhole import executor
+
+
+class TestExecutor(unittest.TestCase):
+    def setUp(self):
+        self.executor = executor.Executor(pool_size=2, queue_size=1,
+                plugin_limit=1)
+        self.done = event.Event()
+        self.finished = []
+
+    def _work(self, name):
+        self.done.wait()
+        self.finished.append(name)
+
+    def test_submit(self):
+        self.assertTrue(self.executor.submit("A", self._work, "a"))
+        self.assertEqual(self.executor.stats()["active"], 1)
+
+    def test_plugin_limit(self):
+        self.executor.submit("A", self._work, "a1")
+        self.executor.submit("A", self._work, "a2")
+        stats = self.executor.stats()
+        self.assertEqual(stats["active"], 1)
+        self.assertEqual(stats["waiting"], 1)
+
+    def test_dropped(self):
+        self.executor.submit("A", self._work, "a1")
+        self.executor.submit("A", self._work, "a2")
+        self.assertFalse(self.executor.submit("A", self._work, "a3"))
+        self.assertEqual(self.executor.stats()["dropped"], 1)
+
+    def test_drain(self):
+        self.executor.submit("A", self._work, "a1")
+        self.executor.submit("A", self._work, "a2")
+        self.executor.submit("B", self._work, "b1")
+        eventlet.sleep(0)
+        self.done.send()
+        for _ in range(3):
+            eventlet.sleep(0)
+        self.assertEqual(sorted(self.finished), ["a1", "a2", "b1"])
+        self.assertEqual(self.executor.stats()["completed"], 3)
+
+    def test_bypass(self):
+        self.executor.submit("A", self._work, "a1")
+        self.executor.submit("B", self._work, "b1")
+        self.executor.bypass(self.finished.append, "admin")
+        eventlet.sleep(0)
+        self.assertEqual(self.finished, ["admin"])
@@ -0,0 +1,116 @@
+#   Copyright 2011 Josh Kearney
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""Pyhole Flood Control Unit Tests"""
+
+import unittest
+
+from pyhole import floodcontrol
+from pyhole import utils
+
+
+class FakeTimer(object):
+    def __init__(self, delay, function):
+        self.delay = delay
+        self.function = function
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+
+class FakeConnection(object):
+    def __init__(self):
+        self.sent = []
+        self.timers = []
+        self.connected = True
+
+    def write_raw(self, line):
+        self.sent.append(line)
+
+    def execute_delayed(self, delay, function):
+        timer = FakeTimer(delay, function)
+        self.timers.append(timer)
+        return timer
+
+    def is_connected(self):
+        return self.connected
+
+
+class FakeContext(object):
+    def __init__(self, priority):
+        self.priority = priority
+
+
+class TestSendScheduler(unittest.TestCase):
+    def setUp(self):
+        self.connection = FakeConnection()
+        self.scheduler = floodcontrol.SendScheduler(self.connection,
+                rate=1.0, burst=2)
+
+    def _refill(self):
+        self.scheduler.bucket.tokens = self.scheduler.bucket.burst
+        self.connection.timers.pop().function()
+
+    def test_burst(self):
+        for i in range(3):
+            self.scheduler.send("PRIVMSG #a :%d" % i)
+        self.assertEqual(self.connection.sent, ["PRIVMSG #a :0",
+                "PRIVMSG #a :1"])
+        self.assertEqual(len(self.connection.timers), 1)
+        self.assertEqual(self.scheduler.stats()["queued_reply"], 1)
+
+    def test_protocol(self):
+        self.scheduler.bucket.tokens = 0
+        self.scheduler.send("PONG :server")
+        self.assertEqual(self.connection.sent, ["PONG :server"])
+        self.assertTrue(self.scheduler.bucket.tokens < 0)
+
+    def test_priority(self):
+        self.scheduler.bucket.tokens = 0
+        previous = utils.set_context(FakeContext(floodcontrol.AUTO))
+        try:
+            self.scheduler.send("PRIVMSG #a :auto")
+        finally:
+            utils.set_context(previous)
+        self.scheduler.send("PRIVMSG #a :reply")
+        self.scheduler.send("PRIVMSG #a :admin", floodcontrol.ADMIN)
+        self._refill()
+        self.assertEqual(self.connection.sent, ["PRIVMSG #a :admin",
+                "PRIVMSG #a :reply"])
+
+    def test_round_robin(self):
+        self.scheduler.bucket.tokens = 0
+        for line in ("PRIVMSG #a :1", "PRIVMSG #a :2", "PRIVMSG #b :1"):
+            self.scheduler.send(line)
+        self._refill()
+        self.assertEqual(self.connection.sent, ["PRIVMSG #a :1",
+                "PRIVMSG #b :1"])
+
+    def test_backoff(self):
+        self.scheduler.backoff()
+        self.assertEqual(self.scheduler.bucket.rate, 0.5)
+        self.assertEqual(self.scheduler.bucket.burst, 1)
+        self.scheduler.backed_off -= self.scheduler.recovery
+        self.scheduler.send("PONG :server")
+        self.assertEqual(self.scheduler.bucket.rate, 1.0)
+        self.assertEqual(self.scheduler.backed_off, None)
+
+    def test_disconnected(self):
+        self.scheduler.bucket.tokens = 0
+        self.scheduler.send("PRIVMSG #a :lost")
+        self.connection.connected = False
+        self.connection.timers.pop().function()
+        self.assertEqual(self.connection.sent, [])
+        self.assertEqual(self.scheduler.stats()["dropped"], 1)
@@ -0,0 +1,84 @@
+#   Copyright 2011 Josh Kearney
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+
+"""Pyhole Hostmask Unit Tests"""
+
+import unittest
+
+from pyhole import hostmask
+
+
+class TestHostmask(unittest.TestCase):
+    def test_lower(self):
+        self.assertEqual(hostmask.lower("Nick[A]^"), "nick{a}~")
+        self.assertEqual(hostmask.lower("Nick[A]^", "ascii"), "nick[a]^")
+        self.assertEqual(hostmask.lower("Nick[A]^", "strict-rfc1459"),
+                "nick{a}^")
+        self.assertEqual(hostmask.lower("[A]", "unknown"), "{a}")
+
+    def test_normalize(self):
+        self.assertEqual(hostmask.normalize("nick"), "nick!*@*")
+        self.assertEqual(hostmask.normalize("nick!ident"), "nick!ident@*")
+        self.assertEqual(hostmask.normalize("ident@host"), "*!ident@host")
+        self.assertEqual(hostmask.normalize("a!b@c"), "a!b@c")
+
+    def test_matches(self):
+        self.assertTrue(hostmask.matches("*!*@*.example.com",
+                "jk0!~jk0@irc.Example.com"))
+        self.assertTrue(hostmask.matches("jk?!*@*", "JK0!x@y"))
+        self.assertFalse(hostmask.matches("jk?!*@*", "jk00!x@y"))
+        self.assertFalse(hostmask.matches("a.b!*@*", "axb!x@y"))
+
+    def test_compile_cache(self):
+        regex = hostmask.compile_mask("*!*@cached")
+        self.assertTrue(hostmask.compile_mask("*!*@cached") is regex)
+
+
+class TestMaskSet(unittest.TestCase):
+    def setUp(self):
+        self.masks = hostmask.MaskSet(["nick!ident", "*!*@*.spam.example",
+                "bot??!*@*", "", "nick!ident@*"])
+
+    def test_dedupe(self):
+        self.assertEqual(len(self.masks), 3)
+
+    def test_match(self):
+        self.assertTrue(self.masks.match("nick!ident@host"))
+        self.assertTrue(self.masks.match("NICK!ident@host"))
+        self.assertTrue(self.masks.match("x!y@a.spam.example"))
+        self.assertTrue(self.masks.match("bot42!y@host"))
+        self.assertFalse(self.masks.match("nick!other@host"))
+        self.assertFalse(self.masks.match("x!y@spam.example.com"))
+
+    def test_literal(self):
+        masks = hostmask.MaskSet(["a!b@c"])
+        self.assertTrue(masks.match("A!b@c"))
+        self.assertTrue(masks._wildcards is None)
+
+    def test_casemapping(self):
+        masks = hostmask.MaskSet(["nick[a]!*@*"])
+        self.assertTrue(masks.match("nick{a}!x@y"))
+        masks.set_casemapping("ascii")
+        self.assertFalse(masks.match("nick{a}!x@y"))
+
+    def test_discard(self):
+        self.masks.discard("nick!ident")
+        self.assertFalse(self.masks.match("nick!ident@host"))
+
+    def test_many(self):
+        masks = hostmask.MaskSet("*!*@host%d.example" % i
+                for i in range(500))
+        self.assertTrue(masks.match("a!b@host499.example"))
+        self.assertFalse(masks.match("a!b@host500.example"))
@@ -0,0 +1,116 @@
+#   Copyright 2011 Josh Kearney
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""Pyhole HTTP Client Unit Tests"""
+
+import BaseHTTPServer
+import gzip
+import StringIO
+import threading
+import unittest
+
+from pyhole import httpclient
+
+
+class Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        self.server.clients.add(self.client_address)
+        self.server.requests.append(self.headers)
+
+        headers = {}
+        if self.path == "/redirect":
+            status, body = 302, ""
+            headers["Location"] = "/plain"
+        elif self.path == "/gzip":
+            status, body = 200, self._gzip("compressed")
+            headers["Content-Encoding"] = "gzip"
+        elif self.path == "/big":
+            status, body = 200, "x" * 100
+        else:
+            status, body = 200, "hello"
+
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _gzip(self, data):
+        buf = StringIO.StringIO()
+        gzip_file = gzip.GzipFile(fileobj=buf, mode="wb")
+        gzip_file.write(data)
+        gzip_file.close()
+        return buf.getvalue()
+
+    def log_message(self, *args):
+        pass
+
+
+class TestHTTPClient(unittest.TestCase):
+    def setUp(self):
+        self.server = BaseHTTPServer.HTTPServer(("127.0.0.1", 0), Handler)
+        self.server.clients = set()
+        self.server.requests = []
+        self.thread = threading.Thread(target=self.server.serve_forever,
+                kwargs={"poll_interval": 0.01})
+        self.thread.start()
+
+        self.url = "http://127.0.0.1:%d" % self.server.server_address[1]
+        self.client = httpclient.HTTPClient("pyhole test", max_size=50)
+
+    def tearDown(self):
+        self.client.close()
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+
+    def test_fetch(self):
+        response = self.client.fetch(self.url + "/plain")
+        self.assertEqual(response.status, 200)
+        self.assertEqual(response.read(), "hello")
+        self.assertEqual(response.read(), "hello")
+        self.assertEqual(response.headers.get("content-length"), "5")
+
+    def test_keep_alive(self):
+        self.client.fetch(self.url + "/plain")
+        self.client.fetch(self.url + "/plain")
+        self.assertEqual(len(self.server.requests), 2)
+        self.assertEqual(len(self.server.clients), 1)
+
+    def test_headers(self):
+        self.client.fetch(self.url.replace("//", "//user:pass@") + "/plain")
+        headers = self.server.requests[0]
+        self.assertEqual(headers["User-Agent"], "pyhole test")
+        self.assertEqual(headers["Authorization"], "Basic dXNlcjpwYXNz")
+
+    def test_gzip(self):
+        response = self.client.fetch(self.url + "/gzip")
+        self.assertEqual(response.read(), "compressed")
+
+    def test_redirect(self):
+        response = self.client.fetch(self.url + "/redirect")
+        self.assertEqual(response.url, self.url + "/plain")
+        self.assertEqual(response.read(), "hello")
+
+    def test_max_size(self):
+        response = self.client.fetch(self.url + "/big")
+        self.assertTrue(response.truncated)
+        self.assertEqual(len(response.read()), 50)
+
+    def test_unsupported_url(self):
+        self.assertRaises(httpclient.HTTPError, self.client.fetch,
+                "ftp://127.0.0.1/")
@@ -14,9 +14,38 @@
 
 """Pyhole IRC Unit Tests"""
 
+import os
+import shutil
+import tempfile
 import unittest
 
 from pyhole import irc
+from pyhole import utils
+
+
+class FakeLog(object):
+    def info(self, msg, *args):
+        pass
+
+
+class FakeConnection(object):
+    def __init__(self):
+        self.sent = []
+
+    def privmsg(self, target, text):
+        self.sent.append((target, text))
+
+
+class FakeIRC(object):
+    network = "TEST"
+    nick = "pyhole"
+    log = FakeLog()
+
+    def __init__(self):
+        self.connection = FakeConnection()
+
+    def _mangle_msg(self, msg):
+        return [msg]
 
 
 class TestIrc(unittest.TestCase):
@@ -27,3 +56,162 @@ class TestIrc(unittest.TestCase):
     def test_active_keywords(self):
         active_keywords = irc.active_keywords()
         self.assertTrue(isinstance(active_keywords, str))
+
+    def test_parse_server(self):
+        self.assertEqual(irc.parse_server("irc.example.net", 6667),
+                ("irc.example.net", 6667))
+        self.assertEqual(irc.parse_server("irc.example.net:7000", 6667),
+                ("irc.example.net", 7000))
+        self.assertEqual(irc.parse_server("[2001:db8::1]:7000", 6667),
+                ("2001:db8::1", 7000))
+        self.assertEqual(irc.parse_server("2001:db8::1", 6667),
+                ("2001:db8::1", 6667))
+
+
+class TestContext(unittest.TestCase):
+    def setUp(self):
+        self.irc = FakeIRC()
+        self.context = irc.Context(self.irc, "nick!ident", "#chan")
+
+    def test_network(self):
+        self.assertEqual(self.context.network, "TEST")
+
+    def test_immutable(self):
+        self.assertRaises(AttributeError, setattr, self.context, "target",
+                "#other")
+
+    def test_reply(self):
+        self.context.reply("foo")
+        self.assertEqual(self.irc.connection.sent, [("#chan", "foo")])
+
+    def test_reply_addressed(self):
+        self.context._replace(addressed=True).reply("foo")
+        self.assertEqual(self.irc.connection.sent, [("#chan", "nick: foo")])
+
+
+class TestNetworks(unittest.TestCase):
+    def setUp(self):
+        self.networks = irc.Networks(["A", "B"])
+        self.a = FakeIRC()
+        self.b = FakeIRC()
+        self.networks.last = self.a
+
+    def test_route_to_context(self):
+        previous = utils.set_context(irc.Context(self.b, "nick!ident",
+                "#chan"))
+        try:
+            self.networks.connection.privmsg("#chan", "foo")
+        finally:
+            utils.set_context(previous)
+        self.assertEqual(self.a.connection.sent, [])
+        self.assertEqual(self.b.connection.sent, [("#chan", "foo")])
+
+    def test_route_outside_hook(self):
+        self.assertTrue(self.networks.connection is self.a.connection)
+        self.networks.last = self.b
+        self.assertTrue(self.networks.connection is self.b.connection)
+
+
+CONF = ("[Pyhole]\nadmins: nick!ident\ncommand_prefix: .\ndebug: False\n"
+        "reconnect_delay: 60\nrejoin_delay: 5\n\n"
+        "[A]\nserver: irc.example.net:abc\nnick: pyhole\n"
+        "channels: #pyhole\n\n"
+        "[B]\nserver: irc.example.net\nnick: pyhole\nchannels: #pyhole\n")
+
+
+class ConfigTestCase(unittest.TestCase):
+    """Runs each test against its own configuration file"""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, "pyhole.conf")
+        self.edits = 0
+        self.write_config(CONF)
+
+        self.options, utils._options = utils._options, {"config": self.path}
+        self.config, irc.CONFIG = irc.CONFIG, utils.get_config()
+        self.networks = irc.Networks(["A", "B"])
+        self.ircobj = self.networks.ircobj
+
+    def tearDown(self):
+        utils._options = self.options
+        irc.CONFIG = self.config
+        shutil.rmtree(self.directory)
+
+    def write_config(self, text):
+        with open(self.path, "w") as conf:
+            conf.write(text)
+        # Give every edit its own mtime, however quickly they come
+        self.edits += 1
+        os.utime(self.path, (self.edits, self.edits))
+
+
+class TestNetworksAdd(ConfigTestCase):
+    def setUp(self):
+        super(TestNetworksAdd, self).setUp()
+        self.handlers = self._count_handlers()
+
+    def _count_handlers(self):
+        return sum(len(handlers) for handlers in self.ircobj.handlers.values())
+
+    def _assert_nothing_left(self):
+        self.assertEqual(self._count_handlers(), self.handlers)
+        self.assertEqual(self.ircobj.connections, [])
+        self.assertEqual(irc.CONFIG.config_file.subscribers, [])
+        self.assertEqual(self.networks.networks, {})
+
+    def test_bad_config(self):
+        self.networks.add("A")
+        self._assert_nothing_left()
+        # Not worth retrying
+        self.assertEqual(len(self.ircobj.scheduler), 0)
+
+    def test_failure_cleanup(self):
+        def fail(irc_self):
+            raise RuntimeError("failed")
+
+        connect = irc.IRC._connect
+        irc.IRC._connect = fail
+        try:
+            self.networks.add("B")
+            self.networks.add("B")
+        finally:
+            irc.IRC._connect = connect
+        self._assert_nothing_left()
+        self.assertEqual(len(self.ircobj.scheduler), 2)
+
+
+class TestReloadConfig(ConfigTestCase):
+    def setUp(self):
+        super(TestReloadConfig, self).setUp()
+        self.connect, irc.IRC._connect = irc.IRC._connect, lambda self: None
+        self.irc = irc.IRC("B", self.networks)
+
+    def tearDown(self):
+        self.irc.close()
+        irc.IRC._connect = self.connect
+        super(TestReloadConfig, self).tearDown()
+
+    def _reload(self, old, new):
+        self.assertTrue(old in CONF)
+        self.write_config(CONF.replace(old, new))
+        self.assertTrue(irc.CONFIG.refresh(force=True))
+
+    def test_reload(self):
+        self._reload("command_prefix: .", "command_prefix: !")
+        self.assertEqual(self.irc.command_prefix, "!")
+
+    def test_reload_missing(self):
+        self._reload("command_prefix: .\n", "")
+        self.assertEqual(self.irc.command_prefix, ".")
+
+    def test_reload_malformed(self):
+        self._reload("command_prefix: .\ndebug: False\nreconnect_delay: 60",
+                "command_prefix: !\ndebug: False\nreconnect_delay: soon")
+        self.assertEqual(self.irc.command_prefix, ".")
+        self.assertEqual(self.irc.reconnect_delay, 60)
+
+    def test_bare_nick_admin(self):
+        self._reload("admins: nick!ident", "admins: nick!ident, jk0")
+        self.assertTrue(self.irc.admins.match("nick!ident@host"))
+        self.assertFalse(self.irc.admins.match("jk0!ident@host"))
@@ -0,0 +1,612 @@
+#   Copyright 2011 Josh Kearney
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""Pyhole IRClib Unit Tests"""
+
+import errno
+import select
+import socket
+import ssl
+import time
+import unittest
+
+import eventlet
+
+from pyhole import irclib
+
+
+class FakeConnection(object):
+    def __init__(self, sock):
+        self.sock = sock
+        self.received = []
+
+    def process_data(self):
+        self.received.append(self.sock.recv(1024))
+
+    def _get_socket(self):
+        return self.sock
+
+    def _check_last_event(self):
+        pass
+
+
+class TestReactor(unittest.TestCase):
+    def setUp(self):
+        self.pairs = [socket.socketpair() for _ in range(3)]
+
+    def tearDown(self):
+        for pair in self.pairs:
+            for sock in pair:
+                sock.close()
+
+    def _backends(self):
+        backends = ["select"]
+        for backend in ("epoll", "poll"):
+            if hasattr(select, backend):
+                backends.append(backend)
+        return backends
+
+    def test_poll(self):
+        for backend in self._backends():
+            reactor = irclib.Reactor(backend)
+            connections = [FakeConnection(ours) for ours, _theirs in
+                    self.pairs]
+            for connection in connections:
+                reactor.register(connection.sock, connection)
+
+            self.pairs[1][1].send("x")
+            ready = reactor.poll(1)
+            self.assertEqual([(reactor.get_connection(fd), events)
+                    for fd, events in ready],
+                    [(connections[1], irclib.Reactor.READ)])
+            connections[1].process_data()
+
+    def test_writable(self):
+        for backend in self._backends():
+            reactor = irclib.Reactor(backend)
+            ours, _theirs = self.pairs[0]
+            reactor.register(ours, FakeConnection(ours))
+            reactor.set_writable(ours, True)
+            self.assertEqual(reactor.poll(1),
+                    [(ours.fileno(), irclib.Reactor.WRITE)])
+            reactor.set_writable(ours, False)
+            self.assertEqual(reactor.poll(0), [])
+
+    def test_unregister(self):
+        for backend in self._backends():
+            reactor = irclib.Reactor(backend)
+            ours, theirs = self.pairs[0]
+            reactor.register(ours, FakeConnection(ours))
+            reactor.unregister(ours)
+            theirs.send("x")
+            self.assertEqual(reactor.poll(0), [])
+            self.assertEqual(len(reactor), 0)
+            ours.recv(1)
+
+
+class TestIRC(unittest.TestCase):
+    def setUp(self):
+        self.irc = irclib.IRC()
+        self.ours, self.theirs = socket.socketpair()
+        self.connection = FakeConnection(self.ours)
+        self.irc.connections.append(self.connection)
+        self.irc._add_socket(self.ours, self.connection)
+
+    def tearDown(self):
+        self.ours.close()
+        self.theirs.close()
+
+    def test_process_once(self):
+        self.theirs.send("PING :x\r\n")
+        self.irc.process_once(1)
+        self.assertEqual(self.connection.received, ["PING :x\r\n"])
+
+    def test_remove_connection(self):
+        self.irc._remove_connection(self.connection)
+        self.assertEqual(self.irc.reactor.get_connection(self.ours), None)
+        self.assertEqual(self.irc.connections, [])
+
+    def test_timer_deadline(self):
+        fired = []
+        self.irc.execute_delayed(0.01, fired.append, ("timer",))
+        self.irc.process_once(None)
+        if not fired:
+            # Woken up slightly early
+            self.irc.process_once(None)
+        self.assertEqual(fired, ["timer"])
+
+    def test_wake(self):
+        self.irc.waker.wake()
+        self.irc.process_once(None)
+        self.assertFalse(self.irc.waker.pending)
+
+
+class FakeSSL(object):
+    def __init__(self, handshake=(), chunks=()):
+        self.handshake = list(handshake)
+        self.chunks = list(chunks)
+        self.written = []
+
+    def do_handshake(self):
+        if self.handshake:
+            raise ssl.SSLError(self.handshake.pop(0), "want")
+
+    def pending(self):
+        return sum(len(str(chunk)) for chunk in self.chunks)
+
+    def recv_into(self, view, nbytes):
+        if not self.chunks:
+            raise ssl.SSLError(ssl.SSL_ERROR_WANT_READ, "want read")
+        data = self.chunks.pop(0)
+        if isinstance(data, Exception):
+            raise data
+        view[:len(data)] = data
+        return len(data)
+
+    def write(self, data):
+        self.written.append(str(data))
+        return len(data)
+
+
+class BlockedSocket(object):
+    """A socket whose send buffer is full until unblocked"""
+
+    def __init__(self, sock):
+        self.sock = sock
+        self.blocked = True
+        self.closed = False
+
+    def fileno(self):
+        return self.sock.fileno()
+
+    def send(self, data):
+        if self.blocked:
+            raise socket.error(errno.EAGAIN, "Try again")
+        return self.sock.send(data)
+
+    def recv(self, size):
+        return self.sock.recv(size)
+
+    def close(self):
+        self.closed = True
+        self.sock.close()
+
+
+class TestServerConnection(unittest.TestCase):
+    def setUp(self):
+        self.irc = irclib.IRC()
+        self.connection = self.irc.server()
+        self.ours, self.theirs = socket.socketpair()
+        self.ours.setblocking(0)
+        self.connection.socket = self.ours
+        self.connection.connected = 1
+        self.connection.real_server_name = ""
+        self.connection.real_nickname = "pyhole"
+        self.connection.handlers = {}
+        self.irc._add_socket(self.ours, self.connection)
+
+    def tearDown(self):
+        self.ours.close()
+        self.theirs.close()
+
+    def test_send_raw(self):
+        self.connection.send_raw("NICK pyhole")
+        self.assertEqual(self.connection.send_queue_size(), 0)
+        self.assertEqual(self.theirs.recv(1024), "NICK pyhole\r\n")
+
+    def test_send_buffered(self):
+        line = "PRIVMSG #chan :" + "x" * 400
+        while not self.connection.send_queue_size():
+            self.connection.send_raw(line)
+        self.assertTrue(self.ours.fileno() in self.irc.reactor.writers)
+
+        received = []
+        self.theirs.settimeout(1)
+        while self.connection.send_queue_size():
+            received.append(self.theirs.recv(2 ** 16))
+            self.irc.process_once(0)
+        self.assertFalse(self.irc.reactor.writers)
+
+        self.theirs.setblocking(0)
+        try:
+            while True:
+                received.append(self.theirs.recv(2 ** 16))
+        except socket.error:
+            pass
+        lines = "".join(received).split("\r\n")
+        self.assertEqual(lines.pop(), "")
+        self.assertEqual(set(lines), set([line]))
+
+    def _block(self):
+        sock = BlockedSocket(self.ours)
+        self.connection.socket = sock
+        self.connection.server = "server"
+        self.irc._add_socket(sock, self.connection)
+        return sock
+
+    def test_send_while_waiting(self):
+        sock = self._block()
+
+        def send():
+            self.connection.write_raw("PRIVMSG #chan :hi")
+            sock.blocked = False
+
+        eventlet.spawn_after(0.01, send)
+        start = time.time()
+        self.irc.process_once(2)
+        self.assertTrue(time.time() - start < 1)
+        self.irc.process_once(1)
+        self.assertEqual(self.connection.send_queue_size(), 0)
+        self.assertEqual(self.theirs.recv(1024), "PRIVMSG #chan :hi\r\n")
+
+    def test_disconnect_backlog(self):
+        sock = self._block()
+        self.connection.write_raw("PRIVMSG #chan :bye")
+        self.connection.disconnect("Leaving")
+        self.assertFalse(sock.closed)
+        self.assertEqual(self.connection.send_queue_size(), 0)
+
+        sock.blocked = False
+        self.irc.process_once(1)
+        self.assertTrue(sock.closed)
+        self.assertEqual(self.theirs.recv(1024),
+                "PRIVMSG #chan :bye\r\nQUIT :Leaving\r\n")
+
+    def test_disconnect_backlog_timeout(self):
+        sock = self._block()
+        self.connection.close_timeout = 0
+        self.connection.write_raw("PRIVMSG #chan :bye")
+        self.connection.disconnect("Leaving")
+        self.irc.process_once(0)
+        self.assertTrue(sock.closed)
+        self.assertEqual(self.irc.reactor.get_connection(sock), None)
+
+    def test_process_data(self):
+        events = []
+        self.irc.add_global_handler("welcome",
+                lambda c, e: events.append(e.arguments()))
+        self.theirs.send(":server 001 pyhole :Welcome\r\n:server 0")
+        self.connection.process_data()
+        self.assertEqual(events, [["Welcome"]])
+
+    def test_ssl_handshake(self):
+        fd = self.ours.fileno()
+        self.connection.ssl = FakeSSL([ssl.SSL_ERROR_WANT_WRITE,
+                ssl.SSL_ERROR_WANT_READ])
+        self.connection._handshaking = True
+        self.connection.write_raw("NICK pyhole")
+        self.assertTrue(fd in self.irc.reactor.writers)
+        self.connection.flush()
+        self.assertFalse(fd in self.irc.reactor.writers)
+        self.assertEqual(self.connection.send_queue_size(), 13)
+
+        self.connection.process_data()
+        self.assertFalse(self.connection._handshaking)
+        self.assertEqual(self.connection.ssl.written, ["NICK pyhole\r\n"])
+
+    def test_ssl_pending(self):
+        events = []
+        self.irc.add_global_handler("welcome",
+                lambda c, e: events.append(e.arguments()))
+        self.connection.ssl = FakeSSL(chunks=[":server 001 pyhole :a\r\n",
+                ":server 001 pyhole :b\r\n"])
+        self.connection.process_data()
+        self.assertEqual(events, [["a"], ["b"]])
+
+    def test_ssl_pending_error(self):
+        events = []
+        self.irc.add_global_handler("welcome",
+                lambda c, e: events.append(e.arguments()))
+        self.connection.server = "server"
+        self.connection.ssl = FakeSSL(chunks=[":server 001 pyhole :a\r\n",
+                ssl.SSLError(ssl.SSL_ERROR_WANT_READ, "want read")])
+        self.connection.process_data()
+        self.assertEqual(events, [["a"]])
+        self.assertTrue(self.connection.is_connected())
+
+        self.connection.ssl.chunks = [":server 001 pyhole :b\r\n",
+                ssl.SSLError(ssl.SSL_ERROR_SSL, "bad record mac")]
+        self.connection.process_data()
+        self.assertEqual(events, [["a"]])
+        self.assertFalse(self.connection.is_connected())
+
+    def test_unhandled_events(self):
+        built = []
+        event_class = irclib.Event
+
+        def build(*args):
+            built.append(args[0])
+            return event_class(*args)
+
+        irclib.Event = build
+        try:
+            self.irc.add_global_handler("join", lambda c, e: None)
+            self.theirs.send(":server 001 pyhole :Welcome\r\n"
+                    ":jk0!jk0@host JOIN #pyhole\r\n")
+            self.connection.process_data()
+        finally:
+            irclib.Event = event_class
+        self.assertEqual(built, ["join"])
+        self.assertEqual(self.connection.real_nickname, "pyhole")
+
+
+class TestConnect(unittest.TestCase):
+    def setUp(self):
+        self.irc = irclib.IRC()
+        self.connection = self.irc.server()
+        self.server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.server.bind(("127.0.0.1", 0))
+        self.port = self.server.getsockname()[1]
+        self.disconnects = []
+        self.irc.add_global_handler("disconnect",
+                lambda c, e: self.disconnects.append(e.arguments()[0]))
+
+    def tearDown(self):
+        self.connection.disconnect()
+        self.server.close()
+
+    def _process_until(self, done):
+        deadline = time.time() + 5
+        while not done() and time.time() < deadline:
+            self.irc.process_once(0.1)
+
+    def test_connect(self):
+        self.server.listen(1)
+        self.connection.connect("127.0.0.1", self.port, "pyhole")
+        self.assertTrue(self.connection.is_connected())
+        self._process_until(lambda: not self.connection._connecting)
+        self.assertFalse(self.connection.send_queue_size())
+
+        peer = self.server.accept()[0]
+        peer.settimeout(1)
+        self.assertEqual(peer.recv(1024),
+                "NICK pyhole\r\nUSER pyhole 0 * :pyhole\r\n")
+        peer.close()
+
+    def test_connect_refused(self):
+        self.connection.connect("127.0.0.1", self.port, "pyhole")
+        self._process_until(lambda: self.disconnects)
+        self.assertFalse(self.connection.is_connected())
+        self.assertTrue(self.disconnects[0].startswith("Couldn't connect"))
+
+    def test_connect_resolve(self):
+        self.server.listen(1)
+        self.connection.connect("localhost", self.port, "pyhole", ipv6=True)
+        self._process_until(lambda: not self.connection._connecting)
+        self.assertEqual(self.connection.peer_address,
+                ("127.0.0.1", self.port))
+        self.assertTrue(self.connection.connect_latency >= 0)
+
+    def test_connect_failover(self):
+        self.server.listen(1)
+        closed = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        closed.bind(("127.0.0.1", 0))
+        refused = closed.getsockname()
+        closed.close()
+
+        self.connection.connect("127.0.0.1", self.port, "pyhole")
+        self.connection._resolved(self.connection._resolving, [
+                (socket.AF_INET, socket.SOCK_STREAM, 6, "", refused),
+                (socket.AF_INET, socket.SOCK_STREAM, 6, "",
+                        ("127.0.0.1", self.port))])
+        self._process_until(lambda: not self.connection._connecting)
+        self.assertEqual(self.disconnects, [])
+        self.assertEqual(self.connection.peer_address,
+                ("127.0.0.1", self.port))
+
+    def test_interleave(self):
+        v4 = [(socket.AF_INET, 1, 6, "", ("10.0.0.%d" % n, 6667))
+                for n in (1, 2)]
+        v6 = [(socket.AF_INET6, 1, 6, "", ("::%d" % n, 6667, 0, 0))
+                for n in (1, 2, 3)]
+        pairs = irclib._interleave(v6 + v4)
+        self.assertEqual([address[0] for _family, address in pairs],
+                ["::1", "10.0.0.1", "::2", "10.0.0.2", "::3"])
+
+    def test_connect_timeout(self):
+        # The SSL handshake never gets an answer
+        self.server.listen(1)
+        self.connection.connect_timeout = 0.1
+        self.connection.connect("127.0.0.1", self.port, "pyhole", ssl=True)
+        self._process_until(lambda: self.disconnects)
+        self.assertEqual(self.disconnects, ["Connection timed out"])
+
+
+class Client(irclib.SimpleIRCClient):
+    def __init__(self, ircobj=None):
+        irclib.SimpleIRCClient.__init__(self, ircobj)
+        self.joined = []
+
+    def on_join(self, c, e):
+        self.joined.append(e.target())
+
+    def on_welcome(self, c, e):
+        pass
+
+
+class TestDispatch(unittest.TestCase):
+    def setUp(self):
+        self.irc = irclib.IRC()
+        self.calls = []
+
+    def _handler(self, name):
+        return lambda c, e: self.calls.append(name)
+
+    def test_priority(self):
+        self.irc.add_global_handler("join", self._handler("join"), 5)
+        self.irc.add_global_handler("all_events", self._handler("all"), 0)
+        self.irc.add_global_handler("join", self._handler("first"), -1)
+        self.irc._handle_event(None, irclib.Event("join", None, None))
+        self.assertEqual(self.calls, ["first", "all", "join"])
+
+    def test_invalidate(self):
+        handler = self._handler("join")
+        self.assertEqual(self.irc.get_handlers("join"), ())
+        self.irc.add_global_handler("join", handler)
+        self.assertEqual(self.irc.get_handlers("join"), (handler,))
+        self.irc.remove_global_handler("join", handler)
+        self.assertEqual(self.irc.get_handlers("join"), ())
+
+    def test_no_more(self):
+        self.irc.add_global_handler("join", lambda c, e: "NO MORE", -1)
+        self.irc.add_global_handler("join", self._handler("join"))
+        self.irc._handle_event(None, irclib.Event("join", None, None))
+        self.assertEqual(self.calls, [])
+
+    def test_on_methods(self):
+        client = Client()
+        self.assertEqual(client.ircobj.get_handlers("join"),
+                (client.on_join,))
+        self.assertEqual(client.ircobj.get_handlers("part"), ())
+        self.assertTrue(irclib._get_on_methods(Client) is
+                irclib._get_on_methods(Client))
+
+    def test_shared(self):
+        first = Client(self.irc)
+        second = Client(self.irc)
+        self.irc._handle_event(second.connection,
+                irclib.Event("join", "a!b@c", "#pyhole"))
+        self.assertEqual(first.joined, [])
+        self.assertEqual(second.joined, ["#pyhole"])
+
+
+class FakeSocket(object):
+    def __init__(self, chunks):
+        self.chunks = list(chunks)
+
+    def recv_into(self, view, nbytes):
+        data = self.chunks.pop(0)[:nbytes]
+        view[:len(data)] = data
+        return len(data)
+
+
+class TestLineFramer(unittest.TestCase):
+    def setUp(self):
+        self.framer = irclib.LineFramer(max_line=16, recv_size=8)
+
+    def _feed(self, *chunks):
+        sock = FakeSocket(chunks)
+        lines = []
+        while sock.chunks:
+            self.framer.recv_into(sock)
+            lines.extend(self.framer.lines())
+        return lines
+
+    def test_lines(self):
+        self.assertEqual(self._feed("a\r\nb\nc\r", "\n"), ["a", "b", "c"])
+
+    def test_split_across_reads(self):
+        self.assertEqual(self._feed("PING", " :x", "y\r\nP", "ONG\n"),
+                ["PING :xy", "PONG"])
+
+    def test_bare_cr(self):
+        self.assertEqual(self._feed("a\rb\n"), ["a\rb"])
+
+    def test_max_line(self):
+        self.assertEqual(self._feed("a\n", "x" * 8, "x" * 8, "x" * 8,
+                "x\nb\n"), ["a", "b"])
+        self.assertEqual(self.framer.dropped, 1)
+
+    def test_burst(self):
+        chunks = ["abc\n" * 2] * 100
+        self.assertEqual(self._feed(*chunks), ["abc"] * 200)
+        self.assertEqual(len(self.framer.buffer), 24)
+
+
+class TestScheduler(unittest.TestCase):
+    def setUp(self):
+        self.scheduler = irclib.Scheduler()
+        self.fired = []
+
+    def test_order(self):
+        for when in (3, 1, 2):
+            self.scheduler.schedule(when, self.fired.append, (when,))
+        self.assertEqual(self.scheduler.next_deadline(), 1)
+        self.scheduler.run(2)
+        self.assertEqual(self.fired, [1, 2])
+        self.assertEqual(len(self.scheduler), 1)
+
+    def test_cancel(self):
+        timer = self.scheduler.schedule(1, self.fired.append, ("a",))
+        self.scheduler.schedule(2, self.fired.append, ("b",))
+        timer.cancel()
+        self.assertEqual(self.scheduler.next_deadline(), 2)
+        self.scheduler.run(2)
+        self.assertEqual(self.fired, ["b"])
+
+    def test_periodic(self):
+        timer = self.scheduler.schedule(1, self.fired.append, ("a",), 1)
+        self.scheduler.run(1)
+        self.scheduler.run(2)
+        self.assertEqual(timer.when, 3)
+        timer.cancel()
+        self.scheduler.run(3)
+        self.assertEqual(self.fired, ["a", "a"])
+
+    def test_compact(self):
+        timers = [self.scheduler.schedule(time.time() + 60, None)
+                for _ in range(100)]
+        for timer in timers:
+            timer.cancel()
+        self.assertTrue(len(self.scheduler.heap) < 100)
+        self.assertEqual(len(self.scheduler), 0)
+
+    def test_compact_while_running(self):
+        timers = [self.scheduler.schedule(100, None) for _ in range(100)]
+
+        def cancel_all():
+            for timer in timers:
+                timer.cancel()
+
+        self.scheduler.schedule(1, cancel_all)
+        self.scheduler.schedule(2, self.fired.append, ("due",))
+        periodic = self.scheduler.schedule(2, self.fired.append, ("every",),
+                1)
+        self.scheduler.run(3)
+        self.scheduler.run(4)
+        self.assertEqual(self.fired, ["due", "every", "every"])
+        self.assertEqual(periodic.when, 5)
+        self.assertEqual(len(self.scheduler), 1)
+
+
+class TestEvent(unittest.TestCase):
+    def setUp(self):
+        self.event = irclib.Event("pubmsg", "jk0!~jk0@example.com",
+                "#pyhole", ["hi"], {"account": "jk0"})
+
+    def test_accessors(self):
+        self.assertEqual(self.event.eventtype(), self.event.type)
+        self.assertEqual(self.event.source(), "jk0!~jk0@example.com")
+        self.assertEqual(self.event.target(), "#pyhole")
+        self.assertEqual(self.event.arguments(), ["hi"])
+        self.assertEqual(self.event.tags, {"account": "jk0"})
+
+    def test_slots(self):
+        self.assertFalse(hasattr(self.event, "__dict__"))
+        self.assertEqual(irclib.Event("ping", None, None).args, [])
+
+    def test_nickmask(self):
+        mask = self.event.nickmask
+        self.assertEqual(mask.nick, irclib.nm_to_n(mask))
+        self.assertEqual(mask.userhost, irclib.nm_to_uh(mask))
+        self.assertEqual(mask.user, irclib.nm_to_u(mask))
+        self.assertEqual(mask.host, irclib.nm_to_h(mask))
+        self.assertEqual(mask.nickuser, "jk0!~jk0")
+        self.assertTrue(mask._split() is mask._split())
+
+    def test_server_name(self):
+        mask = irclib.Event("welcome", "irc.example.net", None).nickmask
+        self.assertEqual(mask.nick, "irc.example.net")
+        self.assertEqual(mask.nickuser, "irc.example.net")
+        self.assertEqual(mask.host, "")
@@ -0,0 +1,117 @@
+#   Copyright 2011 Josh Kearney
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""Pyhole IRC Line Parser Unit Tests"""
+
+import unittest
+
+from pyhole import irclib
+from pyhole import ircparser
+
+
+CORPUS = [
+    ":irc.example.net NOTICE AUTH :*** Looking up your hostname...",
+    ":irc.example.net 001 pyhole :Welcome to the Example IRC Network "
+            "pyhole!pyhole@example.com",
+    ":irc.example.net 005 pyhole CHANTYPES=# EXCEPTS INVEX "
+            "CHANMODES=eIbq,k,flj,CFLMPQScgimnprstz CHANLIMIT=#:120 "
+            "PREFIX=(ov)@+ MAXLIST=bqeI:100 MODES=4 NETWORK=example "
+            "KNOCK STATUSMSG=@+ CALLERID=g :are supported by this server",
+    ":irc.example.net 353 pyhole = #pyhole :pyhole @jk0 +voiced lurker",
+    ":irc.example.net 352 pyhole #pyhole ~jk0 example.com irc.example.net "
+            "jk0 H@ :0 Josh Kearney",
+    ":irc.example.net 366 pyhole #pyhole :End of /NAMES list.",
+    "PING :irc.example.net",
+    "ERROR :Closing Link: example.com (Excess Flood)",
+    ":jk0!~jk0@example.com PRIVMSG #pyhole :.help",
+    ":jk0!~jk0@example.com PRIVMSG pyhole :\x01VERSION\x01",
+    ":jk0!~jk0@example.com PRIVMSG #pyhole :\x01ACTION waves\x01",
+    ":jk0!~jk0@example.com PRIVMSG #pyhole :see :this: and that",
+    ":jk0!~jk0@example.com PRIVMSG #pyhole :",
+    ":jk0!~jk0@example.com JOIN #pyhole",
+    ":jk0!~jk0@example.com JOIN :#pyhole",
+    ":jk0!~jk0@example.com PART #pyhole :Leaving",
+    ":jk0!~jk0@example.com QUIT :Quit: bye",
+    ":jk0!~jk0@example.com NICK :jk1",
+    ":jk0!~jk0@example.com MODE #pyhole +ov pyhole pyhole",
+    ":pyhole MODE pyhole :+i",
+    ":jk0!~jk0@example.com KICK #pyhole lurker :go away",
+    ":jk0!~jk0@example.com TOPIC #pyhole :new topic  with  spaces ",
+    ":jk0!~jk0@example.com   PRIVMSG   #pyhole   :spaced out",
+    ":jk0!~jk0@example.com PRIVMSG\t#pyhole :tab",
+    ":jk0!~jk0@example.com PRIVMSG #pyhole\t:tab",
+    ":irc.example.net 376 pyhole",
+    ":irc.example.net 376 pyhole ",
+    ":irc.example.net 376 pyhole  ",
+    ":irc.example.net 376",
+    ":irc.example.net 376 ",
+    ":irc.example.net 376  ",
+    "AWAY",
+    ": PING x",
+]
+
+
+def legacy_parse(line):
+    """The original regular expression based split from process_data"""
+    prefix = command = arguments = None
+    m = irclib._rfc_1459_command_regexp.match(line)
+    if m.group("prefix"):
+        prefix = m.group("prefix")
+
+    if m.group("command"):
+        command = m.group("command").lower()
+
+    if m.group("argument"):
+        a = m.group("argument").split(" :", 1)
+        arguments = a[0].split()
+        if len(a) == 2:
+            arguments.append(a[1])
+
+    return prefix, command, arguments
+
+
+class TestParse(unittest.TestCase):
+    def test_corpus(self):
+        for line in CORPUS:
+            tags, prefix, command, params = ircparser.parse(line)
+            self.assertEqual(tags, None)
+            self.assertEqual((prefix, command, params), legacy_parse(line),
+                    line)
+
+    def test_tags(self):
+        line = ("@time=2011-10-19T16:40:51.620Z;account=jk0;+draft/x "
+                ":jk0!~jk0@example.com PRIVMSG #pyhole :hi")
+        tags, prefix, command, params = ircparser.parse(line)
+        self.assertEqual(tags, {"time": "2011-10-19T16:40:51.620Z",
+                "account": "jk0", "+draft/x": ""})
+        self.assertEqual(prefix, "jk0!~jk0@example.com")
+        self.assertEqual(command, "privmsg")
+        self.assertEqual(params, ["#pyhole", "hi"])
+
+    def test_tags_without_prefix(self):
+        tags, prefix, command, params = ircparser.parse("@a=b PING :x")
+        self.assertEqual(tags, {"a": "b"})
+        self.assertEqual(prefix, None)
+        self.assertEqual((command, params), ("ping", ["x"]))
+
+    def test_unescape_tag_value(self):
+        self.assertEqual(ircparser.unescape_tag_value(r"a\:b\sc\\d\r\n"),
+                "a;b c\\d\r\n")
+        self.assertEqual(ircparser.unescape_tag_value(r"\b"), "b")
+        self.assertEqual(ircparser.unescape_tag_value("end\\"), "end")
+        self.assertEqual(ircparser.unescape_tag_value(r"\\\\"), "\\\\")
+
+    def test_interned_command(self):
+        command = ircparser.parse(":a PRIVMSG b :c")[2]
+        self.assertTrue(command is intern("privmsg"))
@@ -14,6 +14,7 @@
 
 """Pyhole Log Unit Tests"""
 
+import logging
 import os
 import unittest
 
@@ -28,3 +29,57 @@ class TestLog(unittest.TestCase):
         self.assertEqual("TEST", test_log.name)
         self.assertEqual(test_log.level, 0)
         os.unlink(test_log_dir + "test.log")
+
+    def test_logger_cached(self):
+        test_log = log.get_logger("TEST")
+        self.assertTrue(log.get_logger("TEST") is test_log)
+        self.assertEqual(len(test_log.handlers), 1)
+
+
+class RecordingHandler(logging.Handler):
+    def createLock(self):
+        self.lock = log._threading.RLock()
+
+    def __init__(self):
+        logging.Handler.__init__(self)
+        self.records = []
+        self.synced = 0
+
+    def emit(self, record):
+        self.records.append(record.getMessage())
+
+    def sync(self):
+        self.synced += 1
+
+
+class TestLogWriter(unittest.TestCase):
+    def setUp(self):
+        self.handler = RecordingHandler()
+        self.writer = log.LogWriter(queue_size=2)
+        self.entered = log._threading.Event()
+        self.release = log._threading.Event()
+
+    def _record(self, msg, *args):
+        return logging.LogRecord("TEST", logging.INFO, __file__, 0, msg,
+                args, None)
+
+    def test_write(self):
+        self.writer.put((self.handler,), self._record("a %s", "b"))
+        self.writer.stop()
+        self.assertEqual(self.handler.records, ["a b"])
+        self.assertTrue(self.handler.synced >= 1)
+
+    def test_dropped(self):
+        self.handler.emit = self._block
+        self.writer.put((self.handler,), self._record("written"))
+        self.entered.wait(5)
+        self.writer.put((self.handler,), self._record("queued"))
+        self.writer.put((self.handler,), self._record("queued"))
+        self.writer.put((self.handler,), self._record("dropped"))
+        self.assertEqual(self.writer.stats()["dropped"], 1)
+        self.release.set()
+        self.writer.stop()
+
+    def _block(self, record):
+        self.entered.set()
+        self.release.wait(5)
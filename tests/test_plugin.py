@@ -0,0 +1,98 @@
+#   Copyright 2011 Josh Kearney
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""Pyhole Plugin Unit Tests"""
+
+import unittest
+
+from pyhole import plugin
+
+
+class TestPlugin(unittest.TestCase):
+    def setUp(self):
+        self.plugin_classes = plugin.Plugin._plugin_classes
+        plugin.Plugin._plugin_classes = []
+
+        class Example(plugin.Plugin):
+            @plugin.hook_add_command("Test")
+            def test(self, params=None, **kwargs):
+                pass
+
+            @plugin.hook_add_keyword("t")
+            def keyword_t(self, params=None, **kwargs):
+                pass
+
+            @plugin.hook_add_keyword("tk-")
+            def keyword_tk(self, params=None, **kwargs):
+                pass
+
+            @plugin.hook_add_msg_regex("https?:\/\/example\.com\/bugs")
+            def _watch_for_bug_url(self, params=None, **kwargs):
+                pass
+
+        plugin._reset_variables()
+        plugin._init_plugins(None)
+
+    def tearDown(self):
+        plugin.Plugin._plugin_classes = self.plugin_classes
+        plugin._reset_variables()
+
+    def test_hook_find_command(self):
+        hooks = plugin.hook_find_command("test")
+        self.assertEqual(len(hooks), 1)
+        self.assertEqual(hooks[0][2], "Test")
+
+    def test_hook_find_command_case(self):
+        self.assertEqual(plugin.hook_find_command("TEST"),
+                plugin.hook_find_command("test"))
+
+    def test_hook_find_command_missing(self):
+        self.assertEqual(plugin.hook_find_command("t"), [])
+
+    def test_hook_find_command_reset(self):
+        plugin._reset_variables()
+        self.assertEqual(plugin.hook_find_command("test"), [])
+
+    def test_hook_match_keywords(self):
+        matches = [(hook[2], suffix) for hook, suffix in
+                plugin.hook_match_keywords("see T123 and foo")]
+        self.assertEqual(matches, [("t", "123")])
+
+    def test_hook_match_keywords_overlap(self):
+        matches = [(hook[2], suffix) for hook, suffix in
+                plugin.hook_match_keywords("TK-42")]
+        self.assertEqual(matches, [("t", "K-42"), ("tk-", "42")])
+
+    def test_hook_match_keywords_no_suffix(self):
+        self.assertEqual(list(plugin.hook_match_keywords("t T")), [])
+
+    def test_hook_match_msg_regexs(self):
+        matches = list(plugin.hook_match_msg_regexs(
+                "see HTTPS://Example.com/bugs/1"))
+        self.assertEqual(len(matches), 1)
+        self.assertEqual(matches[0][1].group(0), "HTTPS://Example.com/bugs")
+
+    def test_hook_match_msg_regexs_prefiltered(self):
+        self.assertEqual(list(plugin.hook_match_msg_regexs("no urls")), [])
+
+    def test_required_literals(self):
+        self.assertEqual(plugin._required_literals(
+                "https?:\/\/redmine\..*/issues"), ("://redmine.",))
+
+    def test_required_literals_branch(self):
+        self.assertEqual(plugin._required_literals("https?:\/\/|www\."),
+                ("http", "www."))
+
+    def test_required_literals_none(self):
+        self.assertEqual(plugin._required_literals("a|.*"), None)
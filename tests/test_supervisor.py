@@ -0,0 +1,100 @@
+#   Copyright 2011 Josh Kearney
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+
+"""Pyhole Supervisor Unit Tests"""
+
+import os
+import shutil
+import signal
+import tempfile
+import time
+import unittest
+
+from pyhole import supervisor
+
+
+class Target(object):
+    """Records each start in a file, as children cannot share memory"""
+
+    def __init__(self, directory, statuses, hang=False):
+        self.path = os.path.join(directory, "starts")
+        self.statuses = statuses
+        self.hang = hang
+
+    def starts(self):
+        try:
+            with open(self.path) as starts:
+                return starts.read().split()
+        except IOError:
+            return []
+
+    def __call__(self, name, health_fd):
+        start = len(self.starts())
+        with open(self.path, "a") as starts:
+            starts.write("%s\n" % name)
+
+        if self.hang and start == 0:
+            time.sleep(30)
+        os._exit(self.statuses[min(start, len(self.statuses) - 1)])
+
+
+class TestSupervisor(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def _run(self, target, **kwargs):
+        started = time.time()
+        supervisor.Supervisor(target, ["A"], **kwargs).run()
+        return time.time() - started
+
+    def test_restart(self):
+        target = Target(self.directory, [1, 0])
+        self.assertTrue(self._run(target) < 1)
+        self.assertEqual(target.starts(), ["A", "A"])
+
+    def test_backoff(self):
+        target = Target(self.directory, [1, 1, 0])
+        self._run(target, min_backoff=0.1)
+        self.assertEqual(len(target.starts()), 3)
+
+    def test_backoff_delays(self):
+        sup = supervisor.Supervisor(None, [], min_backoff=1, max_backoff=8)
+        self.assertEqual(sup._backoff(0), 0)
+        for failures, delay in ((1, 1), (2, 2), (4, 8), (10, 8)):
+            backoff = sup._backoff(failures)
+            self.assertTrue(delay / 2.0 <= backoff <= delay)
+
+    def test_health_timeout(self):
+        target = Target(self.directory, [0], hang=True)
+        self.assertTrue(self._run(target, health_timeout=0.2) < 5)
+        self.assertEqual(target.starts(), ["A", "A"])
+
+    def test_stop(self):
+        def target(name, health_fd):
+            os.kill(os.getppid(), signal.SIGTERM)
+            time.sleep(30)
+
+        self.assertTrue(self._run(target) < 5)
+        self.assertEqual(signal.getsignal(signal.SIGTERM), signal.SIG_DFL)
+
+    def test_heartbeat(self):
+        read_fd, write_fd = os.pipe()
+        supervisor.heartbeat(write_fd)
+        self.assertEqual(os.read(read_fd, 1), ".")
+        os.close(read_fd)
+        os.close(write_fd)
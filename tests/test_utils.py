@@ -14,12 +14,39 @@
 
 """Pyhole Utils Unit Tests"""
 
+import eventlet
 import os
 import unittest
 
+from pyhole import executor
 from pyhole import utils
 
 
+class Spawner(object):
+    def __init__(self):
+        self.contexts = []
+
+    @utils.spawn
+    def record(self):
+        self.contexts.append(utils.get_context())
+
+    def _record_now(self):
+        self.contexts.append("now")
+    _record_now._skip_queue = True
+    record_now = utils.spawn(_record_now)
+
+
+class Fetcher(object):
+    def __init__(self):
+        self.calls = []
+
+    @utils.coalesce
+    def fetch(self, key):
+        self.calls.append(key)
+        eventlet.sleep(0)
+        return key.upper()
+
+
 class TestUtils(unittest.TestCase):
     def setUp(self):
         utils.write_file("tests", "pyhole_test_file", "foo")
@@ -80,3 +107,48 @@ class TestUtils(unittest.TestCase):
 
     def test_read_file(self):
         self.assertEquals(utils.read_file("tests", "pyhole_test_file"), "foo")
+
+    def test_set_context(self):
+        previous = utils.set_context("foo")
+        self.assertEqual(utils.get_context(), "foo")
+        self.assertEqual(utils.set_context(previous), "foo")
+
+    def test_spawn_context(self):
+        spawner = Spawner()
+        previous = utils.set_context("foo")
+        spawner.record()
+        utils.set_context("bar")
+        eventlet.sleep(0)
+        utils.set_context(previous)
+        self.assertEqual(spawner.contexts, ["foo"])
+
+    def test_spawn_skip_queue(self):
+        spawner = Spawner()
+        saturated = executor.Executor(pool_size=0, queue_size=0)
+        previous, utils._executor = utils._executor, saturated
+        try:
+            spawner.record()
+            spawner.record_now()
+            eventlet.sleep(0)
+        finally:
+            utils._executor = previous
+        self.assertEqual(spawner.contexts, ["now"])
+        self.assertEqual(saturated.stats()["dropped"], 1)
+
+    def test_coalesce(self):
+        fetcher = Fetcher()
+        fetches = [eventlet.spawn(fetcher.fetch, key)
+                for key in ("a", "a", "b")]
+        self.assertEqual([f.wait() for f in fetches], ["A", "A", "B"])
+        self.assertEqual(fetcher.calls, ["a", "b"])
+
+    def test_get_memory_usage(self):
+        usage = utils.get_memory_usage()
+        if usage is None:
+            return
+        self.assertTrue(usage["rss"] > 0)
+        self.assertTrue(usage["pss"] <= usage["rss"])
+        self.assertEqual(usage["shared"] + usage["private"], usage["rss"])
+
+    def test_get_memory_usage_missing(self):
+        self.assertEqual(utils.get_memory_usage("missing"), None)
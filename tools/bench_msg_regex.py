@@ -0,0 +1,91 @@
+#   Copyright 2011 Josh Kearney
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""Benchmark msg_regex hook matching against the number of hooks"""
+
+import os
+import re
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+from pyhole import plugin
+
+
+PATTERNS = [
+    "https?:\/\/|www\.",
+    "https?:\/\/bugs\.launchpad\.net\/.*\/\+bug",
+    "https?:\/\/bugs\.launchpad\.net\/bugs",
+    "https?:\/\/redmine\..*/issues",
+    "https?:\/\/bugzilla\.kernel\.org\/show\_bug\.cgi\?id\=",
+]
+
+LINES = [
+    "morning all, anyone seen the build break?",
+    "I think it was the last merge, looking now",
+    "see https://bugs.launchpad.net/nova/+bug/123456 for details",
+    "lunch?",
+    "the quick brown fox jumps over the lazy dog " * 4,
+    "heh, that is what she said",
+    "http://bugzilla.kernel.org/show_bug.cgi?id=4242 still open",
+    "can someone review my change please",
+    "no, the other one",
+    "brb",
+]
+
+
+def build_hooks(count):
+    """Register count msg_regex hooks on a throwaway plugin"""
+    plugin.Plugin._plugin_classes = []
+    attrs = {}
+    for i in range(count):
+        def hook(self, params=None, **kwargs):
+            pass
+        hook.__name__ = "hook_%d" % i
+        attrs[hook.__name__] = plugin.hook_add_msg_regex(
+                PATTERNS[i % len(PATTERNS)])(hook)
+
+    plugin.PluginMetaClass("Bench", (plugin.Plugin,), attrs)
+    plugin._reset_variables()
+    plugin._init_plugins(None)
+
+
+def legacy():
+    """The original per-line re.search over every hook"""
+    for line in LINES:
+        for _mod_name, _func, msg_regex in plugin.hook_get_msg_regexs():
+            re.search(msg_regex, line, re.I)
+
+
+def regex_set():
+    """The compiled and prefiltered regex set"""
+    for line in LINES:
+        for _match in plugin.hook_match_msg_regexs(line):
+            pass
+
+
+def main():
+    rounds = 2000
+    print "%6s %16s %16s" % ("hooks", "legacy us/line", "set us/line")
+    for count in (1, 5, 10, 20, 40, 80):
+        build_hooks(count)
+        per_line = 1000000.0 / (rounds * len(LINES))
+        old = min(timeit.repeat(legacy, number=rounds, repeat=3)) * per_line
+        new = min(timeit.repeat(regex_set, number=rounds, repeat=3)) * per_line
+        print "%6d %16.2f %16.2f" % (count, old, new)
+
+
+if __name__ == "__main__":
+    main()
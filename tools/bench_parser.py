@@ -0,0 +1,77 @@
+#   Copyright 2011 Josh Kearney
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""Benchmark IRC line parsing, regular expression versus ircparser"""
+
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+from pyhole import irclib
+from pyhole import ircparser
+
+
+LINES = [
+    ":irc.example.net 001 pyhole :Welcome to the Example IRC Network",
+    ":irc.example.net 005 pyhole CHANTYPES=# EXCEPTS INVEX "
+            "CHANLIMIT=#:120 PREFIX=(ov)@+ :are supported by this server",
+    ":irc.example.net 353 pyhole = #pyhole :pyhole @jk0 +voiced lurker",
+    "PING :irc.example.net",
+    ":jk0!~jk0@example.com PRIVMSG #pyhole :morning all",
+    ":jk0!~jk0@example.com PRIVMSG #pyhole :see http://example.com/x",
+    ":jk0!~jk0@example.com JOIN #pyhole",
+    ":jk0!~jk0@example.com MODE #pyhole +o pyhole",
+    ":jk0!~jk0@example.com PRIVMSG pyhole :\x01VERSION\x01",
+    ":jk0!~jk0@example.com QUIT :Quit: bye",
+]
+
+TAGGED = ["@time=2011-10-19T16:40:51.620Z;account=jk0 " + line
+        for line in LINES]
+
+
+def legacy(lines=LINES):
+    """The original regular expression split from process_data"""
+    for line in lines:
+        m = irclib._rfc_1459_command_regexp.match(line)
+        if m.group("prefix"):
+            m.group("prefix")
+        if m.group("command"):
+            m.group("command").lower()
+        if m.group("argument"):
+            a = m.group("argument").split(" :", 1)
+            arguments = a[0].split()
+            if len(a) == 2:
+                arguments.append(a[1])
+
+
+def parser(lines=LINES):
+    """The hand-written parser"""
+    for line in lines:
+        ircparser.parse(line)
+
+
+def main():
+    rounds = 20000
+    total = rounds * len(LINES)
+    print "%-16s %16s" % ("parser", "lines/second")
+    for name, func in (("regex", legacy), ("ircparser", parser),
+            ("ircparser+tags", lambda: parser(TAGGED))):
+        best = min(timeit.repeat(func, number=rounds, repeat=3))
+        print "%-16s %16d" % (name, total / best)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+#   Copyright 2011 Josh Kearney
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+
+"""Report how much memory the pyhole network processes share
+
+Usage: memory_report.py [pid ...]
+
+Without pids, every process with pyhole on its command line is reported.
+Shared pages are counted in full in each process's rss but only once
+across all of them in pss, so the difference between the two totals is
+what sharing saves over running each network on its own.
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+from pyhole import utils
+
+
+def find_pids():
+    """Find the running pyhole processes"""
+    pids = []
+    for pid in os.listdir("/proc"):
+        if not pid.isdigit() or int(pid) == os.getpid():
+            continue
+        try:
+            with open("/proc/%s/cmdline" % pid) as cmdline:
+                if "pyhole" in cmdline.read():
+                    pids.append(int(pid))
+        except IOError:
+            continue
+
+    return sorted(pids)
+
+
+def main():
+    pids = [int(pid) for pid in sys.argv[1:]] or find_pids()
+    columns = ("rss", "pss", "shared", "private")
+    print "%8s" % "pid" + "".join("%12s" % ("%s kB" % c) for c in columns)
+
+    totals = dict.fromkeys(columns, 0)
+    count = 0
+    for pid in pids:
+        usage = utils.get_memory_usage(pid)
+        if usage is None:
+            continue
+        count += 1
+        for column in columns:
+            totals[column] += usage[column]
+        print "%8d" % pid + "".join("%12d" % usage[c] for c in columns)
+
+    if not count:
+        print "No processes found"
+        return
+
+    print "%8s" % "total" + "".join("%12d" % totals[c] for c in columns)
+    saved = totals["rss"] - totals["pss"]
+    print
+    print "Saved by sharing: %d kB" % saved
+    if count > 1:
+        print "Saved per extra process: %d kB" % (saved / (count - 1))
+
+
+if __name__ == "__main__":
+    main()